@@ -0,0 +1,133 @@
+import asyncio
+import time
+from collections import deque
+
+from metrics import QUEUE_WAIT_BUCKETS_MS, BucketHistogram
+
+
+class Overloaded(Exception):
+    """The request was shed; answer 503 with Retry-After."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Disconnected(Exception):
+    """The client went away while the request was queued."""
+
+
+async def wait_for_disconnect(receive):
+    # the body has been read by then, so the next message is the disconnect
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+class AdmissionController:
+    """Caps concurrent CPU-bound work, with a bounded FIFO wait queue.
+
+    Up to `max_concurrency` requests hold a slot at once; up to `max_queue`
+    more wait for one. A request is shed (Overloaded) right away when the
+    queue is full, or when its deadline passes while it waits, so under
+    overload clients get a fast 503 instead of an ever-growing latency.
+    Queued requests whose client disconnects leave the queue (Disconnected)
+    and never start their work.
+
+    Must be used from one event loop; the slot bookkeeping is not locked.
+    """
+
+    def __init__(self, max_concurrency=2, max_queue=64):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self._active = 0
+        self._waiters = deque()
+
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.cancelled = 0
+        self.queue_wait_ms = BucketHistogram(QUEUE_WAIT_BUCKETS_MS)
+
+    async def acquire(self, deadline=None, receive=None):
+        """Wait for a slot until `deadline` (time.perf_counter() seconds).
+
+        `receive` is the request's ASGI receive callable; when given, a
+        disconnect while queued raises Disconnected.
+        """
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.shed_queue_full += 1
+            raise Overloaded("queue_full")
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        enqueued = time.perf_counter()
+        timeout = None if deadline is None else max(0.0, deadline - enqueued)
+
+        watcher = loop.create_task(wait_for_disconnect(receive)) if receive is not None else None
+        try:
+            await asyncio.wait(
+                [f for f in (waiter, watcher) if f is not None],
+                timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+        except asyncio.CancelledError:
+            self._withdraw(waiter)
+            raise
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+        # a slot handed over at the last moment still counts
+        if waiter.done():
+            self.admitted += 1
+            self.queue_wait_ms.observe((time.perf_counter() - enqueued) * 1000)
+            return
+
+        self._withdraw(waiter)
+        if watcher is not None and watcher.done() and not watcher.cancelled():
+            self.cancelled += 1
+            raise Disconnected()
+        self.shed_timeout += 1
+        raise Overloaded("timeout")
+
+    def _withdraw(self, waiter):
+        if waiter.done() and not waiter.cancelled():
+            # granted while we were being cancelled: pass the slot on
+            self.release()
+            return
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self):
+        # hand the slot straight to the oldest waiter still waiting
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed": {
+                "queue_full": self.shed_queue_full,
+                "timeout": self.shed_timeout,
+            },
+            "cancelled": self.cancelled,
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
@@ -0,0 +1,76 @@
+"""Async versions of the database.py functions.
+
+sqlite3 is blocking, so every call runs on a dedicated executor with one
+thread per pooled connection. At most DB_POOL_SIZE queries are in flight,
+and waiting for the database never ties up the event loop or FastAPI's
+shared threadpool.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import database
+from config import DB_POOL_SIZE
+
+executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+
+_UNCACHED = object()
+
+
+async def run(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+
+
+def shutdown():
+    executor.shutdown(wait=True)
+
+
+async def register_patient(email, password, first_name, last_name):
+    return await run(database.register_patient, email, password, first_name, last_name)
+
+
+async def login_patient(email, password):
+    # cached rows are answered on the event loop; only misses go to a thread
+    if database.login_cache is not None:
+        row = database.login_cache.peek(email, _UNCACHED)
+        if row is not _UNCACHED:
+            return database.login_response(row, password)
+    return await run(database.login_patient, email, password)
+
+
+async def revoke_token(digest: bytes, expires_at: float):
+    return await run(database.revoke_token, digest, expires_at)
+
+
+async def is_token_revoked(digest: bytes):
+    return await run(database.is_token_revoked, digest)
+
+
+async def revoked_tokens_since(after_id: int = 0):
+    return await run(database.revoked_tokens_since, after_id)
+
+
+async def get_patient_info(patient_id: int):
+    if database.profile_cache is not None:
+        row = database.profile_cache.peek(patient_id, _UNCACHED)
+        if row is not _UNCACHED:
+            return database.patient_info_response(row)
+    return await run(database.get_patient_info, patient_id)
+
+
+async def save_health_result(patient_id: int, result_data: dict, model_version: str = None):
+    return await run(database.save_health_result, patient_id, result_data, model_version)
+
+
+async def get_patient_results(patient_id: int, include_archived: bool = False):
+    return await run(database.get_patient_results, patient_id, include_archived)
+
+
+async def get_patient_results_page(patient_id: int, limit: int, cursor: str = None,
+                                   include_archived: bool = False):
+    return await run(database.get_patient_results_page, patient_id, limit, cursor, include_archived)
+
+
+async def get_patient_trends(patient_id: int, bucket: str = "day"):
+    return await run(database.get_patient_trends, patient_id, bucket)
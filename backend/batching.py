@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+import numpy as np
+
+from metrics import BATCH_SIZE_BUCKETS, QUEUE_WAIT_BUCKETS_MS, BucketHistogram
+
+
+class PredictionBatcher:
+    """Coalesces concurrent single-row scoring requests into vectorized calls.
+
+    Rows submitted within `max_wait_ms` of the first queued row (up to
+    `max_batch_size` rows) are scored together with one call of
+    `score_fn(X, context)`, which takes a 2D array and returns one value per
+    row. Rows are only scored together with rows submitted with the same
+    `context` (the model snapshot a request started with), so a batch
+    spanning a model swap is split in one call per model.
+    """
+
+    def __init__(self, score_fn, max_batch_size=64, max_wait_ms=2.0, executor=None):
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+
+        self.batch_sizes = BucketHistogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = BucketHistogram(QUEUE_WAIT_BUCKETS_MS)
+        self.errors = 0
+
+        self._queue = None
+        self._worker = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        while not self._queue.empty():
+            _, _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Prediction batcher stopped"))
+
+    async def submit(self, row, context=None):
+        if self._worker is None:
+            raise RuntimeError("Prediction batcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, context, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # whatever queued up meanwhile rides along without further waiting
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+
+            started = time.perf_counter()
+            for _, _, _, enqueued_at in batch:
+                self.queue_wait_ms.observe((started - enqueued_at) * 1000)
+            self.batch_sizes.observe(len(batch))
+
+            # one call per context; only batches spanning a model swap have two
+            groups = {}
+            for item in batch:
+                groups.setdefault(id(item[1]), []).append(item)
+            for group in groups.values():
+                await self._score(group)
+
+    async def _score(self, batch):
+        loop = asyncio.get_running_loop()
+        X = np.array([row for row, _, _, _ in batch], dtype=np.float64)
+        try:
+            results = await loop.run_in_executor(self.executor, self.score_fn, X, batch[0][1])
+        except asyncio.CancelledError:
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Prediction batcher stopped"))
+            raise
+        except Exception as exc:
+            self.errors += 1
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for (_, _, future, _), result in zip(batch, results):
+            # the caller may have gone away (cancelled) while we were scoring
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "enabled": self._worker is not None,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "errors": self.errors,
+        }
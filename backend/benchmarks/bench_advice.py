@@ -0,0 +1,120 @@
+"""Per-row cost of building history responses: rebuilt advice vs precomputed fragments.
+
+Run from the backend directory:
+    python -m benchmarks.bench_advice
+"""
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from medical import (
+    DISEASE_NORMS, FEATURE_INFO, MEDICAL_UI_ADVICE, analyze_health,
+    build_frontend_report, enrich_result, enriched_results_json
+)
+
+RISKS = ("small", "medium", "high")
+
+
+# the per-request rebuild used before the fragments were precomputed
+def legacy_norms():
+    norms = {}
+    for k, v in FEATURE_INFO.items():
+        norms[k] = f"{v['min']} - {v['max']}"
+    return norms
+
+
+def legacy_advice(name, risk, norms):
+    advice = MEDICAL_UI_ADVICE[name][risk]
+    return {
+        "diabetes" if name == "Diabetes" else name: {
+            "result": advice["title"],
+            "medical_advices": advice["warning"],
+            "how_to_cure": advice["how_to_cure"],
+            "movies": advice["movies"],
+            "norm": {p: norms[p] for p in DISEASE_NORMS.get(name, [])}
+        }
+    }
+
+
+def legacy_enrich(results):
+    norms = legacy_norms()
+    enriched = []
+    for r in results:
+        result_data = r.get("result", {})
+        ui_advice = []
+        risk = result_data.get("diabetes", {}).get("risk_level")
+        if risk:
+            ui_advice.append(legacy_advice("Diabetes", risk, norms))
+        for d, info in result_data.get("diseases_detected", {}).items():
+            if info.get("risk_level"):
+                ui_advice.append(legacy_advice(d, info["risk_level"], norms))
+        enriched.append({
+            **r,
+            "ui_advice": ui_advice,
+            "disclaimer": "Educational information only. Not a medical diagnosis."
+        })
+    return enriched
+
+
+def legacy_response(results):
+    # what FastAPI did with the returned list: jsonable_encoder + json.dumps
+    return json.dumps(
+        jsonable_encoder(legacy_enrich(results)),
+        ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def synthetic_history(n, rng):
+    rows = []
+    for i in range(n):
+        patient = {
+            "Glucose": rng.uniform(70, 220), "Insulin": rng.uniform(0, 300),
+            "BMI": rng.uniform(17, 45), "Age": rng.randint(20, 80),
+            "BloodPressure": rng.uniform(50, 130), "SkinThickness": rng.uniform(5, 50),
+        }
+        rows.append({
+            "result": {
+                "diabetes": {"risk_level": rng.choice(RISKS), "probability": round(rng.uniform(0, 100), 1),
+                             "description": "Type 2 Diabetes Mellitus"},
+                "diseases_detected": analyze_health(patient),
+                "raport": ["All parameters are within the norm."],
+            },
+            "created_at": f"2026-01-{1 + i % 28:02d} 12:00:{i % 60:02d}",
+            "model_version": "v1",
+        })
+    return rows
+
+
+def per_row_us(fn, results, repeat=20):
+    fn(results)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(results)
+    return (time.perf_counter() - start) / repeat / len(results) * 1e6
+
+
+def main():
+    rng = random.Random(0)
+
+    # the precomputed paths must produce exactly what the rebuild produced
+    history = synthetic_history(300, rng)
+    assert [enrich_result(r) for r in history] == legacy_enrich(history)
+    assert json.loads(enriched_results_json(history)) == json.loads(legacy_response(history))
+    diseases = history[0]["result"]["diseases_detected"]
+    assert build_frontend_report(diseases, "high") == [
+        legacy_advice("Diabetes", "high", legacy_norms())
+    ] + [legacy_advice(d, i["risk_level"], legacy_norms()) for d, i in diseases.items()]
+    print("equivalence: OK")
+
+    print(f"{'rows':>6} {'rebuild+encode':>16} {'fragments':>12} {'speedup':>8}   (us per row)")
+    for n in (10, 100, 500, 2000):
+        results = synthetic_history(n, rng)
+        legacy = per_row_us(legacy_response, results)
+        fast = per_row_us(enriched_results_json, results)
+        print(f"{n:>6} {legacy:>16.1f} {fast:>12.1f} {legacy / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
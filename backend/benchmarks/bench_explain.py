@@ -0,0 +1,118 @@
+"""Correctness check and benchmark of the TreeSHAP explainer.
+
+Checks that explanations are additive (expected value + contributions ==
+predicted probability) on the dataset and on perturbed rows, and that
+they equal Shapley values computed by brute force from the definition of
+path-dependent TreeSHAP (every feature subset, expected tree value by
+recursion) on a smaller forest. Then times explanations per patient.
+
+Run from the backend directory:
+    python -m benchmarks.bench_explain
+"""
+import copy
+import math
+import time
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from config import DATASET_PATH
+from explain import ForestExplainer
+from inference import CompiledForest
+from model_store import TARGET_COLUMN, load_or_train
+from benchmarks.timing import timeit
+
+BRUTE_FORCE_TREES = 10
+BRUTE_FORCE_ROWS = 5
+
+
+def expected_tree_value(tree, x, known, node=0):
+    """E[f(x) | x_S] of one sklearn tree, the way path-dependent TreeSHAP defines it."""
+    left, right = tree.children_left[node], tree.children_right[node]
+    if left == -1:
+        # class fractions on sklearn >= 1.4, counts before
+        return tree.value[node, 0, 1] / tree.value[node, 0].sum()
+    feature = tree.feature[node]
+    if known[feature]:
+        child = left if x[feature] <= tree.threshold[node] else right
+        return expected_tree_value(tree, x, known, child)
+    cover = tree.weighted_n_node_samples
+    return (
+        cover[left] * expected_tree_value(tree, x, known, left)
+        + cover[right] * expected_tree_value(tree, x, known, right)
+    ) / cover[node]
+
+
+def brute_force_shap(forest, x):
+    n = forest.n_features_in_
+    x = x.astype(np.float32)
+    subsets = list(product((False, True), repeat=n))
+    values = {
+        known: np.mean([expected_tree_value(e.tree_, x, known) for e in forest.estimators_])
+        for known in subsets
+    }
+    phi = np.zeros(n)
+    for known in subsets:
+        size = sum(known)
+        for i in range(n):
+            if known[i]:
+                continue
+            weight = math.factorial(size) * math.factorial(n - size - 1) / math.factorial(n)
+            with_i = known[:i] + (True,) + known[i + 1:]
+            phi[i] += weight * (values[with_i] - values[known])
+    return values[(False,) * n], phi
+
+
+def check_additivity(explainer, engine, X):
+    base, contributions = explainer.explain(X)
+    error = np.abs(base + contributions.sum(axis=1) - engine.predict_proba(X)[:, 1]).max()
+    if error > 1e-9:
+        raise AssertionError(f"explanations are not additive (max abs error {error})")
+    return error
+
+
+def main():
+    model, metadata = load_or_train()
+    features = metadata["features"]
+
+    engine = CompiledForest.from_sklearn(model)
+    start = time.perf_counter()
+    explainer = ForestExplainer(engine)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"explainer: built in {build_ms:.1f} ms, {explainer.n_leaves} leaves, "
+          f"expected value {explainer.expected_value:.4f}")
+
+    data = pd.read_csv(DATASET_PATH)
+    X = data.drop(TARGET_COLUMN, axis=1)[features].to_numpy(dtype=np.float64)
+    rng = np.random.default_rng(0)
+    perturbed = X[rng.integers(0, len(X), 500)] * rng.uniform(0.8, 1.2, (500, X.shape[1]))
+
+    error = max(check_additivity(explainer, engine, X), check_additivity(explainer, engine, perturbed))
+    print(f"additivity: OK on {len(X)} dataset rows and {len(perturbed)} perturbed rows "
+          f"(max abs error {error:.1e})")
+
+    small = copy.copy(model)
+    small.estimators_ = model.estimators_[:BRUTE_FORCE_TREES]
+    small_explainer = ForestExplainer(CompiledForest.from_sklearn(small))
+    worst = 0.0
+    for x in perturbed[:BRUTE_FORCE_ROWS]:
+        expected_base, expected = brute_force_shap(small, x)
+        base, actual = small_explainer.explain(x)
+        worst = max(worst, abs(base - expected_base), np.abs(actual[0] - expected).max())
+    if worst > 1e-9:
+        raise AssertionError(f"explanations differ from brute-force Shapley values (max abs diff {worst})")
+    print(f"brute force: OK on {BRUTE_FORCE_ROWS} rows, {BRUTE_FORCE_TREES} trees "
+          f"(max abs diff {worst:.1e})")
+
+    single = timeit(lambda: explainer.explain(X[0]), 200)
+    predict = timeit(lambda: engine.predict_proba(X[0]), 200)
+    print(f"single row: explain {single * 1e3:.3f} ms, predict {predict * 1e3:.3f} ms")
+    for n in (64, 1000):
+        batch = perturbed[:n] if n <= len(perturbed) else X[:n]
+        elapsed = timeit(lambda: explainer.explain(batch), 3)
+        print(f"batch {n:>5}: {elapsed * 1e3:9.1f} ms ({elapsed / n * 1e3:.3f} ms per row)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Parity check and benchmark of the compiled forest against sklearn.
+
+Run from the backend directory:
+    python -m benchmarks.bench_inference
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import DATASET_PATH
+from inference import CompiledForest
+from model_store import TARGET_COLUMN, load_or_train
+from benchmarks.timing import timeit
+
+
+def check_parity(model, engine, X, columns):
+    expected = model.predict_proba(pd.DataFrame(X, columns=columns))
+    actual = engine.predict_proba(X)
+    if not np.array_equal(expected, actual):
+        diff = np.abs(expected - actual).max()
+        raise AssertionError(f"compiled forest differs from sklearn (max abs diff {diff})")
+
+
+def main():
+    model, metadata = load_or_train()
+    features = metadata["features"]
+
+    start = time.perf_counter()
+    engine = CompiledForest.from_sklearn(model)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    data = pd.read_csv(DATASET_PATH)
+    X = data.drop(TARGET_COLUMN, axis=1)[features].to_numpy(dtype=np.float64)
+
+    # exact parity on the dataset and on perturbed rows around it
+    rng = np.random.default_rng(0)
+    perturbed = X[rng.integers(0, len(X), 20000)] * rng.uniform(0.8, 1.2, (20000, X.shape[1]))
+    check_parity(model, engine, X, features)
+    check_parity(model, engine, perturbed, features)
+    print(f"parity: OK on {len(X)} dataset rows and {len(perturbed)} perturbed rows")
+    print(f"compile: {compile_ms:.1f} ms, {engine.n_trees} trees, "
+          f"{len(engine.feature)} nodes, max depth {engine.max_depth}")
+
+    row = X[0]
+    patient_dict = dict(zip(features, row))
+
+    sk_single = timeit(lambda: model.predict_proba(pd.DataFrame([patient_dict])), 200)
+    ce_single = timeit(lambda: engine.predict_proba(row), 2000)
+    print(f"single row: sklearn+DataFrame {sk_single * 1e3:.3f} ms, "
+          f"compiled {ce_single * 1e3:.3f} ms ({sk_single / ce_single:.0f}x)")
+
+    for n in (64, 1000, len(X)):
+        batch = X[:n]
+        frame = pd.DataFrame(batch, columns=features)
+        sk = timeit(lambda: model.predict_proba(frame), 20)
+        ce = timeit(lambda: engine.predict_proba(batch), 20)
+        print(f"batch {n:>5}: sklearn {sk * 1e3:8.3f} ms, compiled {ce * 1e3:8.3f} ms "
+              f"({sk / ce:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Correctness check and benchmark of result archival and compaction.
+
+Seeds a scratch database with results spread over two years, then checks
+that a maintenance pass keeps every history readable unchanged (with
+include_archived, and page by page across the live/archive boundary),
+compares the dry-run estimate with what the run reclaimed, and measures
+how long saves made during the run wait for the write lock.
+
+Run from the backend directory:
+    python -m benchmarks.bench_maintenance [--results 100000] [--retention-days 365]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+# the app reads its settings at import, so point it at a scratch database first
+_tmpdir = tempfile.TemporaryDirectory(prefix="healthcheck-maintenance-")
+os.environ["DATABASE_PATH"] = os.path.join(_tmpdir.name, "bench.db")
+
+import numpy as np  # noqa: E402
+
+import database  # noqa: E402
+import main  # noqa: E402
+from maintenance import Maintenance  # noqa: E402
+from benchmarks.timing import timeit  # noqa: E402
+
+PATIENTS = 200
+DISTINCT_RESULTS = 1000
+HISTORY_DAYS = 730
+CHECKED_PATIENTS = 10
+
+
+def realistic_results(rng, n):
+    """/predict payloads the way the frontend saves them."""
+    X = np.column_stack([
+        rng.integers(0, 12, n), rng.uniform(60, 250, n), rng.uniform(40, 130, n), rng.uniform(0, 60, n),
+        rng.uniform(0, 400, n), rng.uniform(16, 50, n), rng.uniform(0.05, 2.0, n), rng.integers(18, 90, n),
+    ])
+    results = []
+    for row, probability in zip(X, main.predict_probabilities(X)):
+        prediction = main.build_prediction(dict(zip(main.FEATURES, row.tolist())), probability)
+        results.append({k: prediction[k] for k in ("diabetes", "diseases_detected", "raport")})
+    return results
+
+
+def seed(n, rng):
+    pool = realistic_results(np.random.default_rng(0), DISTINCT_RESULTS)
+    patients = []
+    for i in range(PATIENTS):
+        email = f"maintenance-{i}@example.com"
+        database.register_patient(email, "benchmark-password", "Bench", str(i))
+        patients.append(database.login_patient(email, "benchmark-password")["patient_id"])
+    for start in range(0, n, 10000):
+        database.save_health_results([
+            (rng.choice(patients), rng.choice(pool), "v1") for _ in range(min(10000, n - start))
+        ])
+    # oldest first, evenly over HISTORY_DAYS (ids keep growing with created_at)
+    with database.pool.connection() as conn:
+        conn.execute(
+            "UPDATE health_results SET created_at = datetime('now', '-' || ((? - id) * ? / ?) || ' seconds')",
+            (n + 1, HISTORY_DAYS * 86400, n)
+        )
+        conn.commit()
+    return patients
+
+
+def all_pages(patient_id, limit=97):
+    results, cursor = [], None
+    while True:
+        page, cursor = database.get_patient_results_page(patient_id, limit, cursor, include_archived=True)
+        results += page
+        if cursor is None:
+            return results
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--results", type=int, default=100000)
+    parser.add_argument("--retention-days", type=int, default=365)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    start = time.perf_counter()
+    patients = seed(args.results, rng)
+    print(f"seeded {args.results:,} results for {PATIENTS} patients in {time.perf_counter() - start:.1f}s")
+    checked = patients[:CHECKED_PATIENTS]
+    histories = {p: database.get_patient_results(p) for p in checked}
+    read_before = timeit(lambda: database.get_patient_results(checked[0]))
+
+    maintenance = Maintenance(retention_days=args.retention_days)
+    dry = maintenance.run(dry_run=True)
+    print(f"dry run:  {dry['archive']['results']:,} results to archive, "
+          f"{dry['reclaimable_bytes'] / 2**20:.2f} MiB reclaimable ({dry['duration_s']:.2f}s)")
+
+    # saves keep coming while the pass runs; their latency is the write-lock wait
+    latencies, done = [], threading.Event()
+
+    def save_loop():
+        while not done.is_set():
+            t = time.perf_counter()
+            database.save_health_result(patients[-1], histories[checked[0]][0]["result"], "v1")
+            latencies.append((time.perf_counter() - t) * 1000)
+            time.sleep(0.002)
+
+    writer = threading.Thread(target=save_loop)
+    writer.start()
+    report = maintenance.run()
+    done.set()
+    writer.join()
+
+    archive, before, after = report["archive"], report["before"], report["after"]
+    print(f"run:      {archive['results']:,} results archived "
+          f"({archive['result_bytes'] / 2**20:.2f} -> {archive['archived_bytes'] / 2**20:.2f} MiB), "
+          f"{report['vacuum']['pages']:,} pages released, ANALYZE {report['analyze_ms']:.1f} ms "
+          f"({report['duration_s']:.2f}s)")
+    print(f"file:     {before['size_bytes'] / 2**20:.2f} -> {after['size_bytes'] / 2**20:.2f} MiB "
+          f"(estimate {dry['reclaimable_bytes'] / 2**20:.2f} MiB, "
+          f"actual {(before['size_bytes'] - after['size_bytes']) / 2**20:.2f} MiB)")
+    latencies.sort()
+    print(f"saves:    {len(latencies)} during the run, p50 {latencies[len(latencies) // 2]:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)]:.2f} ms, max {latencies[-1]:.2f} ms "
+          f"(longest archive transaction {archive['longest_write_ms']:.1f} ms)")
+
+    for p in checked:
+        expected = histories[p]
+        full = database.get_patient_results(p, include_archived=True)
+        if full != expected or all_pages(p) != expected:
+            raise AssertionError(f"history of patient {p} changed")
+        live = database.get_patient_results(p)
+        if live != full[:len(live)]:
+            raise AssertionError(f"live history of patient {p} is not the newest part")
+    print(f"history:  OK for {len(checked)} patients (whole, paged and live-only)")
+
+    read_after = timeit(lambda: database.get_patient_results(checked[0]))
+    print(f"read:     whole live history {read_before * 1e3:.1f} -> {read_after * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main_cli()
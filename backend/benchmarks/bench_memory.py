@@ -0,0 +1,144 @@
+"""Memory per uvicorn worker with and without MODEL_MMAP_ENABLED.
+
+Starts `uvicorn main:app --workers N` once per mode, waits for every worker
+to finish startup, sends a few /predict requests and reads each worker's
+memory from /proc (Linux only). RSS counts shared pages in every process
+that maps them; PSS splits them between the sharers, so the PSS total is
+what the workers really cost together.
+
+Both runs use a scratch database and a copy of models/, so nothing in the
+repository is touched. With --cold the copy starts empty and every worker
+bootstraps (trains) its own model, as on a first deployment.
+
+Run from the backend directory:
+    python -m benchmarks.bench_memory
+    python -m benchmarks.bench_memory --workers 4 --cold
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+from config import MODEL_DIR
+
+PATIENT = {
+    "Pregnancies": 2, "Glucose": 150.0, "BloodPressure": 85.0, "SkinThickness": 20.0,
+    "Insulin": 90.0, "BMI": 33.1, "DiabetesPedigreeFunction": 0.5, "Age": 45,
+}
+STARTUP_TIMEOUT_S = 300
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def children(pid):
+    path = Path(f"/proc/{pid}/task/{pid}/children")
+    return [int(p) for p in path.read_text().split()]
+
+
+def worker_pids(master):
+    # the master's children are the workers plus multiprocessing's resource tracker
+    pids = []
+    for pid in children(master):
+        cmdline = Path(f"/proc/{pid}/cmdline").read_bytes().replace(b"\0", b" ")
+        if b"resource_tracker" not in cmdline:
+            pids.append(pid)
+    return pids
+
+
+def memory_mb(pid):
+    fields = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        name, value = line.split(":", 1)
+        fields[name] = int(value.split()[0]) / 1024
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "shared": fields["Shared_Clean"] + fields["Shared_Dirty"],
+        "private": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def predict(port):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/predict",
+        data=json.dumps(PATIENT).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.load(response)
+
+
+def measure(workers, mmap, model_dir, scratch):
+    port = free_port()
+    log_path = Path(scratch) / f"uvicorn-{'mmap' if mmap else 'default'}.log"
+    env = {
+        **os.environ,
+        "DATABASE_PATH": str(Path(scratch) / "bench.db"),
+        "MODEL_DIR": str(model_dir),
+        "MODEL_MMAP_ENABLED": "1" if mmap else "0",
+        "MODEL_REGISTRY_POLL_S": "0",
+    }
+    with open(log_path, "w") as log:
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+             "--workers", str(workers), "--log-level", "info"],
+            env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    try:
+        deadline = time.monotonic() + STARTUP_TIMEOUT_S
+        while log_path.read_text().count("Application startup complete") < workers:
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"uvicorn did not start, see {log_path}:\n{log_path.read_text()}")
+            time.sleep(0.2)
+
+        # fresh connections spread over the workers, so each touches its model
+        for _ in range(20 * workers):
+            predict(port)
+        time.sleep(0.5)
+        return [memory_mb(pid) for pid in worker_pids(server.pid)]
+    finally:
+        server.terminate()
+        server.wait(30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--cold", action="store_true", help="start without a trained artifact")
+    args = parser.parse_args()
+
+    if not Path("/proc/self/smaps_rollup").exists():
+        sys.exit("bench_memory needs Linux /proc/<pid>/smaps_rollup")
+
+    print(f"{'mode':<8} {'worker':>6} {'RSS MB':>8} {'PSS MB':>8} {'shared':>8} {'private':>8}")
+    for mmap in (False, True):
+        with tempfile.TemporaryDirectory(prefix="healthcheck-mem-") as scratch:
+            model_dir = Path(scratch) / "models"
+            if args.cold or not Path(MODEL_DIR).exists():
+                model_dir.mkdir()
+            else:
+                shutil.copytree(MODEL_DIR, model_dir)
+                # registry versions of the repository's models/ stay out of the run
+                (model_dir / "registry.json").unlink(missing_ok=True)
+
+            mode = "mmap" if mmap else "default"
+            stats = measure(args.workers, mmap, model_dir, scratch)
+            for i, m in enumerate(stats):
+                print(f"{mode:<8} {i:>6} {m['rss']:>8.1f} {m['pss']:>8.1f} {m['shared']:>8.1f} {m['private']:>8.1f}")
+            print(f"{mode:<8} {'total':>6} {sum(m['rss'] for m in stats):>8.1f} "
+                  f"{sum(m['pss'] for m in stats):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
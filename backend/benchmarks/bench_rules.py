@@ -0,0 +1,157 @@
+"""Per-patient rule branches vs the vectorized rule engine (rules.py).
+
+Checks that analyze_health / generate_medical_report give exactly what the
+hand-written branches gave, on every threshold boundary and on random
+patients, then times both on batches.
+
+Run from the backend directory:
+    python -m benchmarks.bench_rules
+"""
+import itertools
+import random
+import time
+
+import numpy as np
+
+from medical import (
+    FEATURE_INFO, analyze_health, analyze_health_batch, generate_medical_report,
+    generate_medical_reports, rule_engine
+)
+
+FEATURES = list(FEATURE_INFO)
+INT_FEATURES = {"Pregnancies", "Age"}
+# precision of the values in diabetes.csv
+MEASUREMENT_DECIMALS = {"Glucose": 0, "BloodPressure": 0, "SkinThickness": 0, "Insulin": 0,
+                        "DiabetesPedigreeFunction": 3}
+
+
+# the per-patient branches used before the rule table
+def legacy_analyze_health(patient_dict):
+    diseases = {}
+    glucose = patient_dict["Glucose"]
+    insulin = patient_dict["Insulin"]
+    bmi = patient_dict["BMI"]
+    bp = patient_dict["BloodPressure"]
+
+    diseases["Obesity"] = {
+        "risk_level": "high" if bmi >= 35 else "medium" if bmi >= 30 else "small"
+    }
+    diseases["Hypertension"] = {
+        "risk_level": "high" if bp > 120 else "medium" if bp > 90 else "small"
+    }
+    metabolic_flags = 0
+    if glucose > 100:
+        metabolic_flags += 1
+    if insulin > 100:
+        metabolic_flags += 1
+    if bmi > 30:
+        metabolic_flags += 1
+    diseases["Metabolic Syndrome"] = {
+        "risk_level": "high" if metabolic_flags >= 3 else "medium" if metabolic_flags >= 2 else "small"
+    }
+    return diseases
+
+
+def legacy_generate_medical_report(patient_dict):
+    report = []
+    for key, value in patient_dict.items():
+        info = FEATURE_INFO[key]
+        if value < info["min"]:
+            report.append(f"{info['name']} IS TOO LOW ({value}) – NORM: {info['min']}–{info['max']}")
+        elif value > info["max"]:
+            report.append(f"{info['name']} IS TOO HIGH ({value}) – NORM: {info['min']}–{info['max']}")
+    if not report:
+        report.append("All parameters are within the norm.")
+    return report
+
+
+def boundary_values(feature):
+    """Every threshold the rules use for `feature`, with its neighbours."""
+    info = FEATURE_INFO[feature]
+    points = [info["min"], info["max"]] + [info[k] for k in ("warning", "critical") if k in info]
+    if feature == "Glucose":
+        points.append(100)
+    if feature in INT_FEATURES:
+        return sorted({int(p) + d for p in points for d in (-1, 0, 1)})
+    return sorted({float(p + d) for p in points for d in (-0.1, -1e-9, 0, 1e-9, 0.1)})
+
+
+def random_patient(rng, decimals=None):
+    """Random values around the norms; `decimals` rounds floats like real measurements."""
+    patient = {}
+    for f in FEATURES:
+        info = FEATURE_INFO[f]
+        hi = info.get("critical", info["max"]) * 1.5 or 1
+        if f in INT_FEATURES:
+            patient[f] = rng.randint(0, int(hi))
+        else:
+            value = rng.uniform(0, hi)
+            patient[f] = value if decimals is None else round(value, decimals.get(f, 1))
+    return patient
+
+
+def to_matrix(patients):
+    return np.array([[p[f] for f in FEATURES] for p in patients], dtype=np.float64)
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def check(patients):
+    X = to_matrix(patients)
+    batch_analysis = analyze_health_batch(X, FEATURES)
+    batch_reports = generate_medical_reports(X, FEATURES, INT_FEATURES)
+    for p, analysis, report in zip(patients, batch_analysis, batch_reports):
+        expected_analysis = legacy_analyze_health(p)
+        expected_report = legacy_generate_medical_report(p)
+        assert analyze_health(p) == expected_analysis == analysis, p
+        assert generate_medical_report(p) == expected_report == report, p
+
+
+def main():
+    rng = random.Random(0)
+    base = {f: (FEATURE_INFO[f]["min"] + FEATURE_INFO[f]["max"]) / 2 for f in FEATURES}
+    base = {f: int(v) if f in INT_FEATURES else float(v) for f, v in base.items()}
+
+    # each boundary on its own, then every pair of rule features together
+    boundary = [{**base, f: v} for f in FEATURES for v in boundary_values(f)]
+    pairs = [
+        {**base, a: va, b: vb}
+        for a, b in itertools.combinations(("Glucose", "Insulin", "BMI", "BloodPressure"), 2)
+        for va in boundary_values(a) for vb in boundary_values(b)
+    ]
+    triples = [
+        {**base, "Glucose": g, "Insulin": i, "BMI": b}
+        for g, i, b in itertools.product(
+            boundary_values("Glucose"), boundary_values("Insulin"), boundary_values("BMI")
+        )
+    ]
+    check(boundary + pairs + triples)
+    check([random_patient(rng) for _ in range(20000)])
+    check([random_patient(rng, MEASUREMENT_DECIMALS) for _ in range(20000)])
+    print(f"equivalence: OK ({len(boundary) + len(pairs) + len(triples)} boundary cases, 40000 random)")
+
+    engine = rule_engine(tuple(FEATURES))
+    print("analyze + report, ms (dicts: analyze_health_batch output, arrays: RuleEngine.risk_levels)")
+    print(f"{'rows':>7} {'per-patient':>12} {'dicts':>9} {'arrays':>9} {'speedup':>8}")
+    for n in (100, 1000, 10000, 100000):
+        patients = [random_patient(rng, MEASUREMENT_DECIMALS) for _ in range(n)]
+        X = to_matrix(patients)
+
+        legacy_ms = timed(lambda: [
+            (legacy_analyze_health(p), legacy_generate_medical_report(p)) for p in patients
+        ])
+        dicts_ms = timed(lambda: (
+            analyze_health_batch(X, FEATURES), generate_medical_reports(X, FEATURES, INT_FEATURES)
+        ))
+        arrays_ms = timed(lambda: (engine.risk_levels(X), engine.report(X, INT_FEATURES)))
+        print(f"{n:>7} {legacy_ms:>12.2f} {dicts_ms:>9.2f} {arrays_ms:>9.2f} {legacy_ms / arrays_ms:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
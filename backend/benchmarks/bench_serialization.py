@@ -0,0 +1,85 @@
+"""Standard library json vs the selected fast backend on realistic histories.
+
+Run from the backend directory:
+    python -m benchmarks.bench_serialization
+"""
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+import serialization
+from benchmarks.bench_advice import synthetic_history
+from medical import enrich_result, generate_medical_report
+
+
+def timed(fn, repeat=5):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    rng = random.Random(0)
+    print(f"fast backend: {serialization.BACKEND}")
+    print(f"{'rows':>6} {'stage':<26} {'stdlib ms':>10} {'fast ms':>10} {'speedup':>8}")
+
+    for n in (100, 1000, 5000):
+        history = synthetic_history(n, rng)
+        for r in history:
+            # stored results carry the full report lines, like real saves
+            r["result"]["raport"] = generate_medical_report({
+                "Pregnancies": rng.randint(0, 10), "Glucose": rng.uniform(60, 220),
+                "BloodPressure": rng.uniform(50, 130), "SkinThickness": rng.uniform(5, 50),
+                "Insulin": rng.uniform(0, 300), "BMI": rng.uniform(17, 45),
+                "DiabetesPedigreeFunction": rng.uniform(0, 2), "Age": rng.randint(20, 80),
+            })
+        blobs_std = [json.dumps(r["result"]) for r in history]
+        blobs_fast = [serialization.dumps_str(r["result"]) for r in history]
+        enriched = [enrich_result(r) for r in history]
+
+        stages = [
+            ("store: encode result_json",
+             lambda: [json.dumps(r["result"]) for r in history],
+             lambda: [serialization.dumps_str(r["result"]) for r in history]),
+            ("load: decode result_json",
+             lambda: [json.loads(b) for b in blobs_std],
+             lambda: [serialization.loads(b) for b in blobs_fast]),
+            ("respond: encode history",
+             lambda: json.dumps(jsonable_encoder(enriched), ensure_ascii=False,
+                                allow_nan=False, separators=(",", ":")).encode("utf-8"),
+             lambda: serialization.dumps(enriched)),
+        ]
+        for name, std, fast in stages:
+            std_ms, fast_ms = timed(std), timed(fast)
+            print(f"{n:>6} {name:<26} {std_ms:>10.2f} {fast_ms:>10.2f} {std_ms / fast_ms:>7.1f}x")
+
+        # both encodings must decode to the same data
+        assert json.loads(serialization.dumps(enriched)) == json.loads(json.dumps(enriched))
+
+    # integers wider than 64 bits (which orjson rejects) are still stored as the stdlib did
+    wide = {"diabetes": {"probability": 10**20, "risk_level": "high"}, "raport": [-2**70]}
+    assert serialization.dumps_str(wide) == json.dumps(wide, separators=(",", ":"))
+    assert serialization.loads(serialization.dumps(wide)) == wide
+    print("wide integers: OK")
+
+    # a result_json row as json.dumps wrote it before the fast backends: NaN,
+    # Infinity and wide ints must read back, and be stored again, unchanged
+    legacy = ('{"diabetes": {"probability": NaN, "risk_level": "small", "model_score": Infinity}, '
+              '"diseases_detected": {"Hypertension": "small"}, "raport": ["Glucose: 0"], '
+              '"visits": 100000000000000000000, "offset": -9223372036854775809}')
+    expected = json.dumps(json.loads(legacy))
+    for row in (legacy, legacy.encode()):
+        decoded = serialization.loads(row)
+        assert json.dumps(decoded) == expected, decoded
+        assert json.dumps(serialization.loads(serialization.dumps_str(decoded))) == expected
+        # responses are strict JSON: NaN and Infinity become null
+        assert json.loads(serialization.dumps(decoded))["diabetes"]["probability"] is None
+    print("baseline rows: OK")
+
+
+if __name__ == "__main__":
+    main()
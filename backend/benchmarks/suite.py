@@ -0,0 +1,296 @@
+"""Offline benchmark suite for the backend.
+
+Runs micro-benchmarks of the scoring and report functions and concurrent
+load scenarios against the in-process app (no network, no server). The app
+uses a temporary SQLite file seeded with synthetic patients and histories.
+
+Run from the backend directory:
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --compare bench.json      # flag regressions
+    python -m benchmarks.suite --quick                   # smaller run
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+# the app reads its settings at import, so point it at a scratch database first
+_tmpdir = tempfile.TemporaryDirectory(prefix="healthcheck-bench-")
+os.environ["DATABASE_PATH"] = os.path.join(_tmpdir.name, "bench.db")
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import database  # noqa: E402
+import main  # noqa: E402
+from medical import (  # noqa: E402
+    analyze_health, build_frontend_report, enriched_results_json, generate_medical_report
+)
+
+PASSWORD = "benchmark-password"
+HISTORY_SIZES = (10, 100, 1000)
+
+
+# -------------------------
+# SYNTHETIC DATA
+# -------------------------
+def synthetic_patient(rng):
+    return {
+        "Pregnancies": rng.randint(0, 12),
+        "Glucose": round(rng.uniform(60, 250), 1),
+        "BloodPressure": round(rng.uniform(40, 130), 1),
+        "SkinThickness": round(rng.uniform(0, 60), 1),
+        "Insulin": round(rng.uniform(0, 400), 1),
+        "BMI": round(rng.uniform(16, 50), 1),
+        "DiabetesPedigreeFunction": round(rng.uniform(0.05, 2.0), 3),
+        "Age": rng.randint(18, 90),
+    }
+
+
+def synthetic_result(rng):
+    patient = synthetic_patient(rng)
+    probability = main.predict_probabilities(
+        np.array([[patient[f] for f in main.FEATURES]], dtype=np.float64)
+    )[0]
+    prediction = main.build_prediction(patient, probability)
+    return {k: prediction[k] for k in ("diabetes", "diseases_detected", "raport")}
+
+
+def seed_database(rng):
+    """One account per history size, each with that many saved results."""
+    accounts = {}
+    for size in HISTORY_SIZES:
+        email = f"bench-{size}@example.com"
+        database.register_patient(email, PASSWORD, "Bench", str(size))
+        patient_id = database.login_patient(email, PASSWORD)["patient_id"]
+        with database.pool.connection() as conn:
+            conn.executemany(
+                "INSERT INTO health_results (patient_id, result_json) VALUES (?, ?)",
+                [(patient_id, json.dumps(synthetic_result(rng))) for _ in range(size)]
+            )
+            conn.commit()
+        accounts[size] = {"email": email, "patient_id": patient_id}
+    return accounts
+
+
+# -------------------------
+# STATISTICS
+# -------------------------
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies_s, elapsed_s, errors=0):
+    ms = sorted(v * 1000 for v in latencies_s)
+    return {
+        "count": len(ms),
+        "errors": errors,
+        "mean_ms": round(statistics.fmean(ms), 4) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 4),
+        "p95_ms": round(percentile(ms, 95), 4),
+        "p99_ms": round(percentile(ms, 99), 4),
+        "max_ms": round(ms[-1], 4) if ms else 0.0,
+        "throughput_per_s": round(len(ms) / elapsed_s, 2) if elapsed_s else 0.0,
+    }
+
+
+# -------------------------
+# MICRO-BENCHMARKS
+# -------------------------
+def micro(fn, inputs, repeat):
+    latencies = []
+    start = time.perf_counter()
+    for i in range(repeat):
+        arg = inputs[i % len(inputs)]
+        t0 = time.perf_counter()
+        fn(arg)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def run_micro(rng, repeat):
+    patients = [synthetic_patient(rng) for _ in range(256)]
+    frames = [pd.DataFrame([p])[main.FEATURES] for p in patients]
+    vectors = [np.array([[p[f] for f in main.FEATURES]], dtype=np.float64) for p in patients]
+    analyses = [(analyze_health(p), rng.choice(["small", "medium", "high"])) for p in patients]
+    histories = {
+        n: [{"result": synthetic_result(rng), "created_at": "2026-01-01 12:00:00", "model_version": "v1"} for _ in range(n)]
+        for n in (10, 100)
+    }
+
+    results = {
+        "analyze_health": micro(analyze_health, patients, repeat),
+        "generate_medical_report": micro(generate_medical_report, patients, repeat),
+        "build_frontend_report": micro(lambda a: build_frontend_report(*a), analyses, repeat),
+        "enriched_results_json (10 rows)": micro(enriched_results_json, [histories[10]], max(20, repeat // 10)),
+        "enriched_results_json (100 rows)": micro(enriched_results_json, [histories[100]], max(20, repeat // 50)),
+    }
+    if main.model is not None:
+        results["model.predict_proba (1 row DataFrame)"] = micro(main.model.predict_proba, frames, max(20, repeat // 10))
+    if main.engine is not None:
+        results["engine.predict_proba (1 row)"] = micro(main.engine.predict_proba, vectors, repeat)
+    if main.serving.percentiles is not None:
+        results["percentiles.lookup (1 row)"] = micro(main.serving.percentiles.lookup, vectors, repeat)
+    if main.serving.explainer is not None:
+        results["explainer.explain (1 row)"] = micro(main.serving.explainer.explain, vectors, max(20, repeat // 10))
+    return results
+
+
+# -------------------------
+# LOAD SCENARIOS
+# -------------------------
+async def run_load(client, make_request, total, concurrency):
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            t0 = time.perf_counter()
+            response = await make_request(i)
+            latencies.append(time.perf_counter() - t0)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+async def run_scenarios(rng, accounts, total, concurrency):
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            tokens = {}
+            for size, account in accounts.items():
+                r = await client.post("/login-json", json={"email": account["email"], "password": PASSWORD})
+                tokens[size] = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+            unique = [synthetic_patient(rng) for _ in range(total)]
+            repeated = [synthetic_patient(rng) for _ in range(16)]
+            batch = [synthetic_patient(rng) for _ in range(100)]
+            small = accounts[HISTORY_SIZES[0]]
+
+            scenarios = {
+                "POST /predict (unique patients)":
+                    lambda i: client.post("/predict", json=unique[i % len(unique)]),
+                "POST /predict (repeated patients)":
+                    lambda i: client.post("/predict", json=repeated[i % len(repeated)]),
+                "POST /predict/batch (100 patients)":
+                    lambda i: client.post("/predict/batch", json={"patients": batch}),
+                "POST /login-json":
+                    lambda i: client.post("/login-json", json={"email": small["email"], "password": PASSWORD}),
+                "GET /me":
+                    lambda i: client.get("/me", headers=tokens[HISTORY_SIZES[0]]),
+            }
+            for size, account in accounts.items():
+                url = f"/patient/{account['patient_id']}/results"
+                scenarios[f"GET /patient/{{id}}/results ({size} rows)"] = (
+                    lambda i, url=url, h=tokens[size]: client.get(url, headers=h)
+                )
+
+            # runs last, so the history scenarios above see the seeded row counts
+            saved = synthetic_result(rng)
+            scenarios["POST /save-result"] = lambda i: client.post(
+                "/save-result", json={"patient_id": small["patient_id"], **saved},
+                headers=tokens[HISTORY_SIZES[0]]
+            )
+
+            for name, make_request in scenarios.items():
+                n = total if "batch" not in name and "1000 rows" not in name else max(10, total // 10)
+                results[name] = await run_load(client, make_request, n, concurrency)
+    return results
+
+
+# -------------------------
+# REPORTING
+# -------------------------
+def print_table(title, results):
+    print(f"\n{title}")
+    print(f"  {'name':<44} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>10} {'err':>4}")
+    for name, r in results.items():
+        print(f"  {name:<44} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f} "
+              f"{r['throughput_per_s']:>10.1f} {r['errors']:>4}")
+
+
+def compare(current, baseline, threshold):
+    """Print p95 changes against a previous run; returns the regressed names."""
+    regressions = []
+    print(f"\nComparison with baseline (p95, regression threshold {threshold:.0%})")
+    for section in ("micro", "load"):
+        for name, r in current[section].items():
+            old = baseline.get(section, {}).get(name)
+            if not old or not old["p95_ms"]:
+                continue
+            change = r["p95_ms"] / old["p95_ms"] - 1
+            flag = "REGRESSION" if change > threshold else ""
+            if flag:
+                regressions.append(name)
+            print(f"  {name:<44} {old['p95_ms']:>9.3f} -> {r['p95_ms']:>9.3f} ms {change:>+8.1%} {flag}")
+    return regressions
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Healthcheck backend benchmark suite")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per load scenario")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent clients per scenario")
+    parser.add_argument("--repeat", type=int, default=2000, help="calls per micro-benchmark")
+    parser.add_argument("--quick", action="store_true", help="small run for a smoke check")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="compare against a previous --output file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p95 increase counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.requests, args.repeat = 200, 200
+
+    warnings.filterwarnings("ignore")
+    rng = random.Random(args.seed)
+
+    accounts = seed_database(rng)
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "repeat": args.repeat,
+        },
+        "micro": run_micro(rng, args.repeat),
+        "load": asyncio.run(run_scenarios(rng, accounts, args.requests, args.concurrency)),
+    }
+
+    print_table("Micro-benchmarks", report["micro"])
+    print_table(f"Load scenarios ({args.concurrency} concurrent clients)", report["load"])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
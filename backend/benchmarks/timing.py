@@ -0,0 +1,11 @@
+"""Timing helper shared by the benchmark scripts."""
+import time
+
+
+def timeit(fn, repeat=5):
+    """Mean seconds per call of fn over repeat calls, after one warm-up call."""
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
@@ -0,0 +1,217 @@
+"""Offline scoring of large screening CSVs with the app's model and rules.
+
+The model is the registry's active version (see model_registry.py), the
+one the API serves, and every output row records it in model_version.
+
+The input is read in chunks, so memory stays flat regardless of file size.
+Each chunk is scored with one vectorized predict_proba call and the same
+analyze_health / generate_medical_report rules the API uses. Chunks can be
+spread over a process pool; output order always matches the input.
+
+Used by `python manage.py score-csv`.
+"""
+import logging
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from medical import DISEASE_RULES, get_risk_label, rule_engine
+from model_registry import ModelRegistry
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for Parquet output
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# integer fields of main.PatientData; the rest are reported as floats, like the API does
+INT_FEATURES = ("Pregnancies", "Age")
+REPORT_SEPARATOR = " | "
+# one risk column per disease, present even in all-invalid chunks
+DISEASES = list(DISEASE_RULES)
+
+_worker_model = None
+
+
+# -------------------------
+# SCORING
+# -------------------------
+def disease_column(name):
+    return name.lower().replace(" ", "_") + "_risk"
+
+
+def invalid_rows(X, features):
+    """Rows with missing, non-numeric or (for integer fields) fractional values."""
+    bad = ~np.isfinite(X).all(axis=1)
+    for j, f in enumerate(features):
+        if f in INT_FEATURES:
+            with np.errstate(invalid="ignore"):
+                bad |= X[:, j] != np.round(X[:, j])
+    return bad
+
+
+def score_frame(model, features, frame, with_report=False, model_version=None):
+    """Score one chunk; returns the input columns plus the prediction columns."""
+    missing = [f for f in features if f not in frame.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    X = frame[features].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    bad = invalid_rows(X, features)
+    good = np.flatnonzero(~bad)
+
+    probabilities = np.full(len(frame), np.nan)
+    risks = np.full(len(frame), "", dtype=object)
+    if len(good):
+        scored = (model.predict_proba(pd.DataFrame(X[good], columns=features))[:, 1] * 100).tolist()
+        # rounded and labelled exactly like build_prediction does
+        probabilities[good] = [round(p, 1) for p in scored]
+        risks[good] = [get_risk_label(p) for p in scored]
+
+    out = frame.copy()
+    out["diabetes_probability"] = probabilities
+    out["diabetes_risk"] = risks
+    errors = np.where(bad, "missing or invalid value", "").astype(object)
+
+    # every rule is evaluated for the whole chunk at once (see rules.py)
+    engine = rule_engine(tuple(features))
+    levels = engine.risk_levels(X[good])
+    columns = {}
+    for name in DISEASES:
+        values = np.full(len(frame), "", dtype=object)
+        values[good] = levels[name]
+        columns[name] = values
+
+    diseases_detected = np.full(len(frame), "", dtype=object)
+    diseases_detected[good] = [
+        "; ".join(name for name, level in zip(DISEASES, row) if level != "small")
+        for row in zip(*(levels[name].tolist() for name in DISEASES))
+    ]
+    if with_report:
+        reports = np.full(len(frame), "", dtype=object)
+        reports[good] = [REPORT_SEPARATOR.join(lines) for lines in engine.report(X[good], INT_FEATURES)]
+
+    for name, values in columns.items():
+        out[disease_column(name)] = values
+    out["diseases_detected"] = diseases_detected
+    if with_report:
+        out["report"] = reports
+    out["model_version"] = model_version
+    out["error"] = errors
+    return out
+
+
+def load_model(version=None):
+    """(model, metadata) of a registry version, the active one by default."""
+    # the sklearn artifact even with MODEL_MMAP_ENABLED: its tree walk is faster on whole chunks
+    return ModelRegistry(mmap=False).load(version)
+
+
+def _init_worker(version):
+    global _worker_model
+    # the version the parent resolved, even if another one is activated mid-run
+    _worker_model = load_model(version)
+
+
+def _score_in_worker(frame, with_report):
+    model, metadata = _worker_model
+    return score_frame(model, metadata["features"], frame, with_report, metadata["version"])
+
+
+def score_chunks(chunks, workers=1, with_report=False):
+    """Yield scored chunks in input order, optionally scoring them in worker processes."""
+    model, metadata = load_model()
+
+    if workers <= 1:
+        for frame in chunks:
+            yield score_frame(model, metadata["features"], frame, with_report, metadata["version"])
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(metadata["version"],)) as pool:
+        # a couple of chunks in flight per worker keeps memory bounded
+        pending = deque()
+        for frame in chunks:
+            pending.append(pool.submit(_score_in_worker, frame, with_report))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# -------------------------
+# OUTPUT
+# -------------------------
+class CSVWriter:
+    def __init__(self, path):
+        self.path = path
+        self.header = True
+
+    def write(self, frame):
+        frame.to_csv(self.path, mode="w" if self.header else "a", header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        if self.header:
+            # empty input still produces a file
+            open(self.path, "w").close()
+
+
+class ParquetWriter:
+    def __init__(self, path):
+        if pq is None:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)")
+        self.path = path
+        self.writer = None
+
+    def write(self, frame):
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            # pandas may infer int for one chunk and float for the next
+            table = table.cast(self.writer.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_writer(path, fmt=None):
+    fmt = fmt or ("parquet" if str(path).endswith((".parquet", ".pq")) else "csv")
+    return ParquetWriter(path) if fmt == "parquet" else CSVWriter(path)
+
+
+# -------------------------
+# ENTRY POINT
+# -------------------------
+def score_csv(input_path, output_path, chunksize=50000, workers=1, fmt=None,
+              with_report=False, progress=sys.stderr):
+    """Stream `input_path` through the model into `output_path`; returns (rows, seconds)."""
+    writer = open_writer(output_path, fmt)
+    chunks = pd.read_csv(input_path, chunksize=chunksize)
+
+    start = time.perf_counter()
+    rows = invalid = 0
+    try:
+        for scored in score_chunks(chunks, workers, with_report):
+            writer.write(scored)
+            rows += len(scored)
+            invalid += int((scored["error"] != "").sum())
+            if progress is not None:
+                elapsed = time.perf_counter() - start
+                print(f"  {rows:>10,} rows  {rows / elapsed:>10,.0f} rows/s", file=progress, flush=True)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    if invalid:
+        logger.warning("%d rows had missing or invalid values and were not scored", invalid)
+    return rows, elapsed
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache with hit/miss counters.
+
+    Entries can carry an absolute expiry time (`expires_at`, seconds since
+    the epoch) or inherit the cache-wide `ttl`; expired entries are dropped
+    on access and count as misses.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and self.clock() >= expires_at:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires_at=None):
+        if self.maxsize <= 0:
+            return
+        if expires_at is None and self.ttl is not None:
+            expires_at = self.clock() + self.ttl
+        with self._lock:
+            self._insert(key, value, expires_at)
+
+    def _insert(self, key, value, expires_at):
+        # caller holds the lock
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class ReadThroughCache(LRUCache):
+    """LRUCache that loads missing keys itself with `loader(key)`.
+
+    A loader result of None ("no such row") is cached too, but only for
+    `negative_ttl` seconds, so repeated lookups of unknown keys stop
+    reaching the database without hiding new rows for long. Call
+    invalidate(key) after changing the underlying row.
+    """
+
+    def __init__(self, loader, maxsize=1024, ttl=60.0, negative_ttl=10.0, clock=time.time):
+        super().__init__(maxsize, ttl, clock)
+        self.loader = loader
+        self.negative_ttl = negative_ttl
+        self.negative_hits = 0
+        self.invalidations = 0
+        # bumped by invalidate(), so a load that raced with it is not stored
+        self._generation = 0
+
+    def lookup(self, key):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            if value is None:
+                with self._lock:
+                    self.negative_hits += 1
+            return value
+
+        generation = self._generation
+        value = self.loader(key)
+        if self.maxsize > 0:
+            expires_at = self.clock() + (self.negative_ttl if value is None else self.ttl)
+            with self._lock:
+                if generation == self._generation:
+                    self._insert(key, value, expires_at)
+        return value
+
+    def peek(self, key, default=None):
+        """The cached value without loading it; misses return `default` uncounted.
+
+        Lets async callers answer hits inline and send only misses to a
+        thread for lookup(), which then counts the miss.
+        """
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or (entry[1] is not None and self.clock() >= entry[1]):
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            if entry[0] is None:
+                self.negative_hits += 1
+            return entry[0]
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+        self.pop(key)
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats["negative_hits"] = self.negative_hits
+            stats["invalidations"] = self.invalidations
+        return stats
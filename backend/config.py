@@ -0,0 +1,188 @@
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# settings can be overridden with environment variables or a .env file
+BASE_DIR = Path(__file__).resolve().parent
+load_dotenv(BASE_DIR / ".env")
+
+
+def env_str(name: str, default: str) -> str:
+    return os.getenv(name, default)
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# -------------------------
+# SERIALIZATION
+# -------------------------
+# "auto" picks orjson, then msgspec, then the standard library json module
+JSON_BACKEND = env_str("JSON_BACKEND", "auto")
+
+# -------------------------
+# DATABASE
+# -------------------------
+DATABASE_PATH = Path(env_str("DATABASE_PATH", str(BASE_DIR / "database.db")))
+DB_POOL_SIZE = env_int("DB_POOL_SIZE", 8)
+# seconds to wait for a free pooled connection
+DB_POOL_TIMEOUT = env_float("DB_POOL_TIMEOUT", 10.0)
+DB_JOURNAL_MODE = env_str("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = env_str("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE_KB = env_int("DB_CACHE_SIZE_KB", 16384)
+DB_MMAP_SIZE = env_int("DB_MMAP_SIZE", 128 * 1024 * 1024)
+DB_BUSY_TIMEOUT_MS = env_int("DB_BUSY_TIMEOUT_MS", 5000)
+# prepared statements kept per pooled connection
+DB_STATEMENT_CACHE_SIZE = env_int("DB_STATEMENT_CACHE_SIZE", 128)
+# applies to new database files; an existing one switches on its next VACUUM
+# (python manage.py maintenance --full-vacuum)
+DB_AUTO_VACUUM = env_str("DB_AUTO_VACUUM", "INCREMENTAL")
+
+# largest page /patient/{id}/results?limit= will return
+RESULTS_PAGE_MAX_SIZE = env_int("RESULTS_PAGE_MAX_SIZE", 500)
+# rows read per query by /patient/{id}/results/export
+RESULTS_EXPORT_CHUNK_SIZE = env_int("RESULTS_EXPORT_CHUNK_SIZE", 500)
+
+# buffer /save-result writes and commit them in batches (opt-in)
+WRITE_BEHIND_ENABLED = env_bool("WRITE_BEHIND_ENABLED", False)
+# pending saves before /save-result answers 503
+WRITE_BEHIND_QUEUE_SIZE = env_int("WRITE_BEHIND_QUEUE_SIZE", 10000)
+WRITE_BEHIND_BATCH_SIZE = env_int("WRITE_BEHIND_BATCH_SIZE", 256)
+WRITE_BEHIND_FLUSH_MS = env_float("WRITE_BEHIND_FLUSH_MS", 20.0)
+# "commit": answer once the batch is committed; "queued": answer on enqueue
+# (faster, but saves still queued are lost if the process crashes)
+WRITE_BEHIND_ACK = env_str("WRITE_BEHIND_ACK", "commit")
+
+# -------------------------
+# MAINTENANCE
+# -------------------------
+# results older than this many days move to the compressed archive table,
+# still readable with ?include_archived=true (see maintenance.py); 0 keeps
+# every result in health_results
+RESULTS_RETENTION_DAYS = env_int("RESULTS_RETENTION_DAYS", 0)
+# seconds between maintenance runs (archival, incremental vacuum, ANALYZE) in
+# each API worker; 0 leaves them to `python manage.py maintenance` (cron)
+MAINTENANCE_INTERVAL_S = env_float("MAINTENANCE_INTERVAL_S", 0.0)
+# results moved per write transaction; saves wait behind one batch at most
+MAINTENANCE_BATCH_SIZE = env_int("MAINTENANCE_BATCH_SIZE", 500)
+# free pages released per write transaction, and per run (0 = all of them)
+MAINTENANCE_VACUUM_STEP_PAGES = env_int("MAINTENANCE_VACUUM_STEP_PAGES", 256)
+MAINTENANCE_VACUUM_MAX_PAGES = env_int("MAINTENANCE_VACUUM_MAX_PAGES", 0)
+# index entries ANALYZE samples per index (PRAGMA analysis_limit; 0 = all)
+MAINTENANCE_ANALYSIS_LIMIT = env_int("MAINTENANCE_ANALYSIS_LIMIT", 1000)
+# preset deflate dictionary trained on the first archived results
+ARCHIVE_DICTIONARY_SIZE = env_int("ARCHIVE_DICTIONARY_SIZE", 8192)
+ARCHIVE_COMPRESSION_LEVEL = env_int("ARCHIVE_COMPRESSION_LEVEL", 6)
+
+# -------------------------
+# AUTH
+# -------------------------
+# changing it (and restarting every worker) invalidates all issued tokens
+JWT_SECRET_KEY = env_str("JWT_SECRET_KEY", "secretkey")
+# verified JWT claims cached until the token's exp
+TOKEN_CACHE_ENABLED = env_bool("TOKEN_CACHE_ENABLED", True)
+TOKEN_CACHE_SIZE = env_int("TOKEN_CACHE_SIZE", 10000)
+# seconds between reads of the tokens other workers revoked (/logout); a token
+# already cached here stays usable until then, an uncached one is checked at once
+TOKEN_REVOCATION_POLL_S = env_float("TOKEN_REVOCATION_POLL_S", 1.0)
+# patient profiles and login rows (email -> id, password hash), read through
+# an LRU; each worker caches on its own, so keep the TTLs short
+PATIENT_CACHE_ENABLED = env_bool("PATIENT_CACHE_ENABLED", True)
+PATIENT_CACHE_SIZE = env_int("PATIENT_CACHE_SIZE", 10000)
+PATIENT_CACHE_TTL_S = env_float("PATIENT_CACHE_TTL_S", 60.0)
+# unknown emails and ids, remembered to keep credential stuffing off the database
+PATIENT_CACHE_NEGATIVE_TTL_S = env_float("PATIENT_CACHE_NEGATIVE_TTL_S", 10.0)
+# sent as X-Admin-Token to the /admin endpoints; empty disables them
+ADMIN_TOKEN = env_str("ADMIN_TOKEN", "")
+
+# -------------------------
+# MODEL
+# -------------------------
+DATASET_PATH = Path(env_str("DATASET_PATH", str(BASE_DIR / "diabetes.csv")))
+MODEL_DIR = Path(env_str("MODEL_DIR", str(BASE_DIR / "models")))
+MODEL_N_ESTIMATORS = env_int("MODEL_N_ESTIMATORS", 100)
+MODEL_RANDOM_STATE = env_int("MODEL_RANDOM_STATE", 42)
+MODEL_TEST_SIZE = env_float("MODEL_TEST_SIZE", 0.2)
+# "compiled" (NumPy tree walker, see inference.py) or "sklearn"
+INFERENCE_ENGINE = env_str("INFERENCE_ENGINE", "compiled")
+# larger batches go through sklearn, whose Cython tree walk is faster there
+INFERENCE_COMPILED_MAX_ROWS = env_int("INFERENCE_COMPILED_MAX_ROWS", 256)
+# serve the forest from read-only memory-mapped arrays in MODEL_DIR, shared by
+# all uvicorn workers; the sklearn model and the dataset are never loaded
+MODEL_MMAP_ENABLED = env_bool("MODEL_MMAP_ENABLED", False)
+
+# trained versions kept for rollback (see model_registry.py)
+MODEL_REGISTRY_KEEP = env_int("MODEL_REGISTRY_KEEP", 5)
+# a retrained model is only activated with at least this holdout accuracy
+MODEL_MIN_ACCURACY = env_float("MODEL_MIN_ACCURACY", 0.65)
+# seconds between checks for a version activated by another worker or the CLI
+MODEL_REGISTRY_POLL_S = env_float("MODEL_REGISTRY_POLL_S", 5.0)
+
+# -------------------------
+# PREDICTION
+# -------------------------
+PREDICT_BATCH_MAX_SIZE = env_int("PREDICT_BATCH_MAX_SIZE", 5000)
+# threads dedicated to CPU-bound model scoring
+MODEL_EXECUTOR_WORKERS = env_int("MODEL_EXECUTOR_WORKERS", 2)
+
+# coalesce concurrent /predict calls (opt-in)
+PREDICT_BATCHING_ENABLED = env_bool("PREDICT_BATCHING_ENABLED", False)
+PREDICT_BATCHING_WINDOW_MS = env_float("PREDICT_BATCHING_WINDOW_MS", 2.0)
+PREDICT_BATCHING_MAX_SIZE = env_int("PREDICT_BATCHING_MAX_SIZE", 64)
+
+# admission control in front of model scoring: requests beyond the limit wait
+# in a bounded queue and get 503 + Retry-After when it is full or they time out
+ADMISSION_ENABLED = env_bool("ADMISSION_ENABLED", True)
+# concurrent scoring calls; 0 = MODEL_EXECUTOR_WORKERS (x PREDICT_BATCHING_MAX_SIZE
+# with batching, since batched requests hold a slot while their batch fills)
+ADMISSION_MAX_CONCURRENCY = env_int("ADMISSION_MAX_CONCURRENCY", 0)
+ADMISSION_MAX_QUEUE = env_int("ADMISSION_MAX_QUEUE", 64)
+# longest a request may wait for a slot, counted from its arrival
+ADMISSION_MAX_WAIT_MS = env_float("ADMISSION_MAX_WAIT_MS", 1000.0)
+ADMISSION_RETRY_AFTER_S = env_int("ADMISSION_RETRY_AFTER_S", 1)
+
+# per-feature contributions (TreeSHAP) for ?explain=true; the per-leaf tables
+# are built with every model load (see explain.py)
+EXPLAIN_ENABLED = env_bool("EXPLAIN_ENABLED", True)
+# explanations cost a few ms per patient, so explained batches are smaller
+EXPLAIN_BATCH_MAX_SIZE = env_int("EXPLAIN_BATCH_MAX_SIZE", 500)
+
+# percentile of each value within the model's training dataset, overall and
+# per age band, in /predict responses (see percentiles.py); rebuilt with
+# every model load, so it always describes the population the model saw
+# (with MODEL_MMAP_ENABLED, built with the version and memory-mapped instead)
+PERCENTILES_ENABLED = env_bool("PERCENTILES_ENABLED", True)
+PERCENTILE_AGE_BAND_YEARS = env_int("PERCENTILE_AGE_BAND_YEARS", 10)
+# bands with fewer reference patients report null
+PERCENTILE_MIN_BAND_SIZE = env_int("PERCENTILE_MIN_BAND_SIZE", 30)
+# also report percentiles among patients with and without diabetes
+PERCENTILE_BY_OUTCOME = env_bool("PERCENTILE_BY_OUTCOME", False)
+
+# LRU cache of /predict responses keyed on the validated patient vector
+PREDICTION_CACHE_ENABLED = env_bool("PREDICTION_CACHE_ENABLED", True)
+PREDICTION_CACHE_SIZE = env_int("PREDICTION_CACHE_SIZE", 10000)
+
+# -------------------------
+# OBSERVABILITY
+# -------------------------
+# GET /metrics in the Prometheus text format
+METRICS_ENABLED = env_bool("METRICS_ENABLED", True)
+# requests sent with "X-Profile: 1" are stack-sampled into PROFILE_DIR (opt-in)
+PROFILING_ENABLED = env_bool("PROFILING_ENABLED", False)
+PROFILE_DIR = env_str("PROFILE_DIR", str(BASE_DIR / "profiles"))
+PROFILE_INTERVAL_MS = env_float("PROFILE_INTERVAL_MS", 1.0)
@@ -1,48 +1,218 @@
 import sqlite3
-import json
 import hashlib
-from pathlib import Path
+import base64
+import math
+import queue
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+ 
+from serialization import dumps_str, loads
+from metrics import timed_query
+from cache import ReadThroughCache
+from config import (
+    DATABASE_PATH, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_JOURNAL_MODE, DB_SYNCHRONOUS,
+    DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_BUSY_TIMEOUT_MS, DB_STATEMENT_CACHE_SIZE, DB_AUTO_VACUUM,
+    PATIENT_CACHE_ENABLED, PATIENT_CACHE_SIZE, PATIENT_CACHE_TTL_S, PATIENT_CACHE_NEGATIVE_TTL_S
+)
  
 # path to database
-BASE_DIR = Path(__file__).resolve().parent
-DB_PATH = BASE_DIR / "database.db"
+DB_PATH = DATABASE_PATH
  
  
 def get_connection():
-    return sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(
+        DB_PATH,
+        check_same_thread=False,
+        cached_statements=DB_STATEMENT_CACHE_SIZE
+    )
+    # must come before anything writes to a new file (journal_mode does)
+    conn.execute(f"PRAGMA auto_vacuum={DB_AUTO_VACUUM}")
+    conn.execute(f"PRAGMA journal_mode={DB_JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    return conn
+ 
+ 
+# -------------------------
+# CONNECTION POOL
+# -------------------------
+class ConnectionPool:
+    """Reuses configured sqlite connections instead of opening one per query.
+ 
+    Connections are created lazily up to `size`. Each keeps its own prepared
+    statement cache, so the SQL constants below are parsed once per
+    connection rather than once per call.
+    """
+ 
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._closed = False
+        self._lock = threading.Lock()
+ 
+    def acquire(self, timeout=DB_POOL_TIMEOUT):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+ 
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Connection pool is closed")
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self.factory()
+                except Exception:
+                    self._created -= 1
+                    raise
+ 
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No database connection available")
+ 
+    def release(self, conn):
+        # never hand out a connection with a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+ 
+        with self._lock:
+            if self._closed:
+                self._created -= 1
+                conn.close()
+                return
+        self._idle.put(conn)
+ 
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+ 
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+            conn.close()
+ 
+ 
+pool = ConnectionPool(get_connection, DB_POOL_SIZE)
+ 
+ 
+def close_pool():
+    pool.close()
  
  
 # -------------------------
 # INIT DATABASE
 # -------------------------
+@timed_query
 def init_db():
-    conn = get_connection()
-    cur = conn.cursor()
- 
-    # patients table
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS patients (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email TEXT UNIQUE,
-        password TEXT,
-        first_name TEXT,
-        last_name TEXT
-    )
-    """)
- 
-    # health results table
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS health_results (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        patient_id INTEGER,
-        result_json TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (patient_id) REFERENCES patients(id)
-    )
-    """)
+    with pool.connection() as conn:
+        cur = conn.cursor()
+ 
+        # patients table
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS patients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE,
+            password TEXT,
+            first_name TEXT,
+            last_name TEXT
+        )
+        """)
+ 
+        # health results table
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS health_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER,
+            result_json TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (patient_id) REFERENCES patients(id)
+        )
+        """)
+ 
+        # model version that produced the result (added after the first release)
+        columns = {row[1] for row in cur.execute("PRAGMA table_info(health_results)")}
+        if "model_version" not in columns:
+            cur.execute("ALTER TABLE health_results ADD COLUMN model_version TEXT")
+ 
+        # history lookups: WHERE patient_id = ? ORDER BY created_at DESC, id DESC
+        # (the rowid id is implicitly the last column of every index)
+        cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_health_results_patient_created
+        ON health_results (patient_id, created_at)
+        """)
+ 
+        # per-patient, per-day aggregates of the diabetes results, updated in
+        # the transaction that saves each result (see record_trends)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS patient_trends (
+            patient_id INTEGER,
+            day TEXT,
+            results INTEGER NOT NULL,
+            scored INTEGER NOT NULL,
+            probability_sum REAL NOT NULL,
+            probability_min REAL,
+            probability_max REAL,
+            risk_small INTEGER NOT NULL,
+            risk_medium INTEGER NOT NULL,
+            risk_high INTEGER NOT NULL,
+            PRIMARY KEY (patient_id, day)
+        ) WITHOUT ROWID
+        """)
+ 
+        # results past the retention period (see maintenance.py), under their
+        # original id; result is result_json deflated with a preset dictionary
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS archive_dictionaries (
+            id INTEGER PRIMARY KEY,
+            zdict BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS health_results_archive (
+            id INTEGER PRIMARY KEY,
+            patient_id INTEGER,
+            result BLOB NOT NULL,
+            dictionary_id INTEGER NOT NULL REFERENCES archive_dictionaries(id),
+            created_at TIMESTAMP,
+            model_version TEXT
+        )
+        """)
+        cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_health_results_archive_patient_created
+        ON health_results_archive (patient_id, created_at)
+        """)
+ 
+        # tokens revoked by /logout, until they expire; shared by every API
+        # worker, which reads new ids in order (see revoked_tokens_since)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            digest BLOB NOT NULL UNIQUE,
+            expires_at REAL NOT NULL
+        )
+        """)
  
-    conn.commit()
-    conn.close()
+        conn.commit()
  
  
 # initialize database at import
@@ -57,41 +227,89 @@ def hash_password(password: str) -> str:
  
  
 # -------------------------
-# AUTH
+# PATIENT CACHES
 # -------------------------
-def register_patient(email, password, first_name, last_name):
-    conn = get_connection()
-    cur = conn.cursor()
+# /me, /patient/{id} and the login endpoints read patients rows through
+# these caches; unknown emails and ids are cached briefly as None. Anything
+# that changes a patients row (profile or password update) must call
+# invalidate_patient afterwards.
+@timed_query
+def fetch_login_row(email):
+    with pool.connection() as conn:
+        return conn.execute(
+            """
+            SELECT id, password FROM patients WHERE email = ?
+            """,
+            (email,)
+        ).fetchone()
  
-    try:
-        cur.execute(
+ 
+@timed_query
+def fetch_patient_row(patient_id: int):
+    with pool.connection() as conn:
+        return conn.execute(
             """
-            INSERT INTO patients (email, password, first_name, last_name)
-            VALUES (?, ?, ?, ?)
+            SELECT id, email, first_name, last_name
+            FROM patients WHERE id = ?
             """,
-            (email, hash_password(password), first_name, last_name)
-        )
-        conn.commit()
-        return {"status": "ok", "message": "User registered"}
-    except sqlite3.IntegrityError:
-        return {"status": "error", "message": "Email already exists"}
-    finally:
-        conn.close()
+            (patient_id,)
+        ).fetchone()
  
  
+def patient_cache(loader):
+    if not PATIENT_CACHE_ENABLED:
+        return None
+    return ReadThroughCache(
+        loader, PATIENT_CACHE_SIZE, ttl=PATIENT_CACHE_TTL_S, negative_ttl=PATIENT_CACHE_NEGATIVE_TTL_S
+    )
+ 
+ 
+login_cache = patient_cache(fetch_login_row)
+profile_cache = patient_cache(fetch_patient_row)
+ 
+ 
+def invalidate_patient(patient_id: int = None, email: str = None):
+    """Drop a patient's cached rows (this process only; other workers wait for the TTL)."""
+    if login_cache is not None and email is not None:
+        login_cache.invalidate(email)
+    if profile_cache is not None and patient_id is not None:
+        profile_cache.invalidate(patient_id)
+ 
+ 
+# -------------------------
+# AUTH
+# -------------------------
+@timed_query
+def register_patient(email, password, first_name, last_name):
+    with pool.connection() as conn:
+        cur = conn.cursor()
+ 
+        try:
+            cur.execute(
+                """
+                INSERT INTO patients (email, password, first_name, last_name)
+                VALUES (?, ?, ?, ?)
+                """,
+                (email, hash_password(password), first_name, last_name)
+            )
+            conn.commit()
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            return {"status": "error", "message": "Email already exists"}
+ 
+    # the email and the new id may be cached as unknown
+    invalidate_patient(cur.lastrowid, email)
+    return {"status": "ok", "message": "User registered"}
+ 
+ 
+@timed_query
 def login_patient(email, password):
-    conn = get_connection()
-    cur = conn.cursor()
+    row = login_cache.lookup(email) if login_cache is not None else fetch_login_row(email)
+    return login_response(row, password)
  
-    cur.execute(
-        """
-        SELECT id, password FROM patients WHERE email = ?
-        """,
-        (email,)
-    )
-    row = cur.fetchone()
-    conn.close()
  
+def login_response(row, password):
+    """login_patient's answer for a fetched (id, password hash) row or None."""
     if not row:
         return {"status": "error", "message": "User not found"}
  
@@ -106,24 +324,46 @@ def login_patient(email, password):
         "patient_id": user_id
     }
  
+
+@timed_query
+def revoke_token(digest: bytes, expires_at: float):
+    """Record a revoked token (by digest) until `expires_at` (epoch seconds)."""
+    with pool.connection() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO revoked_tokens (digest, expires_at) VALUES (?, ?)",
+            (digest, expires_at)
+        )
+        # a revocation only needs to outlive the token itself
+        conn.execute("DELETE FROM revoked_tokens WHERE expires_at <= ?", (time.time(),))
+        conn.commit()
  
+
+@timed_query
+def is_token_revoked(digest: bytes) -> bool:
+    with pool.connection() as conn:
+        return conn.execute("SELECT 1 FROM revoked_tokens WHERE digest = ?", (digest,)).fetchone() is not None
+ 
+
+@timed_query
+def revoked_tokens_since(after_id: int = 0):
+    """(id, digest, expires_at) of unexpired revocations recorded after `after_id`, in id order."""
+    with pool.connection() as conn:
+        return conn.execute(
+            "SELECT id, digest, expires_at FROM revoked_tokens WHERE id > ? AND expires_at > ? ORDER BY id",
+            (after_id, time.time())
+        ).fetchall()
+ 
+
 # -------------------------
 # PATIENT INFO
 # -------------------------
+@timed_query
 def get_patient_info(patient_id: int):
-    conn = get_connection()
-    cur = conn.cursor()
+    row = profile_cache.lookup(patient_id) if profile_cache is not None else fetch_patient_row(patient_id)
+    return patient_info_response(row)
  
-    cur.execute(
-        """
-        SELECT id, email, first_name, last_name
-        FROM patients WHERE id = ?
-        """,
-        (patient_id,)
-    )
-    row = cur.fetchone()
-    conn.close()
  
+def patient_info_response(row):
     if not row:
         return {"status": "error", "message": "Patient not found"}
  
@@ -138,45 +378,320 @@ def get_patient_info(patient_id: int):
 # -------------------------
 # RESULTS
 # -------------------------
-def save_health_result(patient_id: int, result_data: dict):
-    conn = get_connection()
-    cur = conn.cursor()
- 
-    cur.execute(
-        """
-        INSERT INTO health_results (patient_id, result_json)
-        VALUES (?, ?)
-        """,
-        (patient_id, json.dumps(result_data))
-    )
+@timed_query
+def save_health_result(patient_id: int, result_data: dict, model_version: str = None):
+    save_health_results([(patient_id, result_data, model_version)])
+    return {"status": "ok", "message": "Result saved"}
  
-    conn.commit()
-    conn.close()
  
-    return {"status": "ok", "message": "Result saved"}
+@timed_query
+def save_health_results(items):
+    """Insert many (patient_id, result_data, model_version) rows in one transaction (one commit).
  
+    The patient_trends aggregates are updated in the same transaction.
+    """
+    with pool.connection() as conn:
+        # one timestamp for the batch, so each row's trend day matches its created_at
+        created_at = conn.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
+        conn.executemany(
+            """
+            INSERT INTO health_results (patient_id, result_json, created_at, model_version)
+            VALUES (?, ?, ?, ?)
+            """,
+            [
+                (patient_id, dumps_str(result_data), created_at, model_version)
+                for patient_id, result_data, model_version in items
+            ]
+        )
+        record_trends(conn, [
+            (patient_id, created_at, result_data)
+            for patient_id, result_data, _ in items
+        ])
+        conn.commit()
  
-def get_patient_results(patient_id: int):
-    conn = get_connection()
-    cur = conn.cursor()
  
-    cur.execute(
+def history_sql(include_archived: bool, after_cursor: bool) -> str:
+    """A patient's results, newest first, as (id, result_json, created_at,
+    model_version) rows, plus (archived result, dictionary_id) with
+    include_archived; see history_entries.
+ 
+    Takes the patient id (and the cursor's created_at, id) once per table.
+    """
+    where = "patient_id = ? AND (created_at, id) < (?, ?)" if after_cursor else "patient_id = ?"
+    if not include_archived:
+        return f"""
+            SELECT id, result_json, created_at, model_version
+            FROM health_results
+            WHERE {where}
+            ORDER BY created_at DESC, id DESC
         """
-        SELECT result_json, created_at
+    # each side walks its (patient_id, created_at) index and SQLite merges
+    # the two, so a page still stops after LIMIT rows
+    return f"""
+        SELECT id, result_json, created_at, model_version, NULL, NULL
         FROM health_results
-        WHERE patient_id = ?
-        ORDER BY created_at DESC
-        """,
-        (patient_id,)
-    )
+        WHERE {where}
+        UNION ALL
+        SELECT id, NULL, created_at, model_version, result, dictionary_id
+        FROM health_results_archive
+        WHERE {where}
+        ORDER BY created_at DESC, id DESC
+    """
+ 
+ 
+def history_entries(rows, include_archived: bool):
+    if not include_archived:
+        return [
+            {
+                "result": loads(row[1]),
+                "created_at": row[2],
+                "model_version": row[3]
+            }
+            for row in rows
+        ]
+    return [
+        {
+            "result": stored_result(row[1], row[4], row[5]),
+            "created_at": row[2],
+            "model_version": row[3]
+        }
+        for row in rows
+    ]
+ 
+ 
+@timed_query
+def get_patient_results(patient_id: int, include_archived: bool = False):
+    params = (patient_id,) * (2 if include_archived else 1)
+    with pool.connection() as conn:
+        rows = conn.execute(history_sql(include_archived, False), params).fetchall()
+        if include_archived:
+            load_archive_dictionaries(conn, {row[5] for row in rows})
+ 
+    return history_entries(rows, include_archived)
+ 
+ 
+# -------------------------
+# PAGINATION
+# -------------------------
+def encode_cursor(created_at, row_id) -> str:
+    raw = f"{created_at}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+ 
+ 
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode().rsplit("|", 1)
+        return created_at, int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+ 
+ 
+@timed_query
+def get_patient_results_page(patient_id: int, limit: int, cursor: str = None, include_archived: bool = False):
+    """One page of a patient's history, newest first (keyset pagination).
+ 
+    Returns (results, next_cursor); next_cursor is None on the last page.
+    Only the rows of the returned page are JSON-decoded. Archived rows keep
+    their id, so a cursor stays valid across both tables.
+    """
+    params = (patient_id,) if cursor is None else (patient_id, *decode_cursor(cursor))
+    with pool.connection() as conn:
+        rows = conn.execute(
+            history_sql(include_archived, cursor is not None) + " LIMIT ?",
+            params * (2 if include_archived else 1) + (limit + 1,)
+        ).fetchall()
+        if include_archived:
+            load_archive_dictionaries(conn, {row[5] for row in rows})
+ 
+    # one extra row tells whether there is a next page
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(page[-1][2], page[-1][0])
+ 
+    return history_entries(page, include_archived), next_cursor
+ 
+ 
+# -------------------------
+# ARCHIVE
+# -------------------------
+# id -> preset dictionary; rows of archive_dictionaries never change, so
+# each is read once per process
+archive_dictionaries = {}
  
-    rows = cur.fetchall()
-    conn.close()
+ 
+def load_archive_dictionaries(conn, ids):
+    """Make sure every dictionary in `ids` (None is skipped) is in archive_dictionaries."""
+    for dictionary_id in ids:
+        if dictionary_id is None or dictionary_id in archive_dictionaries:
+            continue
+        row = conn.execute(
+            "SELECT zdict FROM archive_dictionaries WHERE id = ?", (dictionary_id,)
+        ).fetchone()
+        archive_dictionaries[dictionary_id] = row[0]
+ 
+ 
+def compress_result(result_json: str, zdict: bytes, level: int = 6) -> bytes:
+    # zlib framing: the header names the dictionary and a checksum ends the data
+    compressor = zlib.compressobj(level, zdict=zdict)
+    return compressor.compress(result_json.encode()) + compressor.flush()
+ 
+ 
+def decompress_result(data: bytes, zdict: bytes) -> bytes:
+    decompressor = zlib.decompressobj(zdict=zdict)
+    return decompressor.decompress(data) + decompressor.flush()
+ 
+ 
+def stored_result(result_json, data, dictionary_id):
+    """The decoded result of a live row (result_json) or an archived one (data).
+ 
+    The archived row's dictionary must be loaded (load_archive_dictionaries).
+    """
+    if dictionary_id is None:
+        return loads(result_json)
+    return loads(decompress_result(data, archive_dictionaries[dictionary_id]))
+ 
+ 
+# -------------------------
+# TRENDS
+# -------------------------
+RISK_LEVELS = ("small", "medium", "high")
+ 
+# periods start on the bucket's first day: the day itself, Monday, the 1st
+TREND_BUCKETS = {
+    "day": "day",
+    "week": "date(day, 'weekday 0', '-6 days')",
+    "month": "date(day, 'start of month')",
+}
+ 
+TREND_UPSERT = """
+    INSERT INTO patient_trends (
+        patient_id, day, results, scored, probability_sum, probability_min,
+        probability_max, risk_small, risk_medium, risk_high
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (patient_id, day) DO UPDATE SET
+        results = results + excluded.results,
+        scored = scored + excluded.scored,
+        probability_sum = probability_sum + excluded.probability_sum,
+        probability_min = coalesce(
+            min(probability_min, excluded.probability_min), probability_min, excluded.probability_min
+        ),
+        probability_max = coalesce(
+            max(probability_max, excluded.probability_max), probability_max, excluded.probability_max
+        ),
+        risk_small = risk_small + excluded.risk_small,
+        risk_medium = risk_medium + excluded.risk_medium,
+        risk_high = risk_high + excluded.risk_high
+"""
+ 
+ 
+def trend_values(result_data):
+    """(diabetes probability or None, risk level or None) of a stored result."""
+    diabetes = result_data.get("diabetes") if isinstance(result_data, dict) else None
+    if not isinstance(diabetes, dict):
+        return None, None
+    probability = diabetes.get("probability")
+    if isinstance(probability, bool) or not isinstance(probability, (int, float)):
+        probability = None
+    else:
+        try:
+            # aggregated as REAL, where ints wider than 64 bits would not bind
+            probability = float(probability)
+        except OverflowError:
+            probability = None
+    if probability is not None and not math.isfinite(probability):
+        probability = None
+    risk = diabetes.get("risk_level")
+    return probability, risk if risk in RISK_LEVELS else None
+ 
+ 
+def record_trends(conn, rows):
+    """Add (patient_id, created_at, result_data) rows to patient_trends on `conn`.
+ 
+    Runs inside the caller's transaction; rows falling on the same day are
+    merged first, so a batch costs one upsert per (patient, day).
+    """
+    deltas = {}
+    for patient_id, created_at, result_data in rows:
+        probability, risk = trend_values(result_data)
+        key = (patient_id, str(created_at)[:10])
+        d = deltas.get(key)
+        if d is None:
+            # results, scored, sum, min, max, small, medium, high
+            d = deltas[key] = [0, 0, 0.0, None, None, 0, 0, 0]
+        d[0] += 1
+        if probability is not None:
+            d[1] += 1
+            d[2] += probability
+            d[3] = probability if d[3] is None else min(d[3], probability)
+            d[4] = probability if d[4] is None else max(d[4], probability)
+        if risk is not None:
+            d[5 + RISK_LEVELS.index(risk)] += 1
+ 
+    conn.executemany(TREND_UPSERT, [(*key, *d) for key, d in deltas.items()])
+ 
+ 
+@timed_query
+def get_patient_trends(patient_id: int, bucket: str = "day"):
+    """Aggregates per period for `bucket` ("day", "week" or "month"), oldest first."""
+    period = TREND_BUCKETS[bucket]
+    with pool.connection() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT {period} AS period, sum(results), sum(scored), sum(probability_sum),
+                   min(probability_min), max(probability_max),
+                   sum(risk_small), sum(risk_medium), sum(risk_high)
+            FROM patient_trends
+            WHERE patient_id = ?
+            GROUP BY period
+            ORDER BY period
+            """,
+            (patient_id,)
+        ).fetchall()
  
     return [
         {
-            "result": json.loads(row[0]),
-            "created_at": row[1]
+            "period": row[0],
+            "results": row[1],
+            "scored": row[2],
+            "probability_sum": row[3],
+            "probability_min": row[4],
+            "probability_max": row[5],
+            "risk_levels": dict(zip(RISK_LEVELS, row[6:9]))
         }
         for row in rows
-    ]
\ No newline at end of file
+    ]
+ 
+ 
+@timed_query
+def backfill_trends(batch_size: int = 10000):
+    """Rebuild patient_trends from every stored result, archived ones included;
+    returns the number of results read.
+ 
+    Runs in a single write transaction, so saves made meanwhile wait for it
+    (up to DB_BUSY_TIMEOUT_MS) instead of being counted twice or lost.
+    """
+    with pool.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM patient_trends")
+        cur = conn.execute(
+            """
+            SELECT patient_id, created_at, result_json, NULL, NULL FROM health_results
+            UNION ALL
+            SELECT patient_id, created_at, NULL, result, dictionary_id FROM health_results_archive
+            """
+        )
+        total = 0
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            load_archive_dictionaries(conn, {row[4] for row in rows})
+            record_trends(conn, [(row[0], row[1], stored_result(*row[2:])) for row in rows])
+            total += len(rows)
+        conn.commit()
+ 
+    return total
+ 
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""Encoders for GET /patient/{id}/results/export.
+
+The endpoint reads a patient's history in keyset-paginated chunks and
+passes each chunk through one of these encoders, so only one chunk is in
+memory at a time and the first rows go out before the last are read.
+Every row is enriched exactly like /patient/{id}/results does it.
+"""
+import csv
+import io
+
+from bulk_scoring import REPORT_SEPARATOR, disease_column
+from medical import ADVICE_FRAGMENTS, DISEASE_RULES, advice_keys_for_result, enriched_result_json
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+CSV_COLUMNS = [
+    "created_at", "model_version", "diabetes_risk", "diabetes_probability",
+    *(disease_column(name) for name in DISEASE_RULES),
+    "report", "advice",
+]
+
+
+def ndjson_chunk(results) -> bytes:
+    """One enriched result per line."""
+    return b"".join(enriched_result_json(r) + b"\n" for r in results)
+
+
+def csv_header() -> bytes:
+    return csv_encode([CSV_COLUMNS])
+
+
+def csv_chunk(results) -> bytes:
+    """One row per result; the advice column lists the advice titles shown in the app."""
+    rows = []
+    for r in results:
+        result = r.get("result", {})
+        diabetes = result.get("diabetes", {})
+        diseases = result.get("diseases_detected", {})
+        advice = [
+            title["result"]
+            for key in advice_keys_for_result(result) if key in ADVICE_FRAGMENTS
+            for title in ADVICE_FRAGMENTS[key].values()
+        ]
+        rows.append([
+            r["created_at"],
+            r.get("model_version") or "",
+            diabetes.get("risk_level", ""),
+            diabetes.get("probability", ""),
+            *(diseases.get(name, {}).get("risk_level", "") for name in DISEASE_RULES),
+            REPORT_SEPARATOR.join(result.get("raport", [])),
+            "; ".join(advice),
+        ])
+    return csv_encode(rows)
+
+
+def csv_encode(rows) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
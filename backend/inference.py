@@ -0,0 +1,169 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import sklearn
+
+# since sklearn 1.4 tree_.value already holds class fractions and
+# predict_proba returns it as-is; older versions normalised the counts
+_SKLEARN_VERSION = tuple(int(p) for p in sklearn.__version__.split(".")[:2])
+LEAF_VALUES_ARE_FRACTIONS = _SKLEARN_VERSION >= (1, 4)
+
+# rows scored per vectorized pass, bounds the (rows, trees, classes) buffer
+CHUNK_SIZE = 4096
+
+# node arrays written by CompiledForest.save, one .npy file each
+ARRAY_NAMES = ("feature", "threshold", "left", "right", "value", "roots", "is_leaf", "classes")
+# saved when present; forests stored before it was added load without it
+OPTIONAL_ARRAY_NAMES = ("cover",)
+
+
+class CompiledForest:
+    """A fitted RandomForestClassifier flattened into packed NumPy arrays.
+
+    All trees share one node table (feature, threshold, left, right, value);
+    `roots` holds the index of each tree's root and leaves point to
+    themselves. Every (row, tree) pair is walked in lockstep, one level per
+    vectorized step, without building a DataFrame or calling sklearn.
+    `cover` (each node's weighted training sample count) is only needed
+    for explanations, see explain.py.
+
+    predict_proba reproduces RandomForestClassifier.predict_proba bit for
+    bit: inputs are compared as float32 against float64 thresholds, and the
+    per-tree probabilities are summed in estimator order.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, n_features, classes,
+                 is_leaf=None, cover=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.n_features = n_features
+        self.classes = classes
+        self.is_leaf = left == np.arange(len(left)) if is_leaf is None else is_leaf
+        self.cover = cover
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        features, thresholds, lefts, rights, values, covers, roots = [], [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            idx = np.arange(n, dtype=np.int64)
+            is_leaf = tree.children_left == -1
+
+            left = np.where(is_leaf, idx, tree.children_left) + offset
+            right = np.where(is_leaf, idx, tree.children_right) + offset
+
+            value = tree.value[:, 0, :].astype(np.float64)
+            if not LEAF_VALUES_ARE_FRACTIONS:
+                normalizer = value.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                value = value / normalizer
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold.astype(np.float64))
+            lefts.append(left)
+            rights.append(right)
+            values.append(value)
+            covers.append(tree.weighted_n_node_samples.astype(np.float64))
+            roots.append(offset)
+
+            offset += n
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts).astype(np.intp),
+            right=np.concatenate(rights).astype(np.intp),
+            value=np.ascontiguousarray(np.concatenate(values)),
+            roots=np.asarray(roots, dtype=np.intp),
+            cover=np.concatenate(covers),
+            max_depth=max_depth,
+            n_features=forest.n_features_in_,
+            classes=np.asarray(forest.classes_),
+        )
+
+    def save(self, directory):
+        """Write the node arrays as .npy files (plus a small JSON header) into `directory`."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in ARRAY_NAMES + OPTIONAL_ARRAY_NAMES:
+            if getattr(self, name) is not None:
+                np.save(directory / f"{name}.npy", np.ascontiguousarray(getattr(self, name)))
+        with open(directory / "forest.json", "w") as f:
+            json.dump({"max_depth": int(self.max_depth), "n_features": int(self.n_features)}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """Load a saved forest; with mmap_mode="r" the arrays stay in the page cache.
+
+        Read-only maps of the same files are shared by every process that
+        loads them, so N workers hold one physical copy of the trees.
+        """
+        directory = Path(directory)
+        with open(directory / "forest.json") as f:
+            header = json.load(f)
+        arrays = {}
+        for name in ARRAY_NAMES + OPTIONAL_ARRAY_NAMES:
+            if name in OPTIONAL_ARRAY_NAMES and not (directory / f"{name}.npy").exists():
+                continue
+            array = np.load(directory / f"{name}.npy", mmap_mode=mmap_mode)
+            # plain ndarray views: indexing an np.memmap wraps every result
+            arrays[name] = array.view(np.ndarray) if isinstance(array, np.memmap) else array
+        return cls(**arrays, **header)
+
+    def _prepare(self, X):
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected an array of shape (n, {self.n_features}), got {X.shape}")
+        # sklearn evaluates splits on float32 inputs
+        return X.astype(np.float32).astype(np.float64)
+
+    def _apply(self, X):
+        n = X.shape[0]
+        flat = X.ravel()
+        row_offset = np.repeat(np.arange(n, dtype=np.intp) * self.n_features, self.n_trees)
+        nodes = np.tile(self.roots, n)
+
+        # walk only the (row, tree) pairs that have not reached a leaf yet
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        while active.size:
+            current = nodes[active]
+            go_left = flat[row_offset[active] + self.feature[current]] <= self.threshold[current]
+            current = np.where(go_left, self.left[current], self.right[current])
+            nodes[active] = current
+            active = active[~self.is_leaf[current]]
+
+        return nodes.reshape(n, self.n_trees)
+
+    def apply(self, X):
+        """Global leaf index reached in every tree, shape (n, n_trees)."""
+        return self._apply(self._prepare(X))
+
+    def predict_proba(self, X):
+        X = self._prepare(X)
+        out = np.empty((X.shape[0], len(self.classes)), dtype=np.float64)
+
+        for start in range(0, X.shape[0], CHUNK_SIZE):
+            chunk = X[start:start + CHUNK_SIZE]
+            leaf_values = self.value[self._apply(chunk)]
+            # cumsum adds trees left to right, the same order as sklearn
+            out[start:start + CHUNK_SIZE] = np.cumsum(leaf_values, axis=1)[:, -1]
+
+        out /= self.n_trees
+        return out
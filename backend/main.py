@@ -1,26 +1,103 @@
-from fastapi import FastAPI, Depends, HTTPException
-from pydantic import BaseModel, Field, EmailStr
+from fastapi import FastAPI, Depends, HTTPException, Request, Header
+from pydantic import BaseModel, Field, EmailStr, conlist
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import datetime, timedelta
 import jwt
-from fastapi import Body
- 
+import hashlib
+import logging
+import secrets
+import threading
+import time
+from fastapi import Body, Query
+from typing import Any, Dict, List, Literal, NamedTuple, Optional
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+import asyncio
+ 
+import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
  
-from database import (
-    register_patient, login_patient, save_health_result, 
-    get_patient_results, get_patient_info
+from config import (
+    PREDICT_BATCH_MAX_SIZE, PREDICT_BATCHING_ENABLED,
+    PREDICT_BATCHING_MAX_SIZE, PREDICT_BATCHING_WINDOW_MS, INFERENCE_ENGINE,
+    INFERENCE_COMPILED_MAX_ROWS, PREDICTION_CACHE_ENABLED, PREDICTION_CACHE_SIZE,
+    MODEL_EXECUTOR_WORKERS, RESULTS_PAGE_MAX_SIZE, JWT_SECRET_KEY,
+    TOKEN_CACHE_ENABLED, TOKEN_CACHE_SIZE, METRICS_ENABLED, PROFILING_ENABLED,
+    PROFILE_DIR, PROFILE_INTERVAL_MS, WRITE_BEHIND_ENABLED, WRITE_BEHIND_QUEUE_SIZE,
+    WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_MS, WRITE_BEHIND_ACK, ADMIN_TOKEN,
+    MODEL_REGISTRY_POLL_S, DATASET_PATH, RESULTS_EXPORT_CHUNK_SIZE, ADMISSION_ENABLED,
+    ADMISSION_MAX_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT_MS, ADMISSION_RETRY_AFTER_S,
+    EXPLAIN_ENABLED, EXPLAIN_BATCH_MAX_SIZE, PERCENTILES_ENABLED, PERCENTILE_AGE_BAND_YEARS,
+    PERCENTILE_MIN_BAND_SIZE, PERCENTILE_BY_OUTCOME, MAINTENANCE_INTERVAL_S,
+    TOKEN_REVOCATION_POLL_S
+)
+from inference import CompiledForest
+from explain import ForestExplainer
+from percentiles import PercentileIndex, load_stored as load_stored_percentiles, store as store_percentiles
+from cache import LRUCache
+from batching import PredictionBatcher
+from admission import AdmissionController, Disconnected, Overloaded
+from model_registry import ModelRegistry, RegistryError
+from maintenance import Maintenance
+from serialization import dumps, dumps_str, FastJSONResponse, EncodedJSONResponse
+from medical import (
+    analyze_health, generate_medical_report, build_frontend_report, get_risk_label,
+    analyze_health_batch, generate_medical_reports,
+    enriched_results_json
 )
+from database import close_pool, save_health_results, login_cache, profile_cache
+from write_behind import WriteBehindQueue, QueueFull
+import export
+import model_store
+import async_database as db
+import metrics
+from metrics import MetricsMiddleware, stage
+ 
+logger = logging.getLogger(__name__)
  
 # FASTAPI SETUP
+@asynccontextmanager
+async def lifespan(app):
+    if batcher is not None:
+        batcher.start()
+    if write_queue is not None:
+        write_queue.start()
+    watcher = None
+    if MODEL_REGISTRY_POLL_S > 0:
+        watcher = asyncio.create_task(watch_model_registry())
+    maintainer = None
+    if maintenance is not None:
+        maintainer = asyncio.create_task(run_maintenance())
+    revocations = None
+    if token_cache is not None and TOKEN_REVOCATION_POLL_S > 0:
+        revocations = asyncio.create_task(watch_revocations())
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    if maintainer is not None:
+        maintainer.cancel()
+    if revocations is not None:
+        revocations.cancel()
+    if batcher is not None:
+        await batcher.stop()
+    if write_queue is not None:
+        # everything acknowledged is committed before the pool closes
+        await run_in_threadpool(write_queue.stop)
+    model_executor.shutdown(wait=True)
+    db.shutdown()
+    close_pool()
+ 
+ 
 app = FastAPI(
     title="Diabetes Prediction API",
     description="Backend ML - Random Forest",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
  
 app.add_middleware(
@@ -28,20 +105,97 @@ app.add_middleware(
     allow_origins=["http://localhost:5173"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Profile-File"],
 )
  
+# per-route counts and latency for /metrics; outermost, so it times the whole stack
+if METRICS_ENABLED:
+    app.add_middleware(
+        MetricsMiddleware,
+        profile_dir=PROFILE_DIR if PROFILING_ENABLED else None,
+        profile_interval=PROFILE_INTERVAL_MS / 1000
+    )
+ 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
  
+# opt-in scheduled archival, incremental vacuum and ANALYZE (see maintenance.py)
+maintenance = Maintenance() if MAINTENANCE_INTERVAL_S > 0 else None
+ 
+# opt-in group commit of /save-result writes
+write_queue = None
+if WRITE_BEHIND_ENABLED:
+    write_queue = WriteBehindQueue(
+        save_health_results,
+        max_queue_size=WRITE_BEHIND_QUEUE_SIZE,
+        max_batch_size=WRITE_BEHIND_BATCH_SIZE,
+        max_wait_ms=WRITE_BEHIND_FLUSH_MS
+    )
+ 
 # JWT SETTINGS
-SECRET_KEY = "secretkey"
+SECRET_KEY = JWT_SECRET_KEY
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 12  # 12 hours
  
+# verified claims keyed by token digest, so a token reused for hours is
+# signature-checked once; entries expire with the token's own exp claim
+token_cache = LRUCache(TOKEN_CACHE_SIZE) if TOKEN_CACHE_ENABLED else None
+# digest -> exp of revoked tokens; /logout records them in the database, and
+# watch_revocations copies the ones other workers recorded
+revoked_tokens = {}
+revoked_lock = threading.Lock()
  
+
 # AUTHENTICATION UTILITIES
-def get_current_user(token: str = Depends(oauth2_scheme)):
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+ 
+
+def remember_revoked(revocations):
+    """Add (digest, exp) pairs to revoked_tokens and drop them from the claims cache."""
+    now = time.time()
+    with revoked_lock:
+        # revocations only need to outlive the token itself
+        for d, exp in list(revoked_tokens.items()):
+            if exp <= now:
+                del revoked_tokens[d]
+        revoked_tokens.update(revocations)
+    if token_cache is not None:
+        for digest, _ in revocations:
+            token_cache.pop(digest)
+ 
+
+async def revoke_token(token: str):
+    payload = jwt.decode(token, options={"verify_signature": False})
+    digest = token_digest(token)
+    expires_at = payload.get("exp", time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    await db.revoke_token(digest, expires_at)
+    remember_revoked([(digest, expires_at)])
+ 
+
+async def verify_token(token: str):
+    digest = token_digest(token)
+    if digest in revoked_tokens:
+        raise HTTPException(status_code=401, detail="Token revoked")
+ 
+    payload = token_cache.get(digest) if token_cache is not None else None
+    if payload is not None:
+        return payload
+ 
+    payload = decode_jwt(token)
+    # revoked by another worker: checked here on a cache miss, and picked up by
+    # watch_revocations for tokens already cached
+    if await db.is_token_revoked(digest):
+        remember_revoked([(digest, payload.get("exp", time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60))])
+        raise HTTPException(status_code=401, detail="Token revoked")
+    # tokens without exp are verified every time
+    if token_cache is not None and "exp" in payload:
+        token_cache.set(digest, payload, expires_at=payload["exp"])
+    return payload
+ 
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
-        payload = decode_jwt(token)
+        payload = await verify_token(token)
         user_id = payload.get("patient_id")
         if not user_id:
             raise HTTPException(status_code=401)
@@ -67,123 +221,121 @@ def decode_jwt(token: str):
  
  
 # ML MODEL SETUP
-data = pd.read_csv("diabetes.csv")
-X = data.drop("Outcome", axis=1)
-y = data["Outcome"]
+# trained versions live in the model registry (see model_registry.py); the
+# active one is swapped in by set_model, without a restart
+class ServingModel(NamedTuple):
+    model: Any
+    engine: Optional[CompiledForest]
+    metadata: dict
+    features: list
+    version: Optional[str]
+    explainer: Optional[ForestExplainer]
+    percentiles: Optional[PercentileIndex]
+ 
+ 
+# requests read `serving` once, so a swap never mixes two versions in one response
+serving = None
+model = model_metadata = FEATURES = engine = None
+ 
+# the forest is deterministic, so repeated parameter sets reuse the response
+prediction_cache = LRUCache(PREDICTION_CACHE_SIZE) if PREDICTION_CACHE_ENABLED else None
+ 
+ 
+def load_percentiles(metadata):
+    # the population the model was trained on; if that file is gone, only the
+    # percentiles are lost, not the model swap
+    path = metadata.get("dataset") or DATASET_PATH
+    try:
+        if registry.mmap:
+            # stored with the version when it was trained and memory-mapped like
+            # the forest, so a worker never reads the dataset
+            artifact = model_store.artifact_path(metadata["key"], registry.model_dir)
+            index = load_stored_percentiles(artifact)
+            if index is None:
+                # versions trained before the index was stored with them, once each
+                store_percentiles(path, metadata["features"], artifact)
+                index = load_stored_percentiles(artifact)
+            return index
+        return PercentileIndex.from_csv(
+            path, metadata["features"],
+            age_band_years=PERCENTILE_AGE_BAND_YEARS,
+            min_band_size=PERCENTILE_MIN_BAND_SIZE,
+            by_outcome=PERCENTILE_BY_OUTCOME
+        )
+    except (OSError, KeyError, ValueError):
+        logger.exception("Could not build the percentile index from %s", path)
+        return None
+ 
+ 
+def set_model(new_model, metadata):
+    global serving, model, model_metadata, FEATURES, engine
+ 
+    if isinstance(new_model, CompiledForest):
+        # MODEL_MMAP_ENABLED: memory-mapped arrays shared by all workers, no sklearn model
+        new_model, new_engine = None, new_model
+    else:
+        # trees flattened into NumPy arrays; same probabilities as model.predict_proba
+        # without the per-call DataFrame and sklearn validation overhead
+        new_engine = CompiledForest.from_sklearn(new_model) if INFERENCE_ENGINE == "compiled" else None
+ 
+    # per-leaf TreeSHAP tables for ?explain=true, built once per loaded model
+    new_explainer = None
+    if EXPLAIN_ENABLED:
+        new_explainer = ForestExplainer(new_engine or CompiledForest.from_sklearn(new_model))
+    new_percentiles = load_percentiles(metadata) if PERCENTILES_ENABLED else None
+ 
+    serving = ServingModel(
+        new_model, new_engine, metadata, metadata["features"], metadata.get("version"),
+        new_explainer, new_percentiles
+    )
+    model, model_metadata, engine = new_model, metadata, new_engine
+    FEATURES = metadata["features"]
  
-X_train, _, y_train, _ = train_test_split(
-    X, y, test_size=0.2, random_state=42
-)
+    if prediction_cache is not None:
+        prediction_cache.clear()
  
-model = RandomForestClassifier(
-    n_estimators=100,
-    random_state=42
-)
-model.fit(X_train, y_train)
- 
-# DISEASE NORMS
-DISEASE_NORMS = {
-    "Diabetes": ["Glucose"],
-    "Obesity": ["BMI", "SkinThickness"],
-    "Hypertension": ["BloodPressure", "BMI"],
-    "Metabolic Syndrome": ["Glucose", "Insulin", "BMI"]
-}
  
-# MEDICAL LOGIC
-FEATURE_INFO = {
-    "Pregnancies": {"name": "Number of Pregnancies", "min": 0, "max": 15},
-    "Glucose": {"name": "Fasting Glucose (mg/dL)", "min": 70, "max": 99, "warning": 126, "critical": 200},
-    "BloodPressure": {"name": "Diastolic Blood Pressure (mmHg)", "min": 60, "max": 80, "warning": 90, "critical": 120},
-    "SkinThickness": {"name": "Skin Fold Thickness (mm)", "min": 10, "max": 30},
-    "Insulin": {"name": "Insulin Level (µU/mL)", "min": 2, "max": 25, "warning": 100},
-    "BMI": {"name": "Body Mass Index", "min": 18.5, "max": 24.9, "warning": 30, "critical": 35},
-    "DiabetesPedigreeFunction": {"name": "Diabetes Pedigree Function","min": 0.0,"max": 0.8},
-    "Age": {"name": "Age (years)", "min": 0, "max": 120}
-}
+registry = ModelRegistry()
+registry.add_listener(set_model)
+registry.startup()
  
-# MEDICAL UI ADVICE
-MEDICAL_UI_ADVICE = {
-    "Diabetes": {
-        "small": {
-            "title": "Low diabetes risk",
-            "how_to_cure": "Maintaining a healthy lifestyle helps prevent future risk. Eat balanced meals (low sugar, high fiber). Exercise at least 30 min/day. Avoid sugary drinks. Keep weight under control. ",
-            "warning": "Still monitor your diet and lifestyle to prevent future risk.",
-            "movies": ["https://www.youtube.com/watch?v=rMMpeLLgdgY"]
-            },
-        "medium": {
-            "title": "Moderate diabetes risk", 
-            "how_to_cure": "Monitor glucose levels and reduce sugar intake. Check fasting glucose regularly. Reduce refined carbs and sugar, Increase physical activity, Consider medical check-up",
-            "warning": "If symptoms appear, consult a doctor.",
-            "movies": ["https://www.youtube.com/watch?v=rMMpeLLgdgY"]
-            },
-        "high": {
-            "title": "High diabetes risk", 
-            "how_to_cure": "Medical consultation is strongly recommended. Schedule medical check-up. Monitor blood glucose daily. Start a structured diet plan. Consider medication if prescribed.",
-            "warning": "Do not ignore symptoms like excessive thirst, frequent urination, or fatigue.",
-            "movies": ["https://www.youtube.com/watch?v=rMMpeLLgdgY"],
-            }
-    },
-    "Obesity": {
-        "small": {
-            "title": "Normal weight",
-            "how_to_cure": "Maintain healthy lifestyle to prevent weight gain. Keep balanced diet. Exercise regularly. Avoid overeating. Track weight monthly.",
-            "warning": "Avoid quick weight gain; monitor BMI.",
-            "movies": ["https://www.youtube.com/watch?v=VgL8bIlbklQ"]
-            },
-        "medium": {
-            "title": "Obesity detected", 
-            "how_to_cure": "Lifestyle changes can significantly improve health. Reduce calorie intake. Increase physical activity. Avoid processed foods. Consider professional dietician support",
-            "warning": "Obesity increases risk of diabetes, hypertension, and heart disease.",
-            "movies": ["https://www.youtube.com/watch?v=VgL8bIlbklQ"]
-            },
-        "high": {
-            "title": "Severe obesity", 
-            "how_to_cure": "Professional medical consultation is advised. Consider structured weight loss program. Check for metabolic syndrome",
-            "warning": "Severe obesity is associated with high risk of complications.",
-            "movies": ["https://www.youtube.com/watch?v=VgL8bIlbklQ"]
-            }
-    },
-    "Hypertension": {
-        "small": {
-            "title": "Normal blood pressure",
-            "how_to_cure": "Reduce salt intake. Exercise regularly. Maintain healthy weight. Limit alcohol consumption.",
-            "warning": "Monitor blood pressure periodically.",
-            "movies": ["https://www.youtube.com/watch?v=rI-ktNcbi7M"]
-        },
-        "medium": {
-            "title": "Elevated blood pressure", 
-            "how_to_cure": "Reduce salt intake and manage stress. Increase physical activity. Monitor blood pressure regularly",
-            "warning": "If blood pressure remains high, consult a doctor.",
-            "movies": ["https://www.youtube.com/watch?v=rI-ktNcbi7M"]
-            },
-        "high": {
-            "title": "High blood pressure", 
-            "how_to_cure": "Medical evaluation is recommended. Avoid alcohol and smoking. Monitor blood pressure daily. Follow prescribed treatment plan.",
-            "warning": "High BP increases risk of heart attack and stroke.",
-            "movies": ["https://www.youtube.com/watch?v=rI-ktNcbi7M"]
-            }
-    },
-    "Metabolic Syndrome": {
-        "small": {
-            "title": "Low metabolic risk",
-            "how_to_cure": "Balanced diet. Regular exercise. Avoid sugary drinks. Maintain normal weight",
-            "warning": "Monitor your health periodically.",
-            "movies": ["https://www.youtube.com/watch?v=J-o6tRZ2n8o"]
-        },
-        "medium": {
-            "title": "Metabolic risk detected", 
-            "how_to_cure": "Lifestyle modification is recommended. Reduce sugar and refined carbs. Maintain healthy weight. Consider medical consultation.",
-            "warning": "Metabolic syndrome increases risk of diabetes and cardiovascular disease.",
-            "movies": ["https://www.youtube.com/watch?v=J-o6tRZ2n8o"]
-            },
-        "high": {
-            "title": "High metabolic risk", 
-            "how_to_cure": "Consult a healthcare professional. Check blood glucose and lipid profile. Follow structured diet and exercise plan.",
-            "warning": "High metabolic risk increases chances of diabetes and heart disease.",
-            "movies": ["https://www.youtube.com/watch?v=J-o6tRZ2n8o"]
-            }
-    }
-}
+ 
+async def watch_model_registry():
+    # picks up versions activated by another worker or by manage.py
+    while True:
+        await asyncio.sleep(MODEL_REGISTRY_POLL_S)
+        try:
+            await run_in_threadpool(registry.poll)
+        except Exception:
+            logger.exception("Could not reload the model registry")
+ 
+ 
+async def watch_revocations():
+    # tokens revoked through other workers; this one's own are applied at once
+    seen = 0
+    while True:
+        try:
+            rows = await db.revoked_tokens_since(seen)
+            if rows:
+                seen = rows[-1][0]
+                remember_revoked([(digest, expires_at) for _, digest, expires_at in rows])
+        except Exception:
+            logger.exception("Could not read revoked tokens")
+        await asyncio.sleep(TOKEN_REVOCATION_POLL_S)
+ 
+
+async def run_maintenance():
+    # every worker runs it; moving the same rows twice is harmless (see maintenance.py)
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL_S)
+        try:
+            report = await run_in_threadpool(maintenance.run)
+            logger.info(
+                "Maintenance: archived %d results, released %d pages in %.1fs",
+                report["archive"]["results"], report["vacuum"]["pages"], report["duration_s"]
+            )
+        except Exception:
+            logger.exception("Maintenance run failed")
  
 # MODELS
 class PatientData(BaseModel):
@@ -197,6 +349,12 @@ class PatientData(BaseModel):
     Age: int = Field(ge=1, le=120)
  
  
+class PatientBatch(BaseModel):
+    # either a list of patients or a columnar payload {"Glucose": [...], ...}
+    patients: Optional[List[PatientData]] = Field(None, max_length=PREDICT_BATCH_MAX_SIZE)
+    columns: Optional[Dict[str, conlist(float, max_length=PREDICT_BATCH_MAX_SIZE)]] = None
+ 
+ 
 class RegisterRequest(BaseModel):
     email: EmailStr
     password: str = Field(min_length=8)
@@ -215,131 +373,287 @@ class SaveResultRequest(BaseModel):
     diabetes: dict
     diseases_detected: dict
     raport: list
+    model_version: Optional[str] = None
  
-def get_norms_for_disease(disease_name, norms):
-    params = DISEASE_NORMS.get(disease_name, [])
-    return {p: norms[p] for p in params}
- 
-def get_norms():
-    norms = {}
-    for k, v in FEATURE_INFO.items():
-        norms[k] = f"{v['min']} - {v['max']}"
-    return norms
- 
-def analyze_health(patient_dict):
-    diseases = {}
- 
-    glucose = patient_dict["Glucose"]
-    insulin = patient_dict["Insulin"]
-    bmi = patient_dict["BMI"]
-    age = patient_dict["Age"]
-    bp = patient_dict["BloodPressure"]
-    skin = patient_dict["SkinThickness"]
- 
-    # OBESITY
-    diseases["Obesity"] = {
-        "risk_level": "high" if bmi >= 35 else "medium" if bmi >= 30 else "small"
-    }
  
-    # HYPERTENSION
-    diseases["Hypertension"] = {
-        "risk_level": "high" if bp > 120 else "medium" if bp > 90 else "small"
-    }
+class RetrainRequest(BaseModel):
+    # a newer export in the diabetes.csv format; defaults to DATASET_PATH
+    dataset_path: Optional[str] = None
+    activate: bool = True
  
-    # METABOLIC SYNDROME
-    metabolic_flags = 0
-    if glucose > 100:
-        metabolic_flags += 1
-    if insulin > 100:
-        metabolic_flags += 1
-    if bmi > 30:
-        metabolic_flags += 1
- 
-    diseases["Metabolic Syndrome"] = {
-        "risk_level": "high" if metabolic_flags >= 3 else "medium" if metabolic_flags >= 2 else "small"
-    }
+# SCORING
+# bounds and integer fields of PatientData, used to validate columnar batches
+PATIENT_SCHEMA = PatientData.schema()["properties"]
+INT_FEATURES = {k for k, v in PATIENT_SCHEMA.items() if v.get("type") == "integer"}
  
-    return diseases
  
-def build_frontend_report(diseases, diabetes_risk, norms):
-    result = []
+def predict_probabilities(X, current=None):
+    """Diabetes probability (%) for every row of a (n, len(FEATURES)) array."""
+    current = current or serving
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    # sklearn's Cython tree walk wins again on large batches
+    if current.model is None or (current.engine is not None and len(X) <= INFERENCE_COMPILED_MAX_ROWS):
+        return current.engine.predict_proba(X)[:, 1] * 100
+    return current.model.predict_proba(pd.DataFrame(X, columns=current.features))[:, 1] * 100
  
-    # diabetes
-    diab = MEDICAL_UI_ADVICE["Diabetes"][diabetes_risk]
-    result.append({
-        "diabetes": {
-            "result": diab["title"],
-            "medical_advices": diab["warning"],
-            "how_to_cure": diab["how_to_cure"],
-            "movies": diab["movies"],
-            "norm": get_norms_for_disease("Diabetes", norms)
+ 
+# CPU-bound scoring runs here, away from the event loop and the threadpool
+# FastAPI uses for sync endpoints and dependencies
+model_executor = ThreadPoolExecutor(
+    max_workers=MODEL_EXECUTOR_WORKERS, thread_name_prefix="model"
+)
+ 
+ 
+def explain_rows(X, current=None):
+    """Per-feature contributions (percentage points) to the probability of every row."""
+    current = current or serving
+    expected_value, contributions = current.explainer.explain(X)
+    return [
+        {
+            # base_value + sum(contributions) == probability, up to rounding
+            "base_value": round(expected_value * 100, 2),
+            "contributions": {f: round(c * 100, 2) for f, c in zip(current.features, row)},
         }
-    })
- 
-    # other diseases
-    for name, info in diseases.items():
-        risk = info["risk_level"]
-        advice = MEDICAL_UI_ADVICE[name][risk]
- 
-        result.append({
-            name: {
-                "result": advice["title"],
-                "medical_advices": advice["warning"],
-                "how_to_cure": advice["how_to_cure"],
-                "movies": advice["movies"],
-                "norm": get_norms_for_disease(name, norms)
-            }
-        })
+        for row in contributions.tolist()
+    ]
  
-    return result
  
-# MEDICAL REPORT GENERATION
-def generate_medical_report(patient_dict):
-    report = []
-    for key, value in patient_dict.items():
-        info = FEATURE_INFO[key]
-        if value < info["min"]:
-            report.append(f"{info['name']} IS TOO LOW ({value}) – NORM: {info['min']}–{info['max']}")
-        elif value > info["max"]:
-            report.append(f"{info['name']} IS TOO HIGH ({value}) – NORM: {info['min']}–{info['max']}")
+async def run_model(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(model_executor, fn, *args)
  
-    if not report:
-        report.append("All parameters are within the norm.")
  
-    return report
+# opt-in coalescing of concurrent /predict calls into one vectorized call
+batcher = None
+if PREDICT_BATCHING_ENABLED:
+    batcher = PredictionBatcher(
+        predict_probabilities,
+        max_batch_size=PREDICT_BATCHING_MAX_SIZE,
+        max_wait_ms=PREDICT_BATCHING_WINDOW_MS,
+        executor=model_executor
+    )
  
-# ENDPOINTS
-@app.post("/predict")
-def predict(data: PatientData):
-    patient_dict = data.dict()
-    patient_df = pd.DataFrame([patient_dict])
+# bounded concurrency and wait queue in front of scoring, so a spike gets
+# fast 503s instead of an ever-growing latency and the rest of the API
+# keeps its share of the CPU
+admission = None
+if ADMISSION_ENABLED:
+    admission = AdmissionController(
+        max_concurrency=ADMISSION_MAX_CONCURRENCY or MODEL_EXECUTOR_WORKERS * (
+            PREDICT_BATCHING_MAX_SIZE if PREDICT_BATCHING_ENABLED else 1
+        ),
+        max_queue=ADMISSION_MAX_QUEUE
+    )
  
-    probability = model.predict_proba(patient_df)[0][1] * 100
  
-    if probability >= 70:
-        risk_label = "high"
-    elif probability >= 40:
-        risk_label = "medium"
-    else:
-        risk_label = "small"
+@asynccontextmanager
+async def model_slot(request: Request):
+    """Hold an admission slot around model scoring (no-op when disabled)."""
+    if admission is None:
+        yield
+        return
  
-    diseases_analysis = analyze_health(patient_dict)
-    norms = get_norms()
+    # the wait budget counts from the request's arrival
+    arrived = request.scope.get("state", {}).get("request_start") or time.perf_counter()
+    try:
+        await admission.acquire(arrived + ADMISSION_MAX_WAIT_MS / 1000, request.receive)
+    except Overloaded:
+        raise HTTPException(
+            status_code=503, detail="Server busy, try again shortly",
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER_S)}
+        )
+    except Disconnected:
+        # nobody reads the response; the status labels it in logs and metrics
+        raise HTTPException(status_code=499, detail="Client closed request")
+    try:
+        yield
+    finally:
+        admission.release()
  
-    return {
+ 
+def build_prediction(patient_dict, probability, model_version=None, explanation=None, percentiles=None):
+    with stage("analyze_health"):
+        diseases_analysis = analyze_health(patient_dict)
+ 
+    with stage("report"):
+        raport = generate_medical_report(patient_dict)
+        prediction = assemble_prediction(
+            probability, diseases_analysis, raport, model_version, explanation, percentiles
+        )
+    return prediction
+ 
+ 
+def assemble_prediction(probability, diseases_analysis, raport, model_version=None, explanation=None,
+                        percentiles=None):
+    risk_label = get_risk_label(probability)
+    prediction = {
         "diabetes": {
             "risk_level": risk_label,
             "probability": round(probability, 1),
             "description": "Type 2 Diabetes Mellitus"
         },
         "diseases_detected": diseases_analysis,
-        "raport": generate_medical_report(patient_dict),
-        "ui_advice": build_frontend_report(diseases_analysis, risk_label, norms)
+        "raport": raport,
+        "ui_advice": build_frontend_report(diseases_analysis, risk_label),
+        "model_version": model_version
     }
+    if percentiles is not None:
+        prediction["percentiles"] = percentiles
+    if explanation is not None:
+        prediction["explanation"] = explanation
+    return prediction
+ 
+ 
+def prediction_cache_key(row, version, explain=False):
+    # the version keeps a response computed by a replaced model out of the cache
+    return (version, explain) + tuple(row)
+ 
+ 
+def columns_to_matrix(columns):
+    """Validate a columnar payload against PatientData and return it as an array."""
+    missing = [f for f in FEATURES if f not in columns]
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Missing columns: {', '.join(missing)}")
+ 
+    lengths = {len(columns[f]) for f in FEATURES}
+    if len(lengths) != 1:
+        raise HTTPException(status_code=422, detail="All columns must have the same length")
+ 
+    X = np.column_stack([np.asarray(columns[f], dtype=np.float64) for f in FEATURES])
+ 
+    for j, f in enumerate(FEATURES):
+        col = X[:, j]
+        rules = PATIENT_SCHEMA[f]
+        bad = ~np.isfinite(col)
+        if "minimum" in rules:
+            bad |= col < rules["minimum"]
+        if "maximum" in rules:
+            bad |= col > rules["maximum"]
+        if f in INT_FEATURES:
+            bad |= col != np.round(col)
+        if bad.any():
+            row = int(np.argmax(bad))
+            raise HTTPException(status_code=422, detail=f"Invalid value for {f} in row {row}")
+ 
+    return X
+ 
+ 
+# ENDPOINTS
+@app.post("/predict")
+async def predict(data: PatientData, request: Request, explain: bool = False):
+    # body parsing and pydantic validation happen before the handler runs
+    request_start = request.scope.get("state", {}).get("request_start")
+    if request_start is not None:
+        metrics.PREDICT_STAGE.labels("validation").observe(time.perf_counter() - request_start)
+ 
+    current = serving
+    if explain and current.explainer is None:
+        raise HTTPException(status_code=400, detail="Explanations are disabled")
+    with stage("vectorize"):
+        patient_dict = data.dict()
+        row = [patient_dict[f] for f in current.features]
+ 
+    # responses are cached already serialized
+    cache_key = prediction_cache_key(row, current.version, explain)
+    if prediction_cache is not None:
+        cached = prediction_cache.get(cache_key)
+        if cached is not None:
+            return EncodedJSONResponse(cached)
+ 
+    async with model_slot(request):
+        with stage("predict_proba"):
+            if batcher is not None:
+                # scored with `current` too, so the response and its cache entry
+                # carry the version that produced them, even across a swap
+                probability = await batcher.submit(row, current)
+            else:
+                X = np.array([row], dtype=np.float64)
+                probability = (await run_model(predict_probabilities, X, current))[0]
+ 
+        explanation = None
+        if explain:
+            with stage("explain"):
+                explanation = (await run_model(explain_rows, [row], current))[0]
+ 
+    percentiles = None
+    if current.percentiles is not None:
+        with stage("percentiles"):
+            percentiles = current.percentiles.lookup([row])[0]
+ 
+    prediction = build_prediction(patient_dict, probability, current.version, explanation, percentiles)
+    with stage("serialize"):
+        body = dumps(prediction)
+    if prediction_cache is not None:
+        prediction_cache.set(cache_key, body)
+    return EncodedJSONResponse(body)
+ 
+ 
+def score_batch(X, explain=False):
+    current = serving
+    results = [None] * len(X)
+    keys = [prediction_cache_key(row, current.version, explain) for row in X.tolist()]
+    if prediction_cache is not None:
+        results = [prediction_cache.get(key) for key in keys]
+    missing = [i for i, r in enumerate(results) if r is None]
+ 
+    if missing:
+        # one vectorized call for every row not served from the cache
+        probabilities = predict_probabilities(X[missing], current)
+        # the rule table is evaluated for all of those rows at once too
+        analyses = analyze_health_batch(X[missing], current.features)
+        reports = generate_medical_reports(X[missing], current.features, INT_FEATURES)
+        explanations = explain_rows(X[missing], current) if explain else [None] * len(missing)
+        percentiles = (
+            current.percentiles.lookup(X[missing]) if current.percentiles is not None
+            else [None] * len(missing)
+        )
+ 
+        for i, probability, diseases_analysis, raport, explanation, ranks in zip(
+            missing, probabilities, analyses, reports, explanations, percentiles
+        ):
+            results[i] = dumps(assemble_prediction(
+                probability, diseases_analysis, raport, current.version, explanation, ranks
+            ))
+            if prediction_cache is not None:
+                prediction_cache.set(keys[i], results[i])
+ 
+    # rows are serialized one by one so they can be cached and shared with /predict
+    return b"[" + b",".join(results) + b"]"
+ 
+ 
+@app.post("/predict/batch")
+async def predict_batch(data: PatientBatch, request: Request, explain: bool = False):
+    if (data.patients is None) == (data.columns is None):
+        raise HTTPException(status_code=422, detail="Provide either 'patients' or 'columns'")
+    if explain and serving.explainer is None:
+        raise HTTPException(status_code=400, detail="Explanations are disabled")
+ 
+    if data.patients is not None:
+        size = len(data.patients)
+    else:
+        size = max((len(v) for v in data.columns.values()), default=0)
+    if explain and size > EXPLAIN_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large to explain (max {EXPLAIN_BATCH_MAX_SIZE} patients)"
+        )
+    if size == 0:
+        return []
+ 
+    if data.patients is not None:
+        X = np.array(
+            [[getattr(p, f) for f in FEATURES] for p in data.patients], dtype=np.float64
+        )
+    else:
+        X = columns_to_matrix(data.columns)
+ 
+    async with model_slot(request):
+        body = await run_model(score_batch, X, explain)
+    return EncodedJSONResponse(body)
  
 @app.post("/register")
-def register(data: RegisterRequest):
-    result = register_patient(
+async def register(data: RegisterRequest):
+    result = await db.register_patient(
         data.email,
         data.password,
         data.first_name,
@@ -350,8 +664,8 @@ def register(data: RegisterRequest):
  
  
 @app.post("/login")
-def login(data: OAuth2PasswordRequestForm = Depends()):
-    login_res = login_patient(data.username, data.password)
+async def login(data: OAuth2PasswordRequestForm = Depends()):
+    login_res = await db.login_patient(data.username, data.password)
  
     if login_res["status"] != "ok":
         raise HTTPException(status_code=401, detail=login_res["message"])
@@ -367,93 +681,182 @@ def login(data: OAuth2PasswordRequestForm = Depends()):
  
  
 @app.get("/patient/{patient_id}")
-def get_patient(patient_id: int, user_id=Depends(get_current_user)):
+async def get_patient(patient_id: int, user_id=Depends(get_current_user)):
     if patient_id != user_id:
         raise HTTPException(status_code=403)
-    return get_patient_info(patient_id)
+    return await db.get_patient_info(patient_id)
  
  
  
 @app.post("/save-result")
-def save_result(data: SaveResultRequest, user_id: int = Depends(get_current_user)):
+async def save_result(data: SaveResultRequest, user_id: int = Depends(get_current_user)):
     if data.patient_id != user_id:
         raise HTTPException(status_code=403, detail="Access denied")
+    # the version comes from the client's /predict response; only registered ones are stored
+    if data.model_version is not None and not registry.is_known(data.model_version):
+        raise HTTPException(status_code=422, detail="Unknown model version")
+ 
+    result_data = {
+        "diabetes": data.diabetes,
+        "diseases_detected": data.diseases_detected,
+        "raport": data.raport
+    }
+    try:
+        # encoded as it will be stored, so it is rejected here rather than failing
+        # at commit, possibly in someone else's batch
+        dumps_str(result_data)
+    except (TypeError, ValueError, RecursionError):
+        raise HTTPException(status_code=422, detail="Result cannot be stored as JSON")
+    if write_queue is None:
+        return await db.save_health_result(data.patient_id, result_data, data.model_version)
  
-    result = save_health_result(
-        data.patient_id,
-        {
-            "diabetes": data.diabetes,
-            "diseases_detected": data.diseases_detected,
-            "raport": data.raport
-        }
-    )
-    return result
+    try:
+        committed = write_queue.submit((data.patient_id, result_data, data.model_version))
+    except QueueFull:
+        raise HTTPException(
+            status_code=503, detail="Too many pending saves, try again shortly",
+            headers={"Retry-After": "1"}
+        )
+    if WRITE_BEHIND_ACK == "queued":
+        return {"status": "ok", "message": "Result queued"}
+    await asyncio.wrap_future(committed)
+    return {"status": "ok", "message": "Result saved"}
  
 @app.get("/patient/{patient_id}/results")
-def get_results(patient_id: int, user_id: int = Depends(get_current_user)):
+async def get_results(
+    patient_id: int,
+    limit: Optional[int] = Query(None, ge=1, le=RESULTS_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    include_archived: bool = False,
+    user_id: int = Depends(get_current_user)
+):
     if patient_id != user_id:
         raise HTTPException(status_code=403)
  
-    results = get_patient_results(patient_id) or []
-    norms = get_norms()
- 
-    enriched_results = []
-    for r in results:
-        result_data = r.get("result", {})
-        diabetes = result_data.get("diabetes", {})
-        diseases = result_data.get("diseases_detected", {})
- 
-        ui_advice = []
- 
-        diabetes_risk = diabetes.get("risk_level")
-        if diabetes_risk:
-            diab = MEDICAL_UI_ADVICE["Diabetes"][diabetes_risk]
-            ui_advice.append({
-                "diabetes": {
-                    "result": diab["title"],
-                    "medical_advices": diab["warning"],
-                    "how_to_cure": diab["how_to_cure"],
-                    "movies": diab["movies"],
-                    "norm": get_norms_for_disease("Diabetes", norms)
-                }
-            })
- 
-        for d, info in diseases.items():
-            risk = info.get("risk_level")
-            if risk:
-                advice = MEDICAL_UI_ADVICE[d][risk]
-                ui_advice.append({
-                    d: {
-                        "result": advice["title"],
-                        "medical_advices": advice["warning"],
-                        "how_to_cure": advice["how_to_cure"],
-                        "movies": advice["movies"],
-                        "norm": get_norms_for_disease(d, norms)
-                    }
-                })
- 
-        enriched_results.append({
-            **r,
-            "ui_advice": ui_advice,
-            "disclaimer": "Educational information only. Not a medical diagnosis."
-        })
- 
-    return enriched_results
+    headers = {}
+    if limit is None and cursor is None:
+        # unpaginated: the whole history, as before
+        results = await db.get_patient_results(patient_id, include_archived) or []
+    else:
+        try:
+            results, next_cursor = await db.get_patient_results_page(
+                patient_id, limit or RESULTS_PAGE_MAX_SIZE, cursor, include_archived
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+ 
+    # long histories are enriched and serialized off the event loop
+    content = await run_in_threadpool(enriched_results_json, results)
+    return EncodedJSONResponse(content, headers=headers)
+
+
+def trend_point(period):
+    """Public shape of one get_patient_trends period (or of their total)."""
+    scored = period["scored"]
+    return {
+        "results": period["results"],
+        "probability": {
+            "mean": round(period["probability_sum"] / scored, 2) if scored else None,
+            "min": period["probability_min"],
+            "max": period["probability_max"],
+        },
+        "risk_levels": period["risk_levels"],
+    }
+
+
+def total_trends(periods):
+    mins = [p["probability_min"] for p in periods if p["probability_min"] is not None]
+    maxs = [p["probability_max"] for p in periods if p["probability_max"] is not None]
+    return {
+        "results": sum(p["results"] for p in periods),
+        "scored": sum(p["scored"] for p in periods),
+        "probability_sum": sum(p["probability_sum"] for p in periods),
+        "probability_min": min(mins, default=None),
+        "probability_max": max(maxs, default=None),
+        "risk_levels": {
+            level: sum(p["risk_levels"][level] for p in periods)
+            for level in ("small", "medium", "high")
+        },
+    }
+
+
+@app.get("/patient/{patient_id}/trends")
+async def get_trends(
+    patient_id: int,
+    bucket: Literal["day", "week", "month"] = "day",
+    user_id: int = Depends(get_current_user)
+):
+    """Diabetes probability and risk level aggregates, overall and per period (oldest first).
+
+    Read from the patient_trends summary table, so no result is decoded.
+    Periods are named by their first day (weeks start on Monday).
+    """
+    if patient_id != user_id:
+        raise HTTPException(status_code=403)
+
+    periods = await db.get_patient_trends(patient_id, bucket)
+    return {
+        "patient_id": patient_id,
+        "bucket": bucket,
+        "summary": trend_point(total_trends(periods)),
+        "series": [{"period": p["period"], **trend_point(p)} for p in periods],
+    }
+
+
+async def export_chunks(patient_id: int, fmt: str, include_archived: bool = False):
+    # one keyset page at a time: memory stays flat and no pooled connection
+    # is held while a slow client reads
+    if fmt == "csv":
+        yield export.csv_header()
+    encode = export.csv_chunk if fmt == "csv" else export.ndjson_chunk
+    cursor = None
+    while True:
+        results, cursor = await db.get_patient_results_page(
+            patient_id, RESULTS_EXPORT_CHUNK_SIZE, cursor, include_archived
+        )
+        if results:
+            yield await run_in_threadpool(encode, results)
+        if cursor is None:
+            return
+
+
+@app.get("/patient/{patient_id}/results/export")
+async def export_results(
+    patient_id: int,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    include_archived: bool = False,
+    user_id: int = Depends(get_current_user)
+):
+    """Streams the whole history, newest first, as NDJSON (enriched like /results) or CSV.
+
+    Archived results (see maintenance.py) are included with include_archived=true.
+    """
+    if patient_id != user_id:
+        raise HTTPException(status_code=403)
+
+    filename = f"patient-{patient_id}-results.{format}"
+    return StreamingResponse(
+        export_chunks(patient_id, format, include_archived),
+        media_type=export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 @app.get("/me")
-def get_me(user_id: int = Depends(get_current_user)):
+async def get_me(user_id: int = Depends(get_current_user)):
     """
     Zwraca dane zalogowanego pacjenta.
     user_id pochodzi z tokena JWT.
     """
-    info = get_patient_info(user_id)
+    info = await db.get_patient_info(user_id)
     if info.get("status") == "error":
         raise HTTPException(status_code=404, detail="User not found")
     return info
 
 @app.post("/login-json")
-def login_json(data: LoginRequest = Body(...)):
-    login_res = login_patient(data.email, data.password)
+async def login_json(data: LoginRequest = Body(...)):
+    login_res = await db.login_patient(data.email, data.password)
     
     if login_res["status"] != "ok":
         raise HTTPException(status_code=401, detail=login_res["message"])
@@ -466,6 +869,82 @@ def login_json(data: LoginRequest = Body(...)):
         "patient_id": login_res["patient_id"]
 }
  
+@app.post("/logout")
+async def logout(token: str = Depends(oauth2_scheme), user_id: int = Depends(get_current_user)):
+    await revoke_token(token)
+    return {"status": "ok", "message": "Token revoked"}
+ 
+# ADMIN
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404)
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+ 
+ 
+@app.get("/admin/models")
+def list_models(_=Depends(require_admin)):
+    return registry.describe()
+ 
+ 
+@app.post("/admin/models/retrain", status_code=202)
+def retrain_model(data: Optional[RetrainRequest] = None, _=Depends(require_admin)):
+    data = data or RetrainRequest()
+    try:
+        return registry.retrain(data.dataset_path or DATASET_PATH, activate=data.activate)
+    except RegistryError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+ 
+ 
+@app.post("/admin/models/rollback")
+def rollback_model(_=Depends(require_admin)):
+    try:
+        return registry.rollback()
+    except RegistryError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+ 
+ 
+@app.post("/admin/models/{version}/activate")
+def activate_model(version: str, _=Depends(require_admin)):
+    try:
+        return registry.activate(version)
+    except RegistryError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+ 
+ 
+@app.get("/admin/maintenance")
+def maintenance_report(_=Depends(require_admin)):
+    """Dry run of the maintenance pass: what archival and vacuum would reclaim now."""
+    return (maintenance or Maintenance()).run(dry_run=True)
+ 
+ 
+@app.get("/stats")
+def stats():
+    return {
+        "batching": batcher.stats() if batcher is not None else {"enabled": False},
+        "admission": admission.stats() if admission is not None else {"enabled": False},
+        "percentiles": serving.percentiles.stats() if serving.percentiles is not None else {"enabled": False},
+        "prediction_cache": prediction_cache.stats() if prediction_cache is not None else {"enabled": False},
+        "write_behind": write_queue.stats() if write_queue is not None else {"enabled": False},
+        "maintenance": maintenance.stats() if maintenance is not None else {"enabled": False},
+        "token_cache": {
+            **(token_cache.stats() if token_cache is not None else {"enabled": False}),
+            "revoked": len(revoked_tokens),
+        },
+        "login_cache": login_cache.stats() if login_cache is not None else {"enabled": False},
+        "profile_cache": profile_cache.stats() if profile_cache is not None else {"enabled": False},
+    }
+ 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics():
+    return PlainTextResponse(
+        metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+ 
+ 
+# the /stats counters are exported as gauges too
+metrics.REGISTRY.add_collector(metrics.stats_collector(stats))
+ 
 @app.get("/")
 def root():
     return {"status": "API działa"}
@@ -0,0 +1,277 @@
+"""Retention, archival and compaction of the results tables.
+
+With a retention period set, results older than it move from
+health_results to health_results_archive. An archived row keeps its id,
+patient, created_at and model_version, and its result_json is deflated
+against a preset dictionary (archive_dictionaries): stored results are
+short and mostly the same text, so a dictionary trained on them shrinks a
+row about four times more than zlib alone. The history endpoints read the
+archive on request (?include_archived=true), and patient_trends keeps
+counting archived results.
+
+Nothing here holds the write lock for long. Rows move in batches, each
+compressed before its write transaction starts, so a save waits behind at
+most one batch's INSERT and DELETE. Free pages go back to the file system
+a step at a time (PRAGMA incremental_vacuum), and ANALYZE samples a
+bounded number of entries per index (PRAGMA analysis_limit).
+
+Result ids grow with created_at (both are assigned when a result is
+saved), so the expired results are the start of health_results in id
+order and each batch is read without scanning the rest of the table.
+"""
+import threading
+import time
+
+import database
+from config import (
+    RESULTS_RETENTION_DAYS, MAINTENANCE_BATCH_SIZE, MAINTENANCE_VACUUM_STEP_PAGES,
+    MAINTENANCE_VACUUM_MAX_PAGES, MAINTENANCE_ANALYSIS_LIMIT, ARCHIVE_DICTIONARY_SIZE,
+    ARCHIVE_COMPRESSION_LEVEL
+)
+from database import compress_result
+
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+# a dry run compresses every n-th expired result to estimate the archive size
+DRY_RUN_SAMPLE_EVERY = 10
+
+
+def train_dictionary(texts, size):
+    """A preset deflate dictionary from sample results: the distinct texts, cut to `size` bytes.
+
+    deflate codes near matches more cheaply, so the end of the dictionary
+    matters most; the newest sample goes last.
+    """
+    return b"".join(dict.fromkeys(text.encode() for text in texts))[-size:]
+
+
+def expired_results(conn, cutoff, limit, after_id=0):
+    """Up to `limit` live results after `after_id`, in id order, that are older than `cutoff`.
+
+    Stops at the first result that is not expired.
+    """
+    rows = conn.execute(
+        """
+        SELECT id, patient_id, result_json, created_at, model_version
+        FROM health_results
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+        """,
+        (after_id, limit)
+    ).fetchall()
+    for i, row in enumerate(rows):
+        if row[3] >= cutoff:
+            return rows[:i]
+    return rows
+
+
+def database_info(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    return {
+        "page_size": page_size,
+        "pages": pages,
+        "free_pages": conn.execute("PRAGMA freelist_count").fetchone()[0],
+        "size_bytes": page_size * pages,
+        "auto_vacuum": AUTO_VACUUM_MODES.get(conn.execute("PRAGMA auto_vacuum").fetchone()[0]),
+        "live_results": conn.execute("SELECT count(*) FROM health_results").fetchone()[0],
+        "archived_results": conn.execute("SELECT count(*) FROM health_results_archive").fetchone()[0],
+    }
+
+
+class Maintenance:
+    """Archives expired results, then releases free pages and refreshes ANALYZE.
+
+    run() makes one pass and returns its report. With dry_run=True nothing
+    is written, and the report estimates the space a real run would
+    reclaim. retention_days=0 skips archival; vacuum and ANALYZE still run.
+    """
+
+    def __init__(self, retention_days=RESULTS_RETENTION_DAYS, batch_size=MAINTENANCE_BATCH_SIZE,
+                 vacuum_step_pages=MAINTENANCE_VACUUM_STEP_PAGES, vacuum_max_pages=MAINTENANCE_VACUUM_MAX_PAGES,
+                 analysis_limit=MAINTENANCE_ANALYSIS_LIMIT, dictionary_size=ARCHIVE_DICTIONARY_SIZE,
+                 compression_level=ARCHIVE_COMPRESSION_LEVEL):
+        self.retention_days = retention_days
+        self.batch_size = max(1, batch_size)
+        self.vacuum_step_pages = max(1, vacuum_step_pages)
+        self.vacuum_max_pages = vacuum_max_pages
+        self.analysis_limit = analysis_limit
+        self.dictionary_size = dictionary_size
+        self.compression_level = compression_level
+        # one pass at a time in this process
+        self._lock = threading.Lock()
+
+        self.runs = 0
+        self.failures = 0
+        self.archived = 0
+        self.vacuumed_pages = 0
+        self.last_duration_s = None
+        self.last_longest_write_ms = None
+
+    def run(self, dry_run=False):
+        with self._lock:
+            start = time.perf_counter()
+            # its own connection: a long pass never keeps one from the pool
+            conn = database.get_connection()
+            try:
+                report = self._run(conn, dry_run)
+            except Exception:
+                if not dry_run:
+                    self.failures += 1
+                raise
+            finally:
+                conn.close()
+            report["duration_s"] = round(time.perf_counter() - start, 3)
+
+            if not dry_run:
+                self.runs += 1
+                self.archived += report["archive"]["results"]
+                self.vacuumed_pages += report["vacuum"]["pages"]
+                self.last_duration_s = report["duration_s"]
+                self.last_longest_write_ms = report["archive"]["longest_write_ms"]
+            return report
+
+    def _run(self, conn, dry_run):
+        before = database_info(conn)
+        report = {"dry_run": dry_run, "retention_days": self.retention_days, "before": before}
+        report["archive"] = self._archive(conn, dry_run)
+
+        if dry_run:
+            # freed pages are reused inside the file unless auto_vacuum is incremental
+            free_pages = before["free_pages"] if before["auto_vacuum"] == "incremental" else 0
+            report["vacuum"] = {"pages": free_pages, "bytes": free_pages * before["page_size"]}
+            report["reclaimable_bytes"] = report["archive"]["reclaimed_bytes"] + report["vacuum"]["bytes"]
+            return report
+
+        pages = self._vacuum(conn) if before["auto_vacuum"] == "incremental" else 0
+        report["vacuum"] = {"pages": pages, "bytes": pages * before["page_size"]}
+        start = time.perf_counter()
+        conn.execute(f"PRAGMA analysis_limit={int(self.analysis_limit)}")
+        conn.execute("ANALYZE")
+        report["analyze_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        # lets the shrunken file reach the disk without waiting for readers
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        report["after"] = database_info(conn)
+        return report
+
+    def _archive(self, conn, dry_run):
+        summary = {"cutoff": None, "results": 0, "result_bytes": 0, "archived_bytes": 0,
+                   "reclaimed_bytes": 0, "longest_write_ms": 0.0}
+        if self.retention_days <= 0:
+            return summary
+        cutoff = conn.execute("SELECT datetime('now', ?)", (f"-{self.retention_days} days",)).fetchone()[0]
+        summary["cutoff"] = cutoff
+
+        dictionary_id, zdict = None, None
+        sampled_bytes = sampled_compressed = 0
+        after_id = 0
+        while True:
+            rows = expired_results(conn, cutoff, self.batch_size, after_id)
+            if not rows:
+                break
+            after_id = rows[-1][0]
+            if zdict is None:
+                dictionary_id, zdict = self._dictionary(conn, [row[2] for row in rows], dry_run)
+
+            sizes = [len(row[2].encode()) for row in rows]
+            summary["results"] += len(rows)
+            summary["result_bytes"] += sum(sizes)
+            if dry_run:
+                for row, size in zip(rows[::DRY_RUN_SAMPLE_EVERY], sizes[::DRY_RUN_SAMPLE_EVERY]):
+                    sampled_bytes += size
+                    sampled_compressed += len(compress_result(row[2], zdict, self.compression_level))
+            else:
+                archived, write_ms = self._archive_batch(conn, rows, dictionary_id, zdict)
+                summary["archived_bytes"] += sum(len(row[2]) for row in archived)
+                summary["longest_write_ms"] = max(summary["longest_write_ms"], round(write_ms, 1))
+
+            if len(rows) < self.batch_size:
+                break
+
+        if dry_run and sampled_bytes:
+            summary["archived_bytes"] = round(summary["result_bytes"] * sampled_compressed / sampled_bytes)
+        summary["reclaimed_bytes"] = summary["result_bytes"] - summary["archived_bytes"]
+        return summary
+
+    def _dictionary(self, conn, texts, dry_run):
+        """(id, zdict) of the newest archive dictionary; the first one is trained on `texts`."""
+        row = conn.execute("SELECT id, zdict FROM archive_dictionaries ORDER BY id DESC LIMIT 1").fetchone()
+        if row is not None:
+            return row
+        zdict = train_dictionary(texts, self.dictionary_size)
+        if dry_run:
+            return None, zdict
+        cur = conn.execute("INSERT INTO archive_dictionaries (zdict) VALUES (?)", (zdict,))
+        conn.commit()
+        database.archive_dictionaries[cur.lastrowid] = zdict
+        return cur.lastrowid, zdict
+
+    def _archive_batch(self, conn, rows, dictionary_id, zdict):
+        """Move one batch into the archive; returns (archived rows, ms the write lock was held)."""
+        archived = [
+            (row_id, patient_id, compress_result(result_json, zdict, self.compression_level),
+             dictionary_id, created_at, model_version)
+            for row_id, patient_id, result_json, created_at, model_version in rows
+        ]
+        start = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # another worker may have archived the same rows in the meantime
+            conn.executemany(
+                """
+                INSERT OR IGNORE INTO health_results_archive
+                    (id, patient_id, result, dictionary_id, created_at, model_version)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                archived
+            )
+            conn.executemany("DELETE FROM health_results WHERE id = ?", [(row[0],) for row in rows])
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return archived, (time.perf_counter() - start) * 1000
+
+    def _vacuum(self, conn):
+        released = 0
+        while self.vacuum_max_pages <= 0 or released < self.vacuum_max_pages:
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free:
+                break
+            step = min(free, self.vacuum_step_pages)
+            if self.vacuum_max_pages > 0:
+                step = min(step, self.vacuum_max_pages - released)
+            # executescript steps the pragma to completion; execute() frees one page
+            conn.executescript(f"PRAGMA incremental_vacuum({step})")
+            left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if left >= free:
+                break
+            released += free - left
+        return released
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "retention_days": self.retention_days,
+            "runs": self.runs,
+            "failures": self.failures,
+            "archived": self.archived,
+            "vacuumed_pages": self.vacuumed_pages,
+            "last_duration_s": self.last_duration_s,
+            "last_longest_write_ms": self.last_longest_write_ms,
+        }
+
+
+def full_vacuum():
+    """Rewrite the whole database file with VACUUM, switching it to DB_AUTO_VACUUM.
+
+    Takes an exclusive lock for the whole rewrite: run it once, offline,
+    on a database created before incremental auto-vacuum was the default.
+    """
+    conn = database.get_connection()
+    try:
+        before = database_info(conn)
+        conn.execute("VACUUM")
+        return before, database_info(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,177 @@
+"""Maintenance commands for the backend.
+
+Usage:
+    python manage.py build-model [--force]
+    python manage.py score-csv INPUT OUTPUT [--chunksize N] [--workers N] [--format csv|parquet] [--report]
+    python manage.py models
+    python manage.py retrain [--dataset PATH] [--no-activate]
+    python manage.py activate VERSION
+    python manage.py rollback
+    python manage.py backfill-trends
+    python manage.py maintenance [--dry-run] [--retention-days N] [--full-vacuum]
+
+Version changes are written to models/registry.json; running API workers
+pick them up within MODEL_REGISTRY_POLL_S seconds.
+"""
+import argparse
+import time
+
+import bulk_scoring
+import database
+import maintenance
+import model_registry
+import model_store
+from config import DATASET_PATH, RESULTS_RETENTION_DAYS
+
+
+def cmd_build_model(args):
+    start = time.perf_counter()
+    _, metadata, path = model_store.build_artifact(force=args.force)
+    elapsed = time.perf_counter() - start
+    print(f"Model artifact {path} ready in {elapsed:.2f}s")
+    print(f"  dataset sha256: {metadata['dataset_sha256']}")
+    print(f"  params:         {metadata['params']}")
+
+
+def cmd_score_csv(args):
+    print(f"Scoring {args.input} -> {args.output}")
+    rows, elapsed = bulk_scoring.score_csv(
+        args.input, args.output,
+        chunksize=args.chunksize, workers=args.workers, fmt=args.format, with_report=args.report
+    )
+    rate = rows / elapsed if elapsed else 0.0
+    print(f"Scored {rows:,} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+
+
+def print_version(entry, active=None):
+    marker = "*" if entry["version"] == active else " "
+    print(f"{marker} {entry['version']:<5} {entry['created_at']}  accuracy {entry['accuracy']:.3f}  "
+          f"{entry['key']}  {entry['dataset']}")
+
+
+def cmd_models(args):
+    manifest = model_registry.ModelRegistry().read_manifest()
+    if not manifest["versions"]:
+        print("No registered model versions yet (the API registers one on first start)")
+    for entry in manifest["versions"]:
+        print_version(entry, manifest["active"])
+
+
+def cmd_retrain(args):
+    registry = model_registry.ModelRegistry()
+    start = time.perf_counter()
+    info = model_registry.train_version(args.dataset, registry.model_dir)
+    entry = registry.promote(info, activate=not args.no_activate)
+    print(f"Trained {entry['version']} in {time.perf_counter() - start:.2f}s")
+    print_version(entry, registry.read_manifest()["active"])
+
+
+def cmd_activate(args):
+    entry = model_registry.ModelRegistry().activate(args.version)
+    print(f"Activated {entry['version']}")
+
+
+def cmd_rollback(args):
+    entry = model_registry.ModelRegistry().rollback()
+    print(f"Rolled back to {entry['version']}")
+
+
+def cmd_backfill_trends(args):
+    start = time.perf_counter()
+    rows = database.backfill_trends()
+    print(f"Rebuilt patient trends from {rows:,} results in {time.perf_counter() - start:.2f}s")
+
+
+def mib(n):
+    return f"{n / 2**20:,.1f} MiB"
+
+
+def print_database(label, info):
+    print(f"  {label:<7} {mib(info['size_bytes'])} ({info['pages']:,} pages, {info['free_pages']:,} free), "
+          f"{info['live_results']:,} live / {info['archived_results']:,} archived results")
+
+
+def cmd_maintenance(args):
+    if args.full_vacuum:
+        print("Rewriting the database with VACUUM (exclusive lock until done)...")
+        before, after = maintenance.full_vacuum()
+        print_database("before:", before)
+        print_database("after:", after)
+        print(f"  auto_vacuum: {after['auto_vacuum']}")
+        return
+
+    report = maintenance.Maintenance(retention_days=args.retention_days).run(dry_run=args.dry_run)
+    archive, vacuum = report["archive"], report["vacuum"]
+    print(("Dry run" if args.dry_run else "Maintenance") + f" finished in {report['duration_s']:.2f}s")
+    print_database("before:", report["before"])
+    if archive["cutoff"] is None:
+        print("  archive: off (no retention period)")
+    else:
+        verb = "would move" if args.dry_run else "moved"
+        lock = "" if args.dry_run else f", longest write transaction {archive['longest_write_ms']:.1f} ms"
+        print(f"  archive: {verb} {archive['results']:,} results older than {archive['cutoff']} "
+              f"({mib(archive['result_bytes'])} -> {mib(archive['archived_bytes'])}){lock}")
+    if args.dry_run:
+        print(f"  vacuum:  {vacuum['pages']:,} free pages ({mib(vacuum['bytes'])})")
+        print(f"  reclaimable: {mib(report['reclaimable_bytes'])}")
+        if report["before"]["auto_vacuum"] != "incremental":
+            print("  note: auto_vacuum is not incremental, so freed pages are reused but the file "
+                  "does not shrink; run `python manage.py maintenance --full-vacuum` once")
+        return
+    print(f"  vacuum:  released {vacuum['pages']:,} pages ({mib(vacuum['bytes'])})")
+    print(f"  analyze: {report['analyze_ms']:.1f} ms")
+    print_database("after:", report["after"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Healthcheck backend maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build-model", help="train and store the model artifact ahead of time")
+    build.add_argument("--force", action="store_true", help="retrain even if an up-to-date artifact exists")
+    build.set_defaults(func=cmd_build_model)
+
+    score = sub.add_parser("score-csv", help="score a screening CSV (diabetes.csv schema) in bulk")
+    score.add_argument("input", help="CSV with the model's feature columns; other columns are passed through")
+    score.add_argument("output", help="output file (.csv, or .parquet with pyarrow installed)")
+    score.add_argument("--chunksize", type=int, default=50000, help="rows read and scored at a time")
+    score.add_argument("--workers", type=int, default=1, help="score chunks in this many processes")
+    score.add_argument("--format", choices=["csv", "parquet"], help="defaults to the output file extension")
+    score.add_argument("--report", action="store_true", help="add the medical report lines (slower)")
+    score.set_defaults(func=cmd_score_csv)
+
+    models = sub.add_parser("models", help="list registered model versions (* = active)")
+    models.set_defaults(func=cmd_models)
+
+    retrain = sub.add_parser("retrain", help="train, validate and register a new model version")
+    retrain.add_argument("--dataset", default=DATASET_PATH, help="CSV in the diabetes.csv format")
+    retrain.add_argument("--no-activate", action="store_true", help="register without activating")
+    retrain.set_defaults(func=cmd_retrain)
+
+    activate = sub.add_parser("activate", help="activate a registered model version")
+    activate.add_argument("version", help="e.g. v3")
+    activate.set_defaults(func=cmd_activate)
+
+    rollback = sub.add_parser("rollback", help="activate the version before the active one")
+    rollback.set_defaults(func=cmd_rollback)
+
+    backfill = sub.add_parser("backfill-trends", help="rebuild the per-patient trend aggregates")
+    backfill.set_defaults(func=cmd_backfill_trends)
+
+    maint = sub.add_parser("maintenance", help="archive old results, release free pages and run ANALYZE")
+    maint.add_argument("--dry-run", action="store_true", help="only report the space that would be reclaimed")
+    maint.add_argument("--retention-days", type=int, default=RESULTS_RETENTION_DAYS,
+                       help="archive results older than this (0 = none; default RESULTS_RETENTION_DAYS)")
+    maint.add_argument("--full-vacuum", action="store_true",
+                       help="rewrite the whole file once, e.g. to switch on incremental auto-vacuum")
+    maint.set_defaults(func=cmd_maintenance)
+
+    args = parser.parse_args(argv)
+    try:
+        args.func(args)
+    except model_registry.RegistryError as e:
+        parser.exit(1, f"error: {e}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+from functools import lru_cache
+ 
+from rules import RuleEngine
+from serialization import dumps
+ 
+ 
+# DISEASE NORMS
+DISEASE_NORMS = {
+    "Diabetes": ["Glucose"],
+    "Obesity": ["BMI", "SkinThickness"],
+    "Hypertension": ["BloodPressure", "BMI"],
+    "Metabolic Syndrome": ["Glucose", "Insulin", "BMI"]
+}
+ 
+# MEDICAL LOGIC
+FEATURE_INFO = {
+    "Pregnancies": {"name": "Number of Pregnancies", "min": 0, "max": 15},
+    "Glucose": {"name": "Fasting Glucose (mg/dL)", "min": 70, "max": 99, "warning": 126, "critical": 200},
+    "BloodPressure": {"name": "Diastolic Blood Pressure (mmHg)", "min": 60, "max": 80, "warning": 90, "critical": 120},
+    "SkinThickness": {"name": "Skin Fold Thickness (mm)", "min": 10, "max": 30},
+    "Insulin": {"name": "Insulin Level (µU/mL)", "min": 2, "max": 25, "warning": 100},
+    "BMI": {"name": "Body Mass Index", "min": 18.5, "max": 24.9, "warning": 30, "critical": 35},
+    "DiabetesPedigreeFunction": {"name": "Diabetes Pedigree Function","min": 0.0,"max": 0.8},
+    "Age": {"name": "Age (years)", "min": 0, "max": 120}
+}
+ 
+# MEDICAL UI ADVICE
+MEDICAL_UI_ADVICE = {
+    "Diabetes": {
+        "small": {
+            "title": "Low diabetes risk",
+            "how_to_cure": "Maintaining a healthy lifestyle helps prevent future risk. Eat balanced meals (low sugar, high fiber). Exercise at least 30 min/day. Avoid sugary drinks. Keep weight under control. ",
+            "warning": "Still monitor your diet and lifestyle to prevent future risk.",
+            "movies": ["https://www.youtube.com/watch?v=rMMpeLLgdgY"]
+            },
+        "medium": {
+            "title": "Moderate diabetes risk", 
+            "how_to_cure": "Monitor glucose levels and reduce sugar intake. Check fasting glucose regularly. Reduce refined carbs and sugar, Increase physical activity, Consider medical check-up",
+            "warning": "If symptoms appear, consult a doctor.",
+            "movies": ["https://www.youtube.com/watch?v=rMMpeLLgdgY"]
+            },
+        "high": {
+            "title": "High diabetes risk", 
+            "how_to_cure": "Medical consultation is strongly recommended. Schedule medical check-up. Monitor blood glucose daily. Start a structured diet plan. Consider medication if prescribed.",
+            "warning": "Do not ignore symptoms like excessive thirst, frequent urination, or fatigue.",
+            "movies": ["https://www.youtube.com/watch?v=rMMpeLLgdgY"],
+            }
+    },
+    "Obesity": {
+        "small": {
+            "title": "Normal weight",
+            "how_to_cure": "Maintain healthy lifestyle to prevent weight gain. Keep balanced diet. Exercise regularly. Avoid overeating. Track weight monthly.",
+            "warning": "Avoid quick weight gain; monitor BMI.",
+            "movies": ["https://www.youtube.com/watch?v=VgL8bIlbklQ"]
+            },
+        "medium": {
+            "title": "Obesity detected", 
+            "how_to_cure": "Lifestyle changes can significantly improve health. Reduce calorie intake. Increase physical activity. Avoid processed foods. Consider professional dietician support",
+            "warning": "Obesity increases risk of diabetes, hypertension, and heart disease.",
+            "movies": ["https://www.youtube.com/watch?v=VgL8bIlbklQ"]
+            },
+        "high": {
+            "title": "Severe obesity", 
+            "how_to_cure": "Professional medical consultation is advised. Consider structured weight loss program. Check for metabolic syndrome",
+            "warning": "Severe obesity is associated with high risk of complications.",
+            "movies": ["https://www.youtube.com/watch?v=VgL8bIlbklQ"]
+            }
+    },
+    "Hypertension": {
+        "small": {
+            "title": "Normal blood pressure",
+            "how_to_cure": "Reduce salt intake. Exercise regularly. Maintain healthy weight. Limit alcohol consumption.",
+            "warning": "Monitor blood pressure periodically.",
+            "movies": ["https://www.youtube.com/watch?v=rI-ktNcbi7M"]
+        },
+        "medium": {
+            "title": "Elevated blood pressure", 
+            "how_to_cure": "Reduce salt intake and manage stress. Increase physical activity. Monitor blood pressure regularly",
+            "warning": "If blood pressure remains high, consult a doctor.",
+            "movies": ["https://www.youtube.com/watch?v=rI-ktNcbi7M"]
+            },
+        "high": {
+            "title": "High blood pressure", 
+            "how_to_cure": "Medical evaluation is recommended. Avoid alcohol and smoking. Monitor blood pressure daily. Follow prescribed treatment plan.",
+            "warning": "High BP increases risk of heart attack and stroke.",
+            "movies": ["https://www.youtube.com/watch?v=rI-ktNcbi7M"]
+            }
+    },
+    "Metabolic Syndrome": {
+        "small": {
+            "title": "Low metabolic risk",
+            "how_to_cure": "Balanced diet. Regular exercise. Avoid sugary drinks. Maintain normal weight",
+            "warning": "Monitor your health periodically.",
+            "movies": ["https://www.youtube.com/watch?v=J-o6tRZ2n8o"]
+        },
+        "medium": {
+            "title": "Metabolic risk detected", 
+            "how_to_cure": "Lifestyle modification is recommended. Reduce sugar and refined carbs. Maintain healthy weight. Consider medical consultation.",
+            "warning": "Metabolic syndrome increases risk of diabetes and cardiovascular disease.",
+            "movies": ["https://www.youtube.com/watch?v=J-o6tRZ2n8o"]
+            },
+        "high": {
+            "title": "High metabolic risk", 
+            "how_to_cure": "Consult a healthcare professional. Check blood glucose and lipid profile. Follow structured diet and exercise plan.",
+            "warning": "High metabolic risk increases chances of diabetes and heart disease.",
+            "movies": ["https://www.youtube.com/watch?v=J-o6tRZ2n8o"]
+            }
+    }
+}
+ 
+# DISEASE RULES
+# a disease is "high" risk when at least `high` of its conditions hold and
+# "medium" when at least `medium` do; thresholds come from FEATURE_INFO and
+# every condition uses a feature listed for the disease in DISEASE_NORMS
+DISEASE_RULES = {
+    "Obesity": {
+        "conditions": [
+            ("BMI", ">=", FEATURE_INFO["BMI"]["warning"]),
+            ("BMI", ">=", FEATURE_INFO["BMI"]["critical"]),
+        ],
+        "high": 2,
+        "medium": 1,
+    },
+    "Hypertension": {
+        "conditions": [
+            ("BloodPressure", ">", FEATURE_INFO["BloodPressure"]["warning"]),
+            ("BloodPressure", ">", FEATURE_INFO["BloodPressure"]["critical"]),
+        ],
+        "high": 2,
+        "medium": 1,
+    },
+    "Metabolic Syndrome": {
+        "conditions": [
+            # impaired fasting glucose; slightly above the 99 mg/dL norm
+            ("Glucose", ">", 100),
+            ("Insulin", ">", FEATURE_INFO["Insulin"]["warning"]),
+            ("BMI", ">", FEATURE_INFO["BMI"]["warning"]),
+        ],
+        "high": 3,
+        "medium": 2,
+    },
+}
+ 
+@lru_cache(maxsize=32)
+def rule_engine(features):
+    """RuleEngine for patients laid out in `features` (a tuple) order."""
+    return RuleEngine(features, FEATURE_INFO, DISEASE_RULES)
+ 
+ 
+def get_norms_for_disease(disease_name, norms):
+    params = DISEASE_NORMS.get(disease_name, [])
+    return {p: norms[p] for p in params}
+ 
+# PRECOMPUTED RESPONSE FRAGMENTS
+# advice only depends on (disease, risk level), so every fragment is built
+# once at import and shared by all responses; treat them as read-only
+def build_norms():
+    norms = {}
+    for k, v in FEATURE_INFO.items():
+        norms[k] = f"{v['min']} - {v['max']}"
+    return norms
+ 
+ 
+NORMS = build_norms()
+ 
+ 
+def build_advice_fragment(disease_name, risk_level):
+    advice = MEDICAL_UI_ADVICE[disease_name][risk_level]
+    key = "diabetes" if disease_name == "Diabetes" else disease_name
+    return {
+        key: {
+            "result": advice["title"],
+            "medical_advices": advice["warning"],
+            "how_to_cure": advice["how_to_cure"],
+            "movies": advice["movies"],
+            "norm": get_norms_for_disease(disease_name, NORMS)
+        }
+    }
+ 
+ 
+ADVICE_FRAGMENTS = {
+    (disease, risk): build_advice_fragment(disease, risk)
+    for disease, levels in MEDICAL_UI_ADVICE.items()
+    for risk in levels
+}
+ 
+# the same fragments as compact JSON, spliced into serialized history pages
+ADVICE_FRAGMENTS_JSON = {
+    key: dumps(fragment) for key, fragment in ADVICE_FRAGMENTS.items()
+}
+ 
+DISCLAIMER = "Educational information only. Not a medical diagnosis."
+DISCLAIMER_JSON = dumps(DISCLAIMER)
+ 
+ 
+def advice_keys_for_result(result_data):
+    """(disease, risk) fragment keys for a stored result, diabetes first."""
+    keys = []
+    diabetes_risk = result_data.get("diabetes", {}).get("risk_level")
+    if diabetes_risk:
+        keys.append(("Diabetes", diabetes_risk))
+    for name, info in result_data.get("diseases_detected", {}).items():
+        risk = info.get("risk_level")
+        if risk:
+            keys.append((name, risk))
+    return keys
+ 
+ 
+def get_risk_label(probability):
+    if probability >= 70:
+        return "high"
+    elif probability >= 40:
+        return "medium"
+    return "small"
+ 
+ 
+def analyze_health(patient_dict):
+    return rule_engine(tuple(patient_dict)).analyze_one(list(patient_dict.values()))
+ 
+ 
+def analyze_health_batch(X, features):
+    """analyze_health for every row of a (n, len(features)) array."""
+    return rule_engine(tuple(features)).analyze(X)
+ 
+def build_frontend_report(diseases, diabetes_risk):
+    # diabetes first, then the other diseases in analysis order
+    result = [ADVICE_FRAGMENTS[("Diabetes", diabetes_risk)]]
+    for name, info in diseases.items():
+        result.append(ADVICE_FRAGMENTS[(name, info["risk_level"])])
+    return result
+ 
+# MEDICAL REPORT GENERATION
+def generate_medical_report(patient_dict):
+    return rule_engine(tuple(patient_dict)).report_one(list(patient_dict.values()))
+ 
+ 
+def generate_medical_reports(X, features, int_features=()):
+    """generate_medical_report for every row of a (n, len(features)) array."""
+    return rule_engine(tuple(features)).report(X, int_features)
+ 
+ 
+# HISTORY ENRICHMENT
+def enrich_result(r):
+    keys = advice_keys_for_result(r.get("result", {}))
+    return {
+        **r,
+        "ui_advice": [ADVICE_FRAGMENTS[key] for key in keys],
+        "disclaimer": DISCLAIMER
+    }
+ 
+ 
+def enriched_result_json(r) -> bytes:
+    """enrich_result(r) as JSON, splicing in the pre-serialized fragments."""
+    keys = advice_keys_for_result(r.get("result", {}))
+    return (
+        b'{"result":' + dumps(r["result"])
+        + b',"created_at":' + dumps(r["created_at"])
+        + b',"model_version":' + dumps(r.get("model_version"))
+        + b',"ui_advice":[' + b",".join(ADVICE_FRAGMENTS_JSON[key] for key in keys)
+        + b'],"disclaimer":' + DISCLAIMER_JSON + b"}"
+    )
+
+
+def enriched_results_json(results) -> bytes:
+    """[enrich_result(r) for r in results] as JSON."""
+    return b"[" + b",".join(enriched_result_json(r) for r in results) + b"]"
@@ -0,0 +1,424 @@
+"""Prometheus-style instrumentation without external dependencies.
+
+Counters, gauges and histograms live in a registry rendered in the
+Prometheus text exposition format by GET /metrics. MetricsMiddleware
+records per-route request counts, latency and in-flight requests, and can
+run a sampling profiler for individual requests.
+"""
+import functools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+# upper bounds (ms) of the queue wait histogram buckets
+QUEUE_WAIT_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250)
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+# -------------------------
+# METRIC TYPES
+# -------------------------
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        # unlabelled metrics have a single child
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+    _new_child = _CounterChild
+
+    def inc(self, amount=1.0):
+        self._default().inc(amount)
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    _new_child = _GaugeChild
+
+    def inc(self, amount=1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount=1.0):
+        self._default().dec(amount)
+
+    def set(self, value):
+        self._default().set(value)
+
+
+class BucketHistogram:
+    """A histogram over fixed upper `buckets`, plus an overflow bucket.
+
+    The children of the labelled Histogram metric, and used on its own for
+    the bucketed distributions reported in /stats (snapshot()).
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            else:
+                self.counts[-1] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def render(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            labels = _format_labels(labelnames, values, [("le", _format_value(bound))])
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = _format_labels(labelnames, values, [("le", "+Inf")])
+        lines.append(f"{name}_bucket{labels} {self.count}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {self.count}")
+        return lines
+
+    def snapshot(self):
+        with self._lock:
+            labels = [f"<={b}" for b in self.buckets] + [f">{self.buckets[-1]}"]
+            return {
+                "count": self.count,
+                "mean": round(self.sum / self.count, 3) if self.count else 0.0,
+                "max": round(self.max, 3),
+                "buckets": dict(zip(labels, self.counts)),
+            }
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return BucketHistogram(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+# -------------------------
+# REGISTRY
+# -------------------------
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """`collector()` returns (name, type, help, {labels tuple: value}) tuples at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception:
+                logger.exception("Metrics collector failed")
+                continue
+            for name, kind, documentation, series in samples:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels([k for k, _ in labels], [v for _, v in labels])} "
+                                 f"{_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "healthcheck_http_requests_total", "HTTP requests by route, method and status.",
+    ("route", "method", "status")
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "healthcheck_http_request_duration_seconds", "HTTP request latency by route.",
+    ("route", "method")
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "healthcheck_http_requests_in_flight", "Requests currently being handled."
+)
+PREDICT_STAGE = REGISTRY.histogram(
+    "healthcheck_predict_stage_duration_seconds", "Time spent in each stage of a prediction.",
+    ("stage",)
+)
+DB_QUERY = REGISTRY.histogram(
+    "healthcheck_db_query_duration_seconds", "Time spent in each database.py function.",
+    ("function",)
+)
+DB_QUERY_ERRORS = REGISTRY.counter(
+    "healthcheck_db_query_errors_total", "Database functions that raised.",
+    ("function",)
+)
+
+
+_METRIC_NAME = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+
+
+def stats_collector(get_stats, prefix="healthcheck"):
+    """Export the numeric leaves of a nested `.stats()`-style dict as gauges.
+
+    {"prediction_cache": {"hits": 3}} becomes healthcheck_prediction_cache_hits 3;
+    keys that are not valid metric name parts (histogram bucket labels) are skipped.
+    """
+    def flatten(values, name):
+        for key, value in values.items():
+            if not _METRIC_NAME.match(str(key)):
+                continue
+            if isinstance(value, dict):
+                yield from flatten(value, f"{name}_{key}")
+            elif isinstance(value, (int, float)):
+                yield f"{name}_{key}", float(value)
+
+    def collect():
+        for name, value in flatten(get_stats(), prefix):
+            yield name, "gauge", f"{name[len(prefix) + 1:]} from /stats.", {(): value}
+
+    return collect
+
+
+def stage(name):
+    """Time a block of the prediction pipeline: `with stage("predict_proba"): ...`"""
+    return PREDICT_STAGE.labels(name).time()
+
+
+def timed_query(fn):
+    """Record the duration of a database function under its name."""
+    histogram = DB_QUERY.labels(fn.__name__)
+    errors = DB_QUERY_ERRORS.labels(fn.__name__)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+# -------------------------
+# SAMPLING PROFILER
+# -------------------------
+class SamplingProfiler:
+    """Samples the Python stacks of all threads every `interval` seconds.
+
+    Stacks are kept in collapsed ("folded") form, one line per distinct
+    stack with its sample count, ready for flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.samples = _Tally()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+# -------------------------
+# MIDDLEWARE
+# -------------------------
+class MetricsMiddleware:
+    """ASGI middleware recording per-route counts, latency and in-flight requests.
+
+    When `profile_dir` is set, a request carrying the `X-Profile: 1` header
+    is sampled while it runs; the folded stacks are written to `profile_dir`
+    and the file name is returned in the `X-Profile-File` response header.
+    """
+
+    def __init__(self, app, profile_dir=None, profile_interval=0.001):
+        self.app = app
+        self.profile_dir = profile_dir
+        self.profile_interval = profile_interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        # endpoints read this to time everything before the handler (parsing, validation)
+        scope.setdefault("state", {})["request_start"] = start
+        status = 500
+
+        profiler = None
+        if self.profile_dir and (b"x-profile", b"1") in scope.get("headers", []):
+            profiler = SamplingProfiler(self.profile_interval)
+            profiler.start()
+
+        async def send_wrapper(message):
+            nonlocal status, profiler
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profiler is not None:
+                    profiler.stop()
+                    path = self._write_profile(scope, profiler)
+                    profiler = None
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"x-profile-file", path.encode())]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            if profiler is not None:
+                profiler.stop()
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            HTTP_REQUESTS.labels(route_path, scope["method"], status).inc()
+            HTTP_LATENCY.labels(route_path, scope["method"]).observe(time.perf_counter() - start)
+
+    def _write_profile(self, scope, profiler):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        route = getattr(scope.get("route"), "path", scope["path"])
+        slug = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{slug}.folded"
+        path = os.path.join(self.profile_dir, name)
+        with open(path, "w") as f:
+            f.write(profiler.folded())
+        logger.info("Request profile written to %s", path)
+        return name
@@ -0,0 +1,366 @@
+"""Versioned model registry with background retraining and hot swapping.
+
+Every trained model the API may serve is registered as a version ("v1",
+"v2", ...) in models/registry.json next to its artifact. One version is
+active; activating another (a retrain, a rollback) swaps it in without a
+restart and tells the registered listeners. The last MODEL_REGISTRY_KEEP
+versions are kept, so a rollback only has to load an artifact from disk.
+
+Retraining runs in a separate process, so request handling never waits
+for it. The new model is validated (same features, minimum holdout
+accuracy) before it is activated. Other workers and the CLI share the
+manifest: each worker polls it and loads a version activated elsewhere.
+
+With MODEL_MMAP_ENABLED, versions are loaded as memory-mapped CompiledForest
+arrays instead of sklearn models, and a first-start bootstrap trains in a
+child process, so a worker never holds the dataset or a private copy of
+the trees. The percentile index is built with the version and mapped the
+same way (see percentiles.py).
+"""
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import model_store
+import percentiles
+from config import (
+    DATASET_PATH, MODEL_DIR, MODEL_MIN_ACCURACY, MODEL_MMAP_ENABLED, MODEL_REGISTRY_KEEP,
+    PERCENTILES_ENABLED
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: manifest updates are only serialized within a process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "registry.json"
+# flock()ed around every read-modify-write of the manifest
+LOCK_NAME = "manifest.lock"
+
+
+class RegistryError(Exception):
+    pass
+
+
+def train_version(dataset_path, model_dir):
+    """Train and store an artifact for `dataset_path`; runs in a worker process."""
+    params = model_store.model_params()
+    data_hash = model_store.dataset_hash(dataset_path)
+    key = model_store.artifact_key(data_hash, params)
+    path = model_store.artifact_path(key, model_dir)
+
+    if path.exists():
+        model, metadata = model_store.load_artifact(path)
+    else:
+        model, metadata = model_store.fit_artifact(dataset_path, params, data_hash, key)
+        model_store.save_artifact(model, metadata, path)
+    if MODEL_MMAP_ENABLED and PERCENTILES_ENABLED:
+        # mapped by the workers next to the forest instead of reading the dataset
+        percentiles.store(dataset_path, metadata["features"], path)
+
+    return version_info(model, metadata, path, dataset_path)
+
+
+def version_info(model, metadata, path, dataset_path):
+    """The manifest fields describing a trained artifact."""
+    return {
+        "key": metadata["key"],
+        "artifact": path.name,
+        "dataset": str(dataset_path),
+        "dataset_sha256": metadata["dataset_sha256"],
+        "params": metadata["params"],
+        "features": metadata["features"],
+        "accuracy": round(model_store.holdout_accuracy(model, dataset_path, metadata["params"]), 4),
+    }
+
+
+def process_executor(method="spawn"):
+    # spawn by default: the worker must not inherit the server's threads and locks
+    return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context(method))
+
+
+class ModelRegistry:
+    def __init__(self, model_dir=MODEL_DIR, keep=MODEL_REGISTRY_KEEP, min_accuracy=MODEL_MIN_ACCURACY,
+                 mmap=MODEL_MMAP_ENABLED):
+        self.model_dir = Path(model_dir)
+        self.manifest_path = self.model_dir / MANIFEST_NAME
+        self.keep = max(1, keep)
+        self.min_accuracy = min_accuracy
+        self.mmap = mmap
+
+        self.active_version = None
+        self._listeners = []
+        self._lock = threading.RLock()
+        self._lock_file = None
+        # every version seen in the manifest by this process (see is_known)
+        self._known = set()
+        self._manifest_mtime = None
+        self._job = None
+
+    # -------------------------
+    # MANIFEST
+    # -------------------------
+    @contextmanager
+    def _manifest_lock(self):
+        """Hold the manifest for a read-modify-write, against threads and other processes.
+
+        API workers, the retraining process and manage.py all update the
+        manifest; without the file lock two of them could number different
+        artifacts with the same version, or prune one the other activated.
+        Reentrant within the thread that holds it (rollback -> activate).
+        """
+        with self._lock:
+            if self._lock_file is not None or fcntl is None:
+                yield
+                return
+            self.model_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.model_dir / LOCK_NAME, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                self._lock_file = f
+                try:
+                    yield
+                finally:
+                    self._lock_file = None
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"active": None, "versions": []}
+
+    def write_manifest(self, manifest):
+        self.model_dir.mkdir(parents=True, exist_ok=True)
+        # temp file + rename, so other workers never read half a manifest
+        fd, tmp_path = tempfile.mkstemp(dir=self.model_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._manifest_mtime = self.manifest_path.stat().st_mtime_ns
+
+    def versions(self):
+        return self.read_manifest()["versions"]
+
+    def is_known(self, version):
+        """Whether `version` is, or was while this process ran, a registered version.
+
+        The manifest is only read again for a version not seen yet.
+        """
+        if version not in self._known:
+            self._known.update(e["version"] for e in self.versions())
+        return version in self._known
+
+    def find(self, version, manifest=None):
+        manifest = manifest or self.read_manifest()
+        for entry in manifest["versions"]:
+            if entry["version"] == version:
+                return entry
+        raise RegistryError(f"Unknown model version {version}")
+
+    # -------------------------
+    # LISTENERS AND LOADING
+    # -------------------------
+    def add_listener(self, listener):
+        """`listener(model, metadata)` is called whenever a version is swapped in.
+
+        metadata is the artifact's, plus the version and the dataset it was trained on.
+        """
+        self._listeners.append(listener)
+
+    def _load(self, entry):
+        path = self.model_dir / entry["artifact"]
+        if self.mmap:
+            model, metadata = model_store.load_compiled(path)
+        else:
+            model, metadata = model_store.load_artifact(path)
+        return model, {**metadata, "version": entry["version"], "dataset": entry["dataset"]}
+
+    def load(self, version=None, dataset_path=DATASET_PATH):
+        """(model, metadata) of `version`, the active one by default, without swapping it in.
+
+        For offline jobs; an empty registry is bootstrapped first, as on the
+        API's first start.
+        """
+        manifest = self.read_manifest()
+        if version is None and not manifest["active"]:
+            self.startup(dataset_path)
+            manifest = self.read_manifest()
+        return self._load(self.find(version or manifest["active"], manifest))
+
+    def _swap(self, entry):
+        model, metadata = self._load(entry)
+        with self._lock:
+            for listener in self._listeners:
+                listener(model, metadata)
+            self.active_version = entry["version"]
+        logger.info("Model %s (%s) is now active", entry["version"], entry["key"])
+
+    def register(self, info, manifest):
+        """Add a trained artifact to `manifest` as the next version and return its entry."""
+        number = max((int(e["version"][1:]) for e in manifest["versions"]), default=0) + 1
+        entry = {
+            "version": f"v{number}",
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            **info,
+        }
+        manifest["versions"].append(entry)
+        return entry
+
+    def _prune(self, manifest):
+        # oldest versions go first, the active one always stays
+        while len(manifest["versions"]) > self.keep:
+            victim = next(e for e in manifest["versions"] if e["version"] != manifest["active"])
+            manifest["versions"].remove(victim)
+            if all(e["artifact"] != victim["artifact"] for e in manifest["versions"]):
+                model_store.remove_artifact(self.model_dir / victim["artifact"])
+            logger.info("Pruned model version %s", victim["version"])
+
+    # -------------------------
+    # LIFECYCLE
+    # -------------------------
+    def startup(self, dataset_path=DATASET_PATH):
+        """Load the active version, bootstrapping the registry from model_store on first start."""
+        with self._manifest_lock():
+            manifest = self.read_manifest()
+            if manifest["active"]:
+                entry = self.find(manifest["active"], manifest)
+                try:
+                    self._swap(entry)
+                    self._manifest_mtime = self.manifest_path.stat().st_mtime_ns
+                    return
+                except Exception:
+                    logger.exception("Could not load active model %s, rebuilding", manifest["active"])
+
+            if self.mmap:
+                # the dataset and the sklearn model stay in the child process; this
+                # runs while main.py is importing, where spawn would re-import the
+                # __main__ module, and before any thread exists, so fork is safe
+                method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+                with process_executor(method) as executor:
+                    info = executor.submit(train_version, dataset_path, self.model_dir).result()
+            else:
+                model, metadata = model_store.load_or_train(dataset_path, self.model_dir)
+                path = model_store.artifact_path(metadata["key"], self.model_dir)
+                info = version_info(model, metadata, path, dataset_path)
+            entry = next((e for e in manifest["versions"] if e["key"] == info["key"]), None)
+            if entry is None:
+                entry = self.register(info, manifest)
+            manifest["active"] = entry["version"]
+            self._prune(manifest)
+            self.write_manifest(manifest)
+            self._swap(entry)
+
+    def activate(self, version):
+        with self._manifest_lock():
+            manifest = self.read_manifest()
+            entry = self.find(version, manifest)
+            self._swap(entry)
+            manifest["active"] = version
+            self.write_manifest(manifest)
+            return entry
+
+    def rollback(self):
+        """Activate the newest version older than the active one."""
+        with self._manifest_lock():
+            manifest = self.read_manifest()
+            numbers = [int(e["version"][1:]) for e in manifest["versions"]]
+            current = int(manifest["active"][1:]) if manifest["active"] else 0
+            older = [n for n in numbers if n < current]
+            if not older:
+                raise RegistryError("No older model version to roll back to")
+            return self.activate(f"v{max(older)}")
+
+    def poll(self):
+        """Swap in a version activated by another process; cheap when nothing changed."""
+        try:
+            mtime = self.manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._manifest_mtime:
+            return
+        with self._lock:
+            self._manifest_mtime = mtime
+            manifest = self.read_manifest()
+            if manifest["active"] and manifest["active"] != self.active_version:
+                self._swap(self.find(manifest["active"], manifest))
+
+    # -------------------------
+    # RETRAINING
+    # -------------------------
+    def validate(self, info):
+        manifest = self.read_manifest()
+        if manifest["active"]:
+            active = self.find(manifest["active"], manifest)
+            if info["features"] != active["features"]:
+                raise RegistryError(f"Feature columns changed: {info['features']}")
+        if info["accuracy"] < self.min_accuracy:
+            raise RegistryError(
+                f"Holdout accuracy {info['accuracy']:.3f} is below {self.min_accuracy:.3f}"
+            )
+
+    def promote(self, info, activate=True):
+        """Validate a trained artifact, register it and (by default) activate it."""
+        self.validate(info)
+        with self._manifest_lock():
+            manifest = self.read_manifest()
+            entry = self.register(info, manifest)
+            if activate:
+                self._swap(entry)
+                manifest["active"] = entry["version"]
+            self._prune(manifest)
+            self.write_manifest(manifest)
+        return entry
+
+    def retrain(self, dataset_path=DATASET_PATH, activate=True):
+        """Start training in a background process; returns the job description."""
+        dataset_path = Path(dataset_path)
+        if not dataset_path.exists():
+            raise RegistryError(f"Dataset {dataset_path} does not exist")
+
+        with self._lock:
+            if self._job is not None and self._job["status"] == "running":
+                raise RegistryError("A retraining job is already running")
+            job = {"status": "running", "dataset": str(dataset_path), "started_at": time.time()}
+            self._job = job
+
+        executor = process_executor()
+        future = executor.submit(train_version, dataset_path, self.model_dir)
+
+        def finished(future):
+            try:
+                entry = self.promote(future.result(), activate=activate)
+                job.update(status="done", version=entry["version"])
+            except Exception as e:
+                logger.exception("Model retraining failed")
+                job.update(status="failed", error=str(e))
+            finally:
+                job["finished_at"] = time.time()
+                executor.shutdown(wait=False)
+
+        future.add_done_callback(finished)
+        return dict(job)
+
+    def describe(self):
+        manifest = self.read_manifest()
+        job = dict(self._job) if self._job is not None else None
+        return {
+            "active": manifest["active"],
+            "loaded": self.active_version,
+            "versions": manifest["versions"],
+            "last_job": job,
+        }
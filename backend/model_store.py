@@ -0,0 +1,248 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+
+from config import (
+    DATASET_PATH, MODEL_DIR, MODEL_N_ESTIMATORS, MODEL_RANDOM_STATE, MODEL_TEST_SIZE
+)
+from inference import CompiledForest
+
+logger = logging.getLogger(__name__)
+
+TARGET_COLUMN = "Outcome"
+ARTIFACT_PREFIX = "diabetes_rf"
+
+
+# -------------------------
+# FINGERPRINTS
+# -------------------------
+def model_params():
+    """Hyperparameters that (together with the dataset) determine the fitted model."""
+    return {
+        "n_estimators": MODEL_N_ESTIMATORS,
+        "random_state": MODEL_RANDOM_STATE,
+        "test_size": MODEL_TEST_SIZE,
+    }
+
+
+def dataset_hash(path=DATASET_PATH) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact_key(data_hash: str, params: dict) -> str:
+    # sklearn pickles are only safe to load with the version that wrote them
+    config = json.dumps(
+        {"params": params, "sklearn": sklearn.__version__}, sort_keys=True
+    )
+    config_hash = hashlib.sha256(config.encode()).hexdigest()
+    return f"{data_hash[:16]}-{config_hash[:8]}"
+
+
+def artifact_path(key: str, model_dir=MODEL_DIR) -> Path:
+    return Path(model_dir) / f"{ARTIFACT_PREFIX}-{key}.joblib"
+
+
+def compiled_path(path: Path) -> Path:
+    """Directory holding the artifact's forest as memory-mappable .npy files."""
+    return Path(path).with_suffix(".forest")
+
+
+# -------------------------
+# TRAINING
+# -------------------------
+def split_dataset(dataset_path=DATASET_PATH, params=None):
+    """(X_train, X_test, y_train, y_test) exactly as train_model splits them."""
+    params = params or model_params()
+
+    data = pd.read_csv(dataset_path)
+    X = data.drop(TARGET_COLUMN, axis=1)
+    y = data[TARGET_COLUMN]
+
+    return train_test_split(
+        X, y, test_size=params["test_size"], random_state=params["random_state"]
+    )
+
+
+def train_model(dataset_path=DATASET_PATH, params=None):
+    params = params or model_params()
+    X_train, _, y_train, _ = split_dataset(dataset_path, params)
+
+    model = RandomForestClassifier(
+        n_estimators=params["n_estimators"],
+        random_state=params["random_state"]
+    )
+    model.fit(X_train, y_train)
+
+    return model, list(X_train.columns)
+
+
+def holdout_accuracy(model, dataset_path=DATASET_PATH, params=None) -> float:
+    """Accuracy on the rows train_model held out for this dataset and params."""
+    _, X_test, _, y_test = split_dataset(dataset_path, params)
+    return float(model.score(X_test, y_test))
+
+
+def fit_artifact(dataset_path, params, data_hash, key):
+    model, features = train_model(dataset_path, params)
+    metadata = {
+        "key": key,
+        "features": features,
+        "dataset_sha256": data_hash,
+        "params": params,
+        "sklearn_version": sklearn.__version__,
+    }
+    return model, metadata
+
+
+# -------------------------
+# ARTIFACTS
+# -------------------------
+def save_artifact(model, metadata: dict, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # write to a temp file and rename, so concurrent workers never see half a file
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        joblib.dump({"model": model, "metadata": metadata}, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    save_compiled(model, metadata, path)
+
+
+def load_artifact(path: Path):
+    payload = joblib.load(path)
+    return payload["model"], payload["metadata"]
+
+
+def save_compiled(model, metadata: dict, path: Path):
+    """Store the artifact's forest as .npy arrays next to it (see load_compiled)."""
+    target = compiled_path(path)
+    if target.exists():
+        return
+
+    def write(tmp_dir):
+        CompiledForest.from_sklearn(model).save(tmp_dir)
+        with open(os.path.join(tmp_dir, "metadata.json"), "w") as f:
+            json.dump(metadata, f)
+
+    _publish_dir(target, write)
+
+
+def _publish_dir(target: Path, write_fn):
+    """Build a directory with write_fn(tmp_dir) and rename it to target, the same way save_artifact does."""
+    tmp_dir = tempfile.mkdtemp(dir=target.parent, suffix=".tmp")
+    try:
+        write_fn(tmp_dir)
+        os.replace(tmp_dir, target)
+    except OSError:
+        # another worker renamed its copy first
+        if not target.exists():
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def save_cover(model, target: Path):
+    fd, tmp_path = tempfile.mkstemp(dir=target, suffix=".npy")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, CompiledForest.from_sklearn(model).cover)
+        os.replace(tmp_path, target / "cover.npy")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_compiled(path: Path):
+    """(CompiledForest, metadata) for an artifact, with the arrays memory-mapped read-only.
+
+    The pages are backed by the files in models/, so every worker that maps
+    them shares one copy, and the sklearn model is never unpickled.
+    """
+    target = compiled_path(path)
+    if not target.exists():
+        # artifacts written before the arrays were stored alongside them
+        model, metadata = load_artifact(path)
+        save_compiled(model, metadata, path)
+        del model
+    elif not (target / "cover.npy").exists():
+        # stored before explanations needed the node covers
+        model, _ = load_artifact(path)
+        save_cover(model, target)
+        del model
+
+    with open(target / "metadata.json") as f:
+        metadata = json.load(f)
+    return CompiledForest.load(target, mmap_mode="r"), metadata
+
+
+def remove_artifact(path: Path):
+    Path(path).unlink(missing_ok=True)
+    shutil.rmtree(compiled_path(path), ignore_errors=True)
+
+
+def build_artifact(dataset_path=DATASET_PATH, model_dir=MODEL_DIR, force=False):
+    """Train and store the artifact for the current dataset and config.
+
+    Returns (model, metadata, path). An up-to-date artifact is reused unless
+    `force` is set.
+    """
+    params = model_params()
+    data_hash = dataset_hash(dataset_path)
+    key = artifact_key(data_hash, params)
+    path = artifact_path(key, model_dir)
+
+    if path.exists() and not force:
+        model, metadata = load_artifact(path)
+        return model, metadata, path
+
+    model, metadata = fit_artifact(dataset_path, params, data_hash, key)
+    save_artifact(model, metadata, path)
+    return model, metadata, path
+
+
+def load_or_train(dataset_path=DATASET_PATH, model_dir=MODEL_DIR):
+    """Load the artifact matching the dataset hash and config, retraining only on a miss."""
+    params = model_params()
+    data_hash = dataset_hash(dataset_path)
+    key = artifact_key(data_hash, params)
+    path = artifact_path(key, model_dir)
+
+    if path.exists():
+        try:
+            model, metadata = load_artifact(path)
+            if metadata.get("key") == key:
+                return model, metadata
+            logger.warning("Model artifact %s has unexpected key, retraining", path)
+        except Exception:
+            logger.exception("Could not load model artifact %s, retraining", path)
+
+    logger.info("Training model (dataset %s, params %s)", data_hash[:16], params)
+    model, metadata = fit_artifact(dataset_path, params, data_hash, key)
+
+    try:
+        save_artifact(model, metadata, path)
+    except OSError:
+        # a read-only deployment still works, it just retrains on every start
+        logger.exception("Could not save model artifact to %s", path)
+
+    return model, metadata
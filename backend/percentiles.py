@@ -0,0 +1,225 @@
+"""Where a patient's values fall within the reference dataset (diabetes.csv).
+
+The index keeps every feature's reference values sorted, once for the
+whole population, once per age band and (optionally) once per outcome.
+A lookup is a binary search per value, so its cost does not grow with
+the dataset. All those sorted columns live in one array, each shifted
+into its own disjoint range, so a whole batch is looked up in every
+partition with a single pair of vectorized searchsorted calls.
+
+With MODEL_MMAP_ENABLED the index is built when a version is trained and
+stored next to its memory-mapped forest (store()), and workers map those
+arrays read-only (load_stored()) instead of reading the dataset.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import PERCENTILE_AGE_BAND_YEARS, PERCENTILE_BY_OUTCOME, PERCENTILE_MIN_BAND_SIZE
+from model_store import TARGET_COLUMN, _publish_dir, compiled_path
+
+# a zero in these columns of diabetes.csv is a missing measurement, not a value
+ZERO_IS_MISSING = ("Glucose", "BloodPressure", "SkinThickness", "Insulin", "BMI")
+AGE_FEATURE = "Age"
+OUTCOME_LABELS = {0: "without_diabetes", 1: "with_diabetes"}
+# PercentileIndex keyword arguments from the config
+SETTINGS = {
+    "age_band_years": PERCENTILE_AGE_BAND_YEARS,
+    "min_band_size": PERCENTILE_MIN_BAND_SIZE,
+    "by_outcome": PERCENTILE_BY_OUTCOME,
+}
+# the arrays lookups read; everything else is in index.json
+ARRAY_NAMES = ("_keys", "_starts", "_scale")
+
+
+class PercentileIndex:
+    """Percentile ranks of patient values within a reference DataFrame.
+
+    Partition p's column for feature j is stored as
+    (p * n_features + j) * span + (v - origin) in `keys`. span is a power of
+    two larger than the whole value range, so columns never interleave, and
+    queries are clipped to just outside that range, which keeps their rank
+    (0 or 100) unchanged.
+    """
+
+    def __init__(self, data: pd.DataFrame, features, age_band_years=10, min_band_size=30, by_outcome=False):
+        self.features = list(features)
+        self.age_band_years = age_band_years
+        self.min_band_size = min_band_size
+        self.size = len(data)
+        self._age = self.features.index(AGE_FEATURE)
+
+        values = data[self.features].to_numpy(dtype=np.float64)
+        self._origin = min(values.min(), 0.0)
+        # a power of two leaves room for the clipped queries on both sides
+        self._span = 2.0 ** np.ceil(np.log2(values.max() - self._origin + 2))
+
+        partitions = [values]
+        bands = self.age_bands(values[:, self._age])
+        # bands too small to compare against are left out and report null
+        self.bands = {}
+        for band in np.unique(bands):
+            if (bands == band).sum() >= min_band_size:
+                self.bands[int(band)] = len(partitions)
+                partitions.append(values[bands == band])
+        self.outcomes = {}
+        if by_outcome:
+            outcomes = data[TARGET_COLUMN].to_numpy()
+            for outcome in np.unique(outcomes):
+                self.outcomes[OUTCOME_LABELS.get(int(outcome), str(outcome))] = len(partitions)
+                partitions.append(values[outcomes == outcome])
+        self._rows = [len(p) for p in partitions]
+
+        columns = []
+        for partition in partitions:
+            for j, f in enumerate(self.features):
+                column = partition[:, j]
+                if f in ZERO_IS_MISSING:
+                    column = column[column != 0]
+                columns.append(np.sort(column))
+        self._sizes = np.array([len(c) for c in columns])
+        self._starts = np.concatenate([[0], np.cumsum(self._sizes)[:-1]])
+        self._keys = np.concatenate([
+            cell * self._span + (column - self._origin) for cell, column in enumerate(columns)
+        ])
+        # lookups with an empty column (all values missing) give NaN
+        self._scale = np.divide(50.0, self._sizes, out=np.full(len(columns), np.nan), where=self._sizes > 0)
+
+    @classmethod
+    def from_csv(cls, path, features, **kwargs):
+        return cls(pd.read_csv(path), features, **kwargs)
+
+    def save(self, directory):
+        """Write the lookup arrays as .npy files (plus a JSON header) into `directory`."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(directory / f"{name[1:]}.npy", np.ascontiguousarray(getattr(self, name)))
+        with open(directory / "index.json", "w") as f:
+            json.dump({
+                "features": self.features,
+                "age_band_years": self.age_band_years,
+                "min_band_size": self.min_band_size,
+                "size": self.size,
+                "origin": float(self._origin),
+                "span": float(self._span),
+                "bands": {str(band): p for band, p in self.bands.items()},
+                "outcomes": self.outcomes,
+                "rows": self._rows,
+            }, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """Load a saved index; with mmap_mode="r" every worker shares one copy of the arrays."""
+        directory = Path(directory)
+        with open(directory / "index.json") as f:
+            header = json.load(f)
+        index = cls.__new__(cls)
+        index.features = header["features"]
+        index.age_band_years = header["age_band_years"]
+        index.min_band_size = header["min_band_size"]
+        index.size = header["size"]
+        index._age = index.features.index(AGE_FEATURE)
+        index._origin = header["origin"]
+        index._span = header["span"]
+        index.bands = {int(band): p for band, p in header["bands"].items()}
+        index.outcomes = header["outcomes"]
+        index._rows = header["rows"]
+        for name in ARRAY_NAMES:
+            array = np.load(directory / f"{name[1:]}.npy", mmap_mode=mmap_mode)
+            # plain ndarray views: indexing an np.memmap wraps every result
+            setattr(index, name, array.view(np.ndarray) if isinstance(array, np.memmap) else array)
+        return index
+
+    def age_bands(self, ages):
+        return ages // self.age_band_years * self.age_band_years
+
+    def band_label(self, band):
+        return f"{band}-{band + self.age_band_years - 1}"
+
+    def ranks(self, X):
+        """Mid-rank percentiles (0-100, ties count half), shape (n, partitions, features).
+
+        The partitions are overall, the row's age band (NaN when the band is
+        not indexed) and then the outcomes, as listed by `columns`.
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        n, m = X.shape
+        bands = self.age_bands(X[:, self._age])
+
+        partition = np.zeros((n, 2 + len(self.outcomes)), dtype=np.intp)
+        partition[:, 1] = [self.bands.get(band, 0) for band in bands.tolist()]
+        partition[:, 2:] = list(self.outcomes.values())
+        cells = partition[:, :, np.newaxis] * m + np.arange(m)
+
+        queries = np.clip(X - self._origin, -0.5, self._span - 1.5)[:, np.newaxis, :] + cells * self._span
+        found = (
+            np.searchsorted(self._keys, queries, side="left")
+            + np.searchsorted(self._keys, queries, side="right")
+            - 2 * self._starts[cells]
+        )
+        ranks = found * self._scale[cells]
+        ranks[partition[:, 1] == 0, 1] = np.nan
+        return ranks
+
+    @property
+    def columns(self):
+        return ["overall", "age_band", *self.outcomes]
+
+    def lookup(self, X):
+        """Percentiles for every row of a (n, len(features)) array, one dict per row.
+
+        {"age_band": "40-49", "features": {"Glucose": {"overall": 87.1,
+        "age_band": 80.4}, ...}}, plus one entry per outcome when the index
+        is stratified. A missing value (zero in ZERO_IS_MISSING) is null,
+        and so is a band below min_band_size.
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        # rounded and converted to Python floats in one go; NaN becomes None
+        ranks = np.round(self.ranks(X), 1).tolist()
+        names = self.columns
+
+        results = []
+        for row, values, band in zip(X.tolist(), ranks, self.age_bands(X[:, self._age]).astype(int).tolist()):
+            features = {}
+            for j, f in enumerate(self.features):
+                if f in ZERO_IS_MISSING and row[j] == 0:
+                    features[f] = None
+                else:
+                    features[f] = {name: None if v[j] != v[j] else v[j] for name, v in zip(names, values)}
+            results.append({"age_band": self.band_label(band), "features": features})
+        return results
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "age_bands": {self.band_label(band): self._rows[p] for band, p in self.bands.items()},
+            "outcomes": {label: self._rows[p] for label, p in self.outcomes.items()},
+        }
+
+
+# -------------------------
+# STORED WITH THE ARTIFACT
+# -------------------------
+def stored_path(artifact_path, settings=SETTINGS):
+    """Directory of the index stored with an artifact, one per index settings."""
+    name = f"percentiles-{settings['age_band_years']}-{settings['min_band_size']}-{int(settings['by_outcome'])}"
+    return compiled_path(artifact_path) / name
+
+
+def store(dataset_path, features, artifact_path, settings=SETTINGS):
+    """Build the index of `dataset_path` and store it with the artifact, unless it already is."""
+    target = stored_path(artifact_path, settings)
+    if target.exists():
+        return
+    index = PercentileIndex.from_csv(dataset_path, features, **settings)
+
+    _publish_dir(target, index.save)
+
+
+def load_stored(artifact_path, settings=SETTINGS):
+    """The index stored with an artifact, memory-mapped read-only, or None if there is none."""
+    target = stored_path(artifact_path, settings)
+    return PercentileIndex.load(target) if target.exists() else None
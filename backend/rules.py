@@ -0,0 +1,133 @@
+"""Vectorized evaluation of the medical rule table.
+
+The rules themselves live in medical.py (FEATURE_INFO norms and
+DISEASE_RULES); this module evaluates them for a whole (n_patients,
+n_features) array at once and produces the same risk levels and report
+lines as the original per-patient code. Single patients (one /predict
+call) go through a scalar evaluation of the same compiled table, which
+avoids the fixed cost of NumPy calls on one-row arrays.
+"""
+import operator
+
+import numpy as np
+
+# (array version, scalar version)
+OPERATORS = {
+    ">": (np.greater, operator.gt),
+    ">=": (np.greater_equal, operator.ge),
+    "<": (np.less, operator.lt),
+    "<=": (np.less_equal, operator.le),
+}
+RISK_LEVELS = np.array(["small", "medium", "high"], dtype=object)
+SCALAR_RISK_LEVELS = RISK_LEVELS.tolist()
+NORMAL_REPORT = "All parameters are within the norm."
+
+
+class RuleEngine:
+    """Disease risk levels and norm reports for patients laid out in `features` order.
+
+    A disease is "high" when at least `high` of its conditions hold and
+    "medium" when at least `medium` do, otherwise "small".
+    """
+
+    def __init__(self, features, feature_info, disease_rules):
+        self.features = list(features)
+        index = {f: j for j, f in enumerate(self.features)}
+
+        # a report only needs the norms of the features present
+        infos = [feature_info[f] for f in self.features]
+        self.mins = np.array([info["min"] for info in infos], dtype=np.float64)
+        self.maxs = np.array([info["max"] for info in infos], dtype=np.float64)
+        self.low_prefix = np.array([f"{info['name']} IS TOO LOW (" for info in infos], dtype=object)
+        self.high_prefix = np.array([f"{info['name']} IS TOO HIGH (" for info in infos], dtype=object)
+        self.suffix = np.array([f") – NORM: {info['min']}–{info['max']}" for info in infos], dtype=object)
+        self.norms = [
+            (info["min"], info["max"], low, high, suffix)
+            for info, low, high, suffix in zip(
+                infos, self.low_prefix.tolist(), self.high_prefix.tolist(), self.suffix.tolist()
+            )
+        ]
+
+        self.diseases = []
+        self.missing = None
+        for name, rule in disease_rules.items():
+            missing = [f for f, _, _ in rule["conditions"] if f not in index]
+            if missing:
+                self.missing = missing[0]
+                continue
+            conditions = [(index[f], OPERATORS[op], threshold) for f, op, threshold in rule["conditions"]]
+            self.diseases.append((name, conditions, rule["high"], rule["medium"]))
+
+    def risk_levels(self, X):
+        """{disease: array of "small" / "medium" / "high"} for every row of X."""
+        if self.missing is not None:
+            raise KeyError(self.missing)
+        X = np.asarray(X, dtype=np.float64)
+        levels = {}
+        for name, conditions, high, medium in self.diseases:
+            count = np.zeros(len(X), dtype=np.int8)
+            for j, (op, _), threshold in conditions:
+                count += op(X[:, j], threshold)
+            levels[name] = RISK_LEVELS[(count >= medium).astype(np.int8) + (count >= high)]
+        return levels
+
+    def analyze_one(self, values):
+        """analyze_health for one patient given as a list of values in `features` order."""
+        if self.missing is not None:
+            raise KeyError(self.missing)
+        diseases = {}
+        for name, conditions, high, medium in self.diseases:
+            count = 0
+            for j, (_, op), threshold in conditions:
+                if op(values[j], threshold):
+                    count += 1
+            diseases[name] = {"risk_level": SCALAR_RISK_LEVELS[(count >= medium) + (count >= high)]}
+        return diseases
+
+    def report_one(self, values):
+        """generate_medical_report for one patient; values are printed as given (int or float)."""
+        report = []
+        for value, (minimum, maximum, low_prefix, high_prefix, suffix) in zip(values, self.norms):
+            if value < minimum:
+                report.append(f"{low_prefix}{value}{suffix}")
+            elif value > maximum:
+                report.append(f"{high_prefix}{value}{suffix}")
+        return report or [NORMAL_REPORT]
+
+    def analyze(self, X):
+        """analyze_health for every row of X, as a list of dicts."""
+        levels = self.risk_levels(X)
+        names = list(levels)
+        return [
+            {name: {"risk_level": level} for name, level in zip(names, row)}
+            for row in zip(*(values.tolist() for values in levels.values()))
+        ]
+
+    def report(self, X, int_features=()):
+        """generate_medical_report for every row of X.
+
+        Values of `int_features` are printed as integers, the rest as floats,
+        the way they appear in a validated PatientData dict.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        low = X < self.mins
+        flagged = low | (X > self.maxs)
+
+        # row-major order keeps each patient's lines in feature order
+        rows, cols = np.nonzero(flagged)
+        values = X[rows, cols]
+        is_int = np.array([f in int_features for f in self.features], dtype=bool)[cols]
+        # measurements repeat a lot, so each distinct value is formatted once
+        uniques, inverse = np.unique(values, return_inverse=True)
+        texts = np.array([str(v) for v in uniques.tolist()], dtype=object)[inverse]
+        if is_int.any():
+            texts[is_int] = np.array([str(int(v)) for v in uniques.tolist()], dtype=object)[inverse[is_int]]
+        prefixes = np.where(low[rows, cols], self.low_prefix[cols], self.high_prefix[cols])
+        lines = (prefixes + texts + self.suffix[cols]).tolist()
+
+        reports = []
+        start = 0
+        for end in np.cumsum(np.bincount(rows, minlength=len(X))).tolist():
+            reports.append(lines[start:end] if end > start else [NORMAL_REPORT])
+            start = end
+        return reports
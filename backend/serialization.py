@@ -0,0 +1,170 @@
+"""JSON encoding used for API responses and stored results.
+
+Uses orjson when installed, then msgspec, then the standard library.
+JSON_BACKEND can force one of "orjson", "msgspec" or "json".
+
+Stored results were written by the standard library before, so what the
+fast backends can't handle exactly (NaN, integers wider than 64 bits) goes
+through it: responses write NaN as null, stored rows keep it as NaN.
+"""
+import json
+import math
+
+import numpy as np
+from fastapi.responses import JSONResponse, Response
+
+from config import JSON_BACKEND
+
+# 19 digits in a row can only be an integer outside 64 bits (float reprs
+# stop at 17), which orjson would read back as a float; found by mapping
+# digits to "0" and everything else to " ", much faster than a regex
+_DIGITS_TO_ZEROS = bytes(ord("0") if chr(c) in "0123456789" else ord(" ") for c in range(256))
+_LONG_DIGITS = b"0" * 19
+
+
+def _default(obj):
+    # numpy scalars show up in model output (probabilities, counts)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _has_nonfinite(obj):
+    if isinstance(obj, (float, np.floating)):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(_has_nonfinite(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(_has_nonfinite(v) for v in obj)
+    if isinstance(obj, np.ndarray) and obj.dtype.kind in "fc":
+        return not np.isfinite(obj).all()
+    return False
+
+
+def _nonfinite_to_none(obj):
+    if isinstance(obj, (float, np.floating)):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _nonfinite_to_none(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_nonfinite_to_none(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return _nonfinite_to_none(obj.tolist())
+    return obj
+
+
+def _strict_stdlib_dumps(obj) -> bytes:
+    # the same output FastAPI's JSONResponse produces
+    return json.dumps(
+        obj, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default
+    ).encode("utf-8")
+
+
+def _stdlib_dumps(obj) -> bytes:
+    try:
+        return _strict_stdlib_dumps(obj)
+    except ValueError:
+        # NaN and infinities, written as null like the fast encoders do
+        return _strict_stdlib_dumps(_nonfinite_to_none(obj))
+
+
+def _with_stdlib_fallback(encode):
+    """`encode`, falling back to the stdlib for what it can't encode.
+
+    orjson only encodes integers that fit in 64 bits; the stdlib encodes
+    any int, and stored results used to go through it.
+    """
+    def dumps(obj) -> bytes:
+        try:
+            return encode(obj)
+        except (TypeError, OverflowError):
+            return _stdlib_dumps(obj)
+
+    return dumps
+
+
+def _with_stdlib_loads_fallback(decode, errors):
+    """`decode`, falling back to the stdlib for what only it reads back exactly.
+
+    Results stored by the stdlib may hold NaN and Infinity, which the fast
+    decoders reject, and integers wider than 64 bits.
+    """
+    def loads(data):
+        raw = data.encode() if isinstance(data, str) else data
+        if _LONG_DIGITS not in raw.translate(_DIGITS_TO_ZEROS):
+            try:
+                return decode(data)
+            except errors:
+                pass
+        return json.loads(data)
+
+    return loads
+
+
+def _load_backend(name):
+    if name == "orjson":
+        import orjson
+
+        options = orjson.OPT_SERIALIZE_NUMPY
+
+        def dumps(obj) -> bytes:
+            return orjson.dumps(obj, default=_default, option=options)
+
+        return _with_stdlib_fallback(dumps), _with_stdlib_loads_fallback(orjson.loads, orjson.JSONDecodeError)
+
+    if name == "msgspec":
+        import msgspec
+
+        encoder = msgspec.json.Encoder(enc_hook=_default)
+        decoder = msgspec.json.Decoder()
+        return (
+            _with_stdlib_fallback(encoder.encode),
+            _with_stdlib_loads_fallback(decoder.decode, msgspec.DecodeError)
+        )
+
+    if name == "json":
+        return _stdlib_dumps, json.loads
+
+    raise ValueError(f"Unknown JSON backend: {name}")
+
+
+def _select_backend():
+    candidates = ("orjson", "msgspec", "json") if JSON_BACKEND == "auto" else (JSON_BACKEND,)
+    for name in candidates:
+        try:
+            return (name,) + _load_backend(name)
+        except ImportError:
+            continue
+    raise ImportError(f"JSON backend {JSON_BACKEND!r} is not installed")
+
+
+BACKEND, dumps, loads = _select_backend()
+
+
+def _stdlib_text(obj) -> str:
+    # NaN and infinities included, the way stored results were always written
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default)
+
+
+def dumps_str(obj) -> str:
+    """dumps() for TEXT columns, which keep NaN and infinities as the stdlib writes them."""
+    data = dumps(obj)
+    # responses write them as null; only then is obj searched for them
+    if b"null" in data and _has_nonfinite(obj):
+        return _stdlib_text(obj)
+    return data.decode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """Default response class; skips the stdlib encoder."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+class EncodedJSONResponse(Response):
+    """Response for bodies that are already encoded JSON bytes."""
+
+    media_type = "application/json"
@@ -0,0 +1,168 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import BATCH_SIZE_BUCKETS, QUEUE_WAIT_BUCKETS_MS, BucketHistogram
+
+logger = logging.getLogger(__name__)
+
+# attempts per batch before its items are failed
+FLUSH_ATTEMPTS = 3
+
+
+class QueueFull(Exception):
+    pass
+
+
+class WriteBehindQueue:
+    """Buffers writes and applies them in batched transactions (group commit).
+
+    `flush_fn(items)` must write a list of items in a single transaction.
+    A batch that still fails after FLUSH_ATTEMPTS is written again one item
+    at a time, so only the items that cannot be written fail.
+    A batch is flushed once `max_batch_size` items are waiting or
+    `max_wait_ms` after its first item arrived, so concurrent saves share
+    one commit (and one fsync) instead of paying for one each.
+
+    submit() never blocks: when `max_queue_size` items are pending it raises
+    QueueFull, and the caller should shed load. It returns a Future resolved
+    once the item's batch has committed; callers that acknowledge on enqueue
+    simply don't wait for it. stop() flushes everything still queued; later
+    submits raise QueueFull.
+    """
+
+    def __init__(self, flush_fn, max_queue_size=10000, max_batch_size=256, max_wait_ms=50.0):
+        self.flush_fn = flush_fn
+        self.max_queue_size = max_queue_size
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue(max_queue_size)
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.enqueued = 0
+        self.committed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.split_batches = 0
+        self.batch_sizes = BucketHistogram(BATCH_SIZE_BUCKETS)
+        self.commit_wait_ms = BucketHistogram(QUEUE_WAIT_BUCKETS_MS)
+
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop accepting work and flush whatever is still queued."""
+        # under the lock: once it is set, no submit() can enqueue any more
+        with self._lock:
+            self._stopping.set()
+        if self._thread is None:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, item) -> Future:
+        done = Future()
+        with self._lock:
+            if self._stopping.is_set():
+                self.rejected += 1
+                raise QueueFull("Write queue is shutting down")
+            try:
+                self._queue.put_nowait((item, done, time.perf_counter()))
+            except queue.Full:
+                self.rejected += 1
+                raise QueueFull(f"Write queue full ({self.max_queue_size} pending)")
+            self.enqueued += 1
+        return done
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # on shutdown, take what is there without waiting for the window
+            remaining = 0 if self._stopping.is_set() else deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+            elif self._stopping.is_set() and self._queue.empty():
+                # a submit may have landed after the empty get but before stop()
+                return
+
+    def _write(self, items, attempts=FLUSH_ATTEMPTS):
+        """flush_fn(items), retried; returns the last error, or None once it succeeds."""
+        error = None
+        for attempt in range(1, attempts + 1):
+            try:
+                self.flush_fn(items)
+                return None
+            except Exception as e:
+                error = e
+                logger.exception("Write-behind flush of %d items failed (attempt %d)", len(items), attempt)
+                if attempt < attempts:
+                    time.sleep(0.05 * attempt)
+        return error
+
+    def _flush(self, batch):
+        items = [item for item, _, _ in batch]
+        error = self._write(items)
+        if error is None:
+            errors = [None] * len(batch)
+        elif len(batch) == 1:
+            errors = [error]
+        else:
+            # one bad item must not fail the rest of its batch: write them one at a time
+            with self._lock:
+                self.split_batches += 1
+            errors = [self._write([item], attempts=1) for item in items]
+
+        now = time.perf_counter()
+        failed = sum(error is not None for error in errors)
+        with self._lock:
+            self.committed += len(batch) - failed
+            self.failed += failed
+        self.batch_sizes.observe(len(batch))
+        for (_, done, enqueued_at), error in zip(batch, errors):
+            self.commit_wait_ms.observe((now - enqueued_at) * 1000)
+            if error is None:
+                done.set_result(None)
+            else:
+                done.set_exception(error)
+
+    def stats(self):
+        with self._lock:
+            counters = {
+                "enqueued": self.enqueued,
+                "committed": self.committed,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "split_batches": self.split_batches,
+            }
+        return {
+            "enabled": self._thread is not None,
+            "queue_depth": self._queue.qsize(),
+            "max_queue_size": self.max_queue_size,
+            **counters,
+            "batch_size": self.batch_sizes.snapshot(),
+            "commit_wait_ms": self.commit_wait_ms.snapshot(),
+        }
@@ -22,6 +22,7 @@ interface Advice {
 interface Result {
   result: any;
   created_at: string;
+  model_version?: string | null;
   ui_advice?: Record<string, Advice>[];
   disclaimer?: string;
 }
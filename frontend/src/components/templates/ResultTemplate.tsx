@@ -24,6 +24,7 @@ interface PredictResponse {
   diseases_detected: Record<string, { risk_level: string }>;
   raport: string[];
   ui_advice: UiAdvice[];
+  model_version: string | null;
 }
 
 interface Props {
@@ -93,6 +94,7 @@ const ResultTemplate = ({ values }: Props) => {
           diabetes: result.diabetes,
           diseases_detected: result.diseases_detected,
           raport: result.raport,
+          model_version: result.model_version,
         }),
       });
 